@@ -0,0 +1,75 @@
+#!python3
+"""
+Measures how long ReleaseInfoCreator.py takes to import, using Python's -X importtime, and checks that the heavy
+third-party modules (which are only needed once a release is processed) are not imported at startup.
+Exits with status 1 if startup is slower than --max-ms or imports a heavy module, so regressions can be caught.
+
+    py bench_import_time.py [--module ReleaseInfoCreator] [--runs 5] [--top 15] [--max-ms 0]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+# modules that should only be imported by the stage that needs them
+HEAVY_MODULES = ('PIL', 'numpy', 'requests', 'guessit', 'pyperclip')
+# eg. "import time:       215 |      18224 |   ScreenshotGenerator"
+IMPORTTIME_RE = re.compile(r'^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \| +(?P<module>\S+)$')
+
+
+def time_imports(module: str) -> dict:
+    """
+    :param module (str): module to import, from the scripts folder; '' for none
+    :return dict<str, tuple<int, int>>: each imported module -> its own and cumulative import time (microseconds)
+    """
+    code = f'import {module}' if module else 'pass'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=SCRIPTS_DIR, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    imports = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match is not None:
+            imports[match.group('module')] = (int(match.group('self')), int(match.group('cumulative')))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='ReleaseInfoCreator')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--max-ms', type=float, default=0, help='fail if the median import time is above this')
+    args = parser.parse_args()
+
+    # the first run also writes the .pyc files, so it is not counted
+    time_imports(args.module)
+    # modules the interpreter imports by itself (site, .pth files) are not the script's doing
+    startup_modules = set(time_imports(''))
+    runs = [time_imports(args.module) for _ in range(args.runs)]
+    totals = [imports[args.module][1] / 1000 for imports in runs]
+    print(f'import {args.module}: median {statistics.median(totals):.1f}ms   '
+          f'min {min(totals):.1f}ms   max {max(totals):.1f}ms   ({args.runs} runs)')
+
+    print('\nslowest modules (cumulative ms, median):')
+    cumulative = {module: statistics.median(imports[module][1] / 1000 for imports in runs if module in imports)
+                  for module in runs[0] if module not in startup_modules and module != args.module}
+    for module, ms in sorted(cumulative.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'{ms:10.1f}  {module}')
+
+    heavy_imports = sorted({module.split('.')[0] for module in runs[0]} & set(HEAVY_MODULES))
+    failed = False
+    if heavy_imports:
+        print(f'\nheavy modules imported at startup: {", ".join(heavy_imports)}')
+        failed = True
+    if args.max_ms and statistics.median(totals) > args.max_ms:
+        print(f'\nstartup is slower than {args.max_ms}ms')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
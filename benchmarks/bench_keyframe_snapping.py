@@ -0,0 +1,89 @@
+#!python3
+"""
+Compares the decode work of taking screenshots at evenly spaced timestamps against the same screenshots with
+`snap_to_keyframes` on. Reports the frames that must be decoded per screenshot (from the keyframe index: everything
+from the preceding keyframe up to the timestamp), and the wall time of generating the screenshots (without cache).
+
+    py bench_keyframe_snapping.py "video_file.mkv" [--n 6] [--repeat 3] [--ffmpeg-bin PATH] [--mediainfo-bin PATH]
+"""
+
+import argparse
+import bisect
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import KeyframeIndex
+from Cache import Cache
+from MediaProbe import MediaProbe
+from ReleaseInfo import ReleaseInfo
+from ScreenshotGenerator import ScreenshotGenerator
+from Settings import Settings
+
+
+def frames_to_decode(keyframes: list, timestamp: float, frame_rate: float) -> int:
+    """
+    :return int: frames decoded to reach a timestamp after seeking to the keyframe before it
+    """
+    i = bisect.bisect_right(keyframes, timestamp + 1e-6) - 1
+    previous_keyframe = keyframes[i] if i >= 0 else 0.0
+    return int(round((timestamp - previous_keyframe) * frame_rate)) + 1
+
+
+def time_generation(rls: ReleaseInfo, n_images: int, snap_to_keyframes: bool) -> tuple:
+    """
+    :param rls (ReleaseInfo): the release
+    :param n_images (int): number of screenshots
+    :param snap_to_keyframes (bool): value of the `snap_to_keyframes` setting
+    :return tuple<float, list<float>>: wall seconds to generate the screenshots, and the timestamps they were taken at
+    """
+    Settings.advanced['snap_to_keyframes'] = snap_to_keyframes
+    generator = ScreenshotGenerator(n_images=n_images)
+    start = time.perf_counter()
+    images = generator.generate_screenshots(rls)
+    elapsed = time.perf_counter() - start
+    return elapsed, [generator.image_timestamps[image][1] for image in images]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video_file')
+    parser.add_argument('--n', type=int, default=6, help='number of screenshots')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--ffmpeg-bin', default='ffmpeg')
+    parser.add_argument('--mediainfo-bin', default='mediainfo')
+    args = parser.parse_args()
+
+    Cache.disable()
+    Settings.paths['ffmpeg_bin_path'] = args.ffmpeg_bin
+    Settings.paths['mediainfo_bin_path'] = args.mediainfo_bin
+    Settings.use_png_optimise = False
+    Settings.advanced['scene_prepass'] = False
+    Settings.advanced['in_memory_images'] = False
+
+    rls = ReleaseInfo(os.path.abspath(args.video_file))
+    rls.find_relevant_files()
+    video_file = rls.main_video_files[0]
+
+    start = time.perf_counter()
+    keyframes = KeyframeIndex.get_keyframes(video_file)
+    print(f'read {len(keyframes)} keyframes from the index in {time.perf_counter() - start:.3f}s')
+    if not keyframes:
+        print('no keyframe index; nothing to compare')
+        return
+
+    frame_rate = float(MediaProbe.get(video_file).get_track('Video').get('FrameRate') or 24)
+    with tempfile.TemporaryDirectory() as output_dir:
+        Settings.paths['image_save_location'] = output_dir
+        for name, snap_to_keyframes in (('even', False), ('snapped', True)):
+            runs = [time_generation(rls, args.n, snap_to_keyframes) for _ in range(args.repeat)]
+            decoded = [frames_to_decode(keyframes, timestamp, frame_rate) for timestamp in runs[0][1]]
+            print(f'{name:>8}: {sum(decoded) / len(decoded):7.1f} frames decoded per screenshot (max {max(decoded)})'
+                  f'   best wall {min(elapsed for elapsed, _ in runs):7.2f}s')
+
+
+if __name__ == '__main__':
+    main()
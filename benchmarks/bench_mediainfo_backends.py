@@ -0,0 +1,78 @@
+#!python3
+"""
+Compares the mediainfo CLI against in-process libmediainfo across every file in a folder.
+Each backend produces the JSON tree and the text report for each file, which is what one release run needs.
+Each backend is timed in a fresh process, as the library is loaded once per process.
+
+    py bench_mediainfo_backends.py "folder" [--mediainfo-bin PATH] [--library PATH]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from Cache import Cache
+from MediaInfoLibrary import MediaInfoLibrary
+from MediaProbe import MediaProbe
+from Settings import Settings
+
+
+def time_backend(files: list) -> list:
+    """
+    :param files (list<str>): files to probe, with the backend set by the `mediainfo_backend` setting
+    :return list<float>: seconds spent on each file
+    """
+    timings = []
+    for file in files:
+        start = time.perf_counter()
+        probe = MediaProbe.get(file)
+        probe.json
+        probe.text
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folder')
+    parser.add_argument('--mediainfo-bin', default='mediainfo')
+    parser.add_argument('--library', default='')
+    # times one backend in this process, printing the timings as the last line of output
+    parser.add_argument('--run', choices=('cli', 'library'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    files = sorted(os.path.join(root, f) for root, _, names in os.walk(args.folder) for f in names)
+
+    if args.run:
+        Cache.disable()
+        Settings.paths['mediainfo_bin_path'] = args.mediainfo_bin
+        Settings.advanced['mediainfo_library_path'] = args.library
+        Settings.advanced['mediainfo_backend'] = args.run
+        if args.run == 'library' and not MediaInfoLibrary.is_available():
+            print(json.dumps(None))
+            return
+        print(json.dumps(time_backend(files)))
+        return
+
+    print(f'{len(files)} files')
+    results = {}
+    for backend in ('cli', 'library'):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], '--run', backend],
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+        results[backend] = json.loads(output.splitlines()[-1])
+    if results['library'] is None:
+        print('libmediainfo not found; only the CLI was measured')
+        del results['library']
+
+    for backend, timings in results.items():
+        print(f'{backend:>8}: total {sum(timings):8.3f}s   '
+              f'mean {1000 * sum(timings) / max(len(timings), 1):8.1f}ms   max {1000 * max(timings, default=0):8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!python3
+"""
+Compares taking the screenshots of a video file with one ffmpeg process per screenshot ('fanout') against one ffmpeg
+process per group of nearby screenshots, each decoded in a single pass ('single'). Each run is a normal screenshot
+generation (without cache) in a fresh process. Reports how far apart the planned screenshots are (only those at
+most SINGLE_PASS_MAX_GAP apart share a pass), the wall time and peak resident memory of the ffmpeg processes (summed
+while they run at once; sampled from /proc, so Linux only), and checks both modes produce the same frames.
+
+    py bench_screenshot_extraction.py "video_file.mkv" [--n 6] [--repeat 3] [--ffmpeg-bin PATH] [--mediainfo-bin PATH]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import Helper
+from Cache import Cache
+from ReleaseInfo import ReleaseInfo
+from ScreenshotGenerator import ScreenshotGenerator
+from Settings import Settings
+
+# seconds between samples of the ffmpeg processes' memory
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+def get_children_rss() -> int:
+    """
+    :return int: summed resident memory in KiB of this process's child processes
+    """
+    total_rss = 0
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                status = dict(line.split(':', 1) for line in f if ':' in line)
+        except OSError:
+            continue
+        if int(status['PPid']) == os.getpid() and 'VmRSS' in status:
+            total_rss += int(status['VmRSS'].split()[0])
+    return total_rss
+
+
+def run_mode(args: argparse.Namespace) -> dict:
+    """
+    Generates the screenshots once, in this process, with the given extraction mode
+    :param args (argparse.Namespace): parsed command line arguments
+    :return dict: 'wall' seconds, 'peak_rss' in KiB, 'hashes', the sha256 of each screenshot, and 'timestamps',
+            the video file and timestamp of each screenshot
+    """
+    Settings.advanced['screenshot_extraction'] = args.run
+    rls = ReleaseInfo(os.path.abspath(args.video_file))
+    rls.find_relevant_files()
+    # mediainfo is gathered before timing, as it is shared with the rest of a run
+    rls.get_complete_mediainfo()
+
+    peak_rss = 0
+    done = threading.Event()
+
+    def sample_rss():
+        nonlocal peak_rss
+        while not done.wait(RSS_SAMPLE_INTERVAL):
+            peak_rss = max(peak_rss, get_children_rss())
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    generator = ScreenshotGenerator(n_images=args.n)
+    images = generator.generate_screenshots(rls)
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+
+    return {'wall': elapsed, 'peak_rss': peak_rss,
+            'hashes': [hashlib.sha256(Helper.read_image(image)).hexdigest() for image in images],
+            'timestamps': [generator.image_timestamps[image] for image in images]}
+
+
+def get_gaps(timestamps: list) -> list:
+    """
+    :param timestamps (list<list<str, float>>): video file and timestamp of each screenshot
+    :return list<float>: seconds between each screenshot and the previous one of the same file
+    """
+    gaps = []
+    for video_file in {video_file for video_file, _ in timestamps}:
+        file_timestamps = sorted(timestamp for file, timestamp in timestamps if file == video_file)
+        gaps += [b - a for a, b in zip(file_timestamps, file_timestamps[1:])]
+    return gaps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video_file')
+    parser.add_argument('--n', type=int, default=6, help='number of screenshots')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--ffmpeg-bin', default='ffmpeg')
+    parser.add_argument('--mediainfo-bin', default='mediainfo')
+    # runs one mode in this process, printing its result as the last line of output
+    parser.add_argument('--run', choices=('fanout', 'single'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        Cache.disable()
+        Settings.paths['ffmpeg_bin_path'] = args.ffmpeg_bin
+        Settings.paths['mediainfo_bin_path'] = args.mediainfo_bin
+        Settings.use_png_optimise = False
+        Settings.advanced['in_memory_images'] = False
+        with tempfile.TemporaryDirectory() as output_dir:
+            Settings.paths['image_save_location'] = output_dir
+            print(json.dumps(run_mode(args)))
+        return
+
+    results = {}
+    for mode in ('fanout', 'single'):
+        runs = []
+        for _ in range(args.repeat):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], '--run', mode],
+                                    stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+            runs.append(json.loads(output.splitlines()[-1]))
+        results[mode] = runs
+        print(f'{mode:>7}: best wall {min(run["wall"] for run in runs):7.2f}s   '
+              f'peak RSS {max(run["peak_rss"] for run in runs) / 1024:8.1f} MiB')
+
+    gaps = get_gaps(results['single'][0]['timestamps'])
+    if gaps:
+        n_nearby = sum(gap <= ScreenshotGenerator.SINGLE_PASS_MAX_GAP for gap in gaps)
+        print(f'screenshots {min(gaps):.1f}s to {max(gaps):.1f}s apart; {n_nearby} of {len(gaps)} within '
+              f'{ScreenshotGenerator.SINGLE_PASS_MAX_GAP}s of the previous one, so taken in the same pass')
+    identical = results['fanout'][0]['hashes'] == results['single'][0]['hashes']
+    print('frames identical' if identical else 'WARNING: frames differ between modes')
+
+
+if __name__ == '__main__':
+    main()
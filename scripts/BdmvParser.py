@@ -0,0 +1,139 @@
+import os
+import struct
+
+# MPLS and CLPI times are counted in ticks of a 45 kHz clock
+BD_CLOCK_RATE = 45000
+MPLS_TYPE_INDICATOR = b'MPLS'
+CLPI_TYPE_INDICATOR = b'HDMV'
+
+
+class BdmvParseError(ValueError):
+    pass
+
+
+class BdmvParser:
+    """
+    Reads a Blu-ray's playlist (MPLS) and clip information (CLPI) files directly, without probing any stream files.
+    Used to find the main playlist of a disc, and exactly which clips (and which part of each) it plays
+    """
+
+    def __init__(self, playlist_names: list, read_file):
+        """
+        :param playlist_names (list<str>): names of the files in BDMV/PLAYLIST
+        :param read_file (callable): takes a path relative to BDMV (eg. 'PLAYLIST/00800.mpls'),
+                returns that file's content (bytes)
+        """
+        self.playlist_names = playlist_names
+        self.read_file = read_file
+
+    @classmethod
+    def from_folder(cls, bdmv_folder_path: str) -> 'BdmvParser':
+        """
+        :param bdmv_folder_path (str): path of the BDMV folder
+        :return BdmvParser:
+        """
+        playlist_names = [entry.name for entry in os.scandir(os.path.join(bdmv_folder_path, 'PLAYLIST'))
+                          if entry.is_file() and entry.name.lower().endswith('.mpls')]
+
+        def read_file(path):
+            with open(os.path.join(bdmv_folder_path, *path.split('/')), 'rb') as f:
+                return f.read()
+
+        return cls(playlist_names, read_file)
+
+    def get_main_playlist(self) -> dict:
+        """
+        Finds the main playlist: the longest one, ignoring playlists that play the same clip more than once
+        (used by some discs to hide the real main playlist) unless there are no others
+        :return dict: 'playlist_name': name of the MPLS file, 'duration': playlist runtime in seconds,
+                'clips': the play items in playback order, each with 'clip_name' (eg. '00055'),
+                'start' (timestamp within the clip's stream file at which the item starts, in seconds)
+                and 'duration' (seconds)
+        """
+        playlists = []
+        for playlist_name in self.playlist_names:
+            try:
+                play_items = self._read_play_items(playlist_name)
+            except (BdmvParseError, struct.error, OSError):
+                continue
+            if play_items:
+                playlists.append((playlist_name, play_items))
+        if not playlists:
+            raise BdmvParseError('No readable playlists found')
+
+        def playlist_rank(playlist):
+            clip_names = [item['clip_name'] for item in playlist[1]]
+            return len(set(clip_names)) == len(clip_names), sum(item['duration'] for item in playlist[1])
+
+        playlist_name, play_items = max(playlists, key=playlist_rank)
+
+        clip_start_times = {}
+        for item in play_items:
+            clip_key = (item['clip_name'], item['stc_id'])
+            if clip_key not in clip_start_times:
+                clip_start_times[clip_key] = self._get_clip_start_time(*clip_key)
+
+        clips = [{'clip_name': item['clip_name'],
+                  'start': max(0.0, (item['in_time'] - clip_start_times[(item['clip_name'], item['stc_id'])])
+                               / BD_CLOCK_RATE),
+                  'duration': item['duration']}
+                 for item in play_items]
+        return {'playlist_name': playlist_name, 'duration': sum(clip['duration'] for clip in clips), 'clips': clips}
+
+    def _read_play_items(self, playlist_name: str) -> list:
+        """
+        :param playlist_name (str): name of the MPLS file
+        :return list<dict>: 'clip_name', 'stc_id', 'in_time' (45 kHz ticks) and 'duration' (seconds)
+                of each play item; for multi-angle items, only the first angle
+        """
+        mpls = self.read_file(f'PLAYLIST/{playlist_name}')
+        if mpls[:4] != MPLS_TYPE_INDICATOR:
+            raise BdmvParseError(f'{playlist_name} is not an MPLS file')
+
+        playlist = self._u32(mpls, 8)
+        n_play_items = self._u16(mpls, playlist + 6)
+        play_items = []
+        offset = playlist + 10
+        for _ in range(n_play_items):
+            item_length = self._u16(mpls, offset)
+            in_time, out_time = struct.unpack_from('>II', mpls, offset + 14)
+            play_items.append({
+                'clip_name': mpls[offset + 2:offset + 7].decode('ascii'),
+                'stc_id': mpls[offset + 13],
+                'in_time': in_time,
+                'duration': (out_time - in_time) / BD_CLOCK_RATE,
+            })
+            offset += 2 + item_length
+        return play_items
+
+    def _get_clip_start_time(self, clip_name: str, stc_id: int) -> int:
+        """
+        :param clip_name (str): name of the clip, eg. '00055'
+        :param stc_id (int): STC sequence of the clip that the play item refers to
+        :return int: presentation start time (45 kHz ticks) of the STC sequence, from the clip's CLPI file;
+                play item times minus this give timestamps within the clip's stream file.
+                0 if the CLPI file cannot be read
+        """
+        try:
+            clpi = self.read_file(f'CLIPINF/{clip_name}.clpi')
+        except OSError:
+            return 0
+        if clpi[:4] != CLPI_TYPE_INDICATOR:
+            return 0
+
+        sequence_info = self._u32(clpi, 8)
+        # first ATC sequence: SPN_ATC_start, number_of_STC_sequences, offset_STC_id, then the STC sequences
+        n_stc_sequences = clpi[sequence_info + 10]
+        stc_index = stc_id - clpi[sequence_info + 11]
+        if not 0 <= stc_index < n_stc_sequences:
+            stc_index = 0
+        # each STC sequence: PCR_PID, SPN_STC_start, presentation_start_time, presentation_end_time
+        return self._u32(clpi, sequence_info + 12 + stc_index * 14 + 6)
+
+    @staticmethod
+    def _u16(data: bytes, offset: int) -> int:
+        return struct.unpack_from('>H', data, offset)[0]
+
+    @staticmethod
+    def _u32(data: bytes, offset: int) -> int:
+        return struct.unpack_from('>I', data, offset)[0]
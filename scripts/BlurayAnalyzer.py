@@ -0,0 +1,104 @@
+import os
+import Helper
+from BdmvParser import BdmvParser, BdmvParseError
+from Cache import Cache
+
+STREAM_EXTS = ('.m2ts', '.M2TS', '.mts', '.MTS')
+
+
+class BlurayAnalyzer:
+    def __init__(self, bdmv_folder_path):
+        """
+        :param bdmv_folder_path (str): path of the BDMV folder
+        """
+        self.bdmv_folder_path = bdmv_folder_path
+        self.stream_folder_path = os.path.join(bdmv_folder_path, 'STREAM')
+        self._main_playlist = None
+        self._stream_files = None
+
+    def get_main_playlist_info(self) -> dict:
+        """
+        :return dict: Contains the path of the main playlist (MPLS) file (None if the playlists could not be read),
+                the path of its main clip (the longest of its stream files) and the playlist's duration in seconds
+        """
+        main_playlist = self._get_main_playlist()
+        clip_files = self.get_main_clip_files()
+        if not main_playlist:
+            return {'path': None, 'main_clip': clip_files[0]}
+
+        clip_durations = self.get_main_clip_durations()
+        return {
+            'path': os.path.join(self.bdmv_folder_path, 'PLAYLIST', main_playlist['playlist_name']),
+            'main_clip': max(clip_files, key=lambda f: clip_durations[f]),
+            'duration': main_playlist['duration'],
+        }
+
+    def get_main_clip_files(self) -> list:
+        """
+        Get the stream files of the main playlist, in playback order; or if the playlists can't be read,
+        the largest stream file
+        :return list<str>: File paths of the stream (.m2ts) files
+        """
+        main_playlist = self._get_main_playlist()
+        if main_playlist:
+            return [self._get_stream_file(clip['clip_name']) for clip in main_playlist['clips']]
+
+        stream_files = list(self._get_stream_files().values())
+        assert len(stream_files) > 0, 'No stream files found in BDMV/STREAM'
+        return [Helper.get_largest_file(stream_files)]
+
+    def get_main_clip_durations(self) -> dict:
+        """
+        Runtime of the main playlist within each of its stream files, from the playlist's play items
+        :return dict<str, float>: stream file path -> seconds; empty if the playlists could not be read
+        """
+        main_playlist = self._get_main_playlist()
+        if not main_playlist:
+            return {}
+        return {self._get_stream_file(clip['clip_name']): clip['duration'] for clip in main_playlist['clips']}
+
+    def get_main_clip_start_times(self) -> dict:
+        """
+        Where the main playlist starts playing each of its stream files, from the play items and the clips' CLPI files
+        :return dict<str, float>: stream file path -> timestamp in seconds within the file
+        """
+        main_playlist = self._get_main_playlist()
+        if not main_playlist:
+            return {}
+        return {self._get_stream_file(clip['clip_name']): clip['start'] for clip in main_playlist['clips']}
+
+    def _get_main_playlist(self) -> dict:
+        """
+        Reads the main playlist of the disc from the MPLS and CLPI files
+        :return dict: see BdmvParser.get_main_playlist(); empty if the playlists could not be read
+        """
+        if self._main_playlist is not None:
+            return self._main_playlist
+
+        self._main_playlist = Cache.get_json('bluray_main_playlist', self.bdmv_folder_path)
+        if self._main_playlist is None:
+            try:
+                self._main_playlist = BdmvParser.from_folder(self.bdmv_folder_path).get_main_playlist()
+            except (BdmvParseError, OSError) as e:
+                print(f'Could not read Blu-ray playlists ({e}); using the largest stream file')
+                self._main_playlist = {}
+
+            stream_files = self._get_stream_files()
+            if any(clip['clip_name'].upper() not in stream_files for clip in self._main_playlist.get('clips', [])):
+                self._main_playlist = {}
+            Cache.put_json('bluray_main_playlist', self.bdmv_folder_path, self._main_playlist)
+
+        return self._main_playlist
+
+    def _get_stream_file(self, clip_name: str) -> str:
+        return self._get_stream_files()[clip_name.upper()]
+
+    def _get_stream_files(self) -> dict:
+        """
+        :return dict<str, str>: upper-cased clip name (eg. '00055') -> path of its stream file
+        """
+        if self._stream_files is None:
+            self._stream_files = {os.path.splitext(entry.name)[0].upper(): entry.path
+                                  for entry in os.scandir(self.stream_folder_path)
+                                  if entry.is_file() and entry.name.endswith(STREAM_EXTS)}
+        return self._stream_files
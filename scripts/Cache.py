@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from IsoImage import IsoImage
+from Settings import Settings
+
+# number of bytes read from the start, middle and end of a file for its partial content hash
+FINGERPRINT_CHUNK_SIZE = 64 * 1024
+
+
+class Cache:
+    """
+    On-disk cache of probe results and generated artifacts, shared between runs. Entries derived from a media
+    file are keyed by that file's fingerprint (path, size, mtime and a partial content hash), so they are
+    invalidated as soon as the file changes. The least recently used entries are evicted once the cache grows
+    past `cache_max_size_mb`
+    """
+    cache_file_name = 'ReleaseInfoCreator.cache.sqlite'
+    cache_file_path = os.path.join(os.path.dirname(Settings.settings_file_path), cache_file_name)
+
+    enabled = True
+    _connection = None
+    _lock = threading.RLock()
+    _fingerprints = {}
+
+    @classmethod
+    def disable(cls):
+        """
+        Turn the cache off for this run (--no-cache); lookups then always miss and nothing is stored
+        :return:
+        """
+        cls.enabled = False
+
+    @classmethod
+    def fingerprint(cls, path: str) -> str:
+        """
+        Identifies the current contents of a file or folder. Files are identified by path, size, mtime and a hash
+        of three small chunks of their content; folders by the relative paths, sizes and mtimes of all the files
+        anywhere within them; files and folders inside a disc image by the image's fingerprint
+        :param path (str): file or folder path
+        :return str:
+        """
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            iso_path = IsoImage.split_path(path)
+            if iso_path is None:
+                raise
+            # files inside a disc image only change along with the image
+            return hashlib.blake2b(f'{cls.fingerprint(iso_path[0])}|{iso_path[1]}'.encode(), digest_size=16).hexdigest()
+        memo_key = (path, stat.st_size, stat.st_mtime_ns)
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(repr(memo_key).encode())
+        if os.path.isdir(path):
+            # not memoised, as a folder's own mtime does not change when a file in a subfolder is rewritten
+            for relative_path, entry_stat in cls._walk_files(path):
+                hasher.update(f'{relative_path}|{entry_stat.st_size}|{entry_stat.st_mtime_ns}'.encode())
+            return hasher.hexdigest()
+
+        if memo_key in cls._fingerprints:
+            return cls._fingerprints[memo_key]
+        with open(path, 'rb') as f:
+            for offset in (0, stat.st_size // 2, stat.st_size - FINGERPRINT_CHUNK_SIZE):
+                f.seek(max(offset, 0))
+                hasher.update(f.read(FINGERPRINT_CHUNK_SIZE))
+
+        cls._fingerprints[memo_key] = hasher.hexdigest()
+        return cls._fingerprints[memo_key]
+
+    @classmethod
+    def _walk_files(cls, folder: str, prefix: str = ''):
+        """
+        :param folder (str): folder path
+        :param prefix (str): path of the folder relative to the one being fingerprinted
+        :return generator<tuple<str, os.stat_result>>: relative path and stat of every file within the folder
+                and its subfolders, in a stable order
+        """
+        for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+            try:
+                if entry.is_dir():
+                    yield from cls._walk_files(entry.path, prefix + entry.name + '/')
+                else:
+                    yield prefix + entry.name, entry.stat()
+            except FileNotFoundError:
+                # removed while the folder was being read
+                continue
+
+    @classmethod
+    def get_json(cls, kind: str, path: str, extra: str = ''):
+        """
+        Looks up a JSON value derived from a file
+        :param kind (str): type of the cached value, eg. 'mediainfo_json'
+        :param path (str): file or folder the value was derived from
+        :param extra (str): any further parameters the value depends on
+        :return: the cached value, or None on a cache miss
+        """
+        if not cls.enabled:
+            return None
+        data = cls.get_blob(cls._make_key(kind, path, extra))
+        return None if data is None else json.loads(data.decode())
+
+    @classmethod
+    def put_json(cls, kind: str, path: str, value, extra: str = ''):
+        """
+        Stores a JSON-serializable value derived from a file
+        :param kind (str): type of the cached value, eg. 'mediainfo_json'
+        :param path (str): file or folder the value was derived from
+        :param value: the value to store
+        :param extra (str): any further parameters the value depends on
+        :return:
+        """
+        if not cls.enabled:
+            return
+        cls.put_blob(cls._make_key(kind, path, extra), json.dumps(value).encode())
+
+    @classmethod
+    def get_blob(cls, key: str):
+        """
+        :param key (str): entry key
+        :return bytes: the stored data, or None on a cache miss
+        """
+        connection = cls._connect()
+        if connection is None:
+            return None
+
+        with cls._lock:
+            row = connection.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+            connection.commit()
+        return bytes(row[0])
+
+    @classmethod
+    def put_blob(cls, key: str, data: bytes):
+        """
+        Stores raw data under a key, then evicts least recently used entries if the cache is over its size limit
+        :param key (str): entry key
+        :param data (bytes): data to store
+        :return:
+        """
+        connection = cls._connect()
+        if connection is None:
+            return
+
+        with cls._lock:
+            connection.execute('INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)',
+                               (key, sqlite3.Binary(data), len(data), time.time()))
+            cls._evict(connection)
+            connection.commit()
+
+    @classmethod
+    def _make_key(cls, kind: str, path: str, extra: str) -> str:
+        return f'{kind}|{cls.fingerprint(path)}|{extra}'
+
+    @classmethod
+    def _evict(cls, connection: sqlite3.Connection):
+        """
+        Deletes least recently used entries until the cache fits within its size limit
+        :param connection (sqlite3.Connection):
+        :return:
+        """
+        max_size = Settings.advanced['cache_max_size_mb'] * 1000 * 1000
+        total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total_size <= max_size:
+            return
+
+        rows = connection.execute('SELECT key, size FROM entries ORDER BY last_access').fetchall()
+        for key, size in rows:
+            if total_size <= max_size:
+                break
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total_size -= size
+
+    @classmethod
+    def _connect(cls):
+        """
+        Opens the cache database on first use. An unusable cache file disables the cache rather than the script
+        :return sqlite3.Connection: or None if the cache is disabled
+        """
+        if not cls.enabled:
+            return None
+
+        with cls._lock:
+            if cls._connection is None:
+                try:
+                    cls._connection = sqlite3.connect(cls.cache_file_path, check_same_thread=False)
+                    cls._connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, '
+                                            'value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)')
+                    cls._connection.commit()
+                except sqlite3.Error as e:
+                    print(f'Error opening cache {cls.cache_file_path} ({e}); continuing without cache')
+                    cls._connection = None
+                    cls.enabled = False
+            return cls._connection
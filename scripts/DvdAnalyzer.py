@@ -1,5 +1,9 @@
 import os
 import Helper
+from Cache import Cache
+from IfoParser import IfoParser, IfoParseError
+from IsoImage import IsoImage, IsoImageError
+from ProbePool import ProbePool
 
 VOB_EXTS = ('.vob', '.VOB')
 IFO_EXTS = ('.ifo', '.IFO')
@@ -7,23 +11,41 @@ IFO_EXTS = ('.ifo', '.IFO')
 
 class DvdAnalyzer:
     def __init__(self, input_path):
+        """
+        :param input_path (str): DVD folder, or DVD disc image (.iso)
+        """
         self.video_ts_folder_path = os.path.join(input_path, 'VIDEO_TS')
+        # (image path, VIDEO_TS path within the image) when reading a disc image in place
+        self.iso_path = IsoImage.split_path(self.video_ts_folder_path)
+        self._main_title = None
 
     def get_primary_ifo_info(self) -> dict:
         """
-        Gathers mediainfo on all IFO files and determines which is the primary IFO
-        :return dict: Contains the path of the primary IFO file, as well as its mediainfo
+        Determines which is the primary IFO, from the IFO title tables if they can be read, otherwise by
+        gathering mediainfo on all IFO files
+        :return dict: Contains the path of the primary IFO file, as well as its mediainfo and (if known) the
+                duration in seconds of the main title
         """
+        main_title = self._get_main_title()
+        if main_title:
+            primary_ifo_file = os.path.join(self.video_ts_folder_path, main_title['ifo_name'])
+            return {'path': primary_ifo_file, 'mediainfo_json': Helper.get_mediainfo_json(primary_ifo_file),
+                    'duration': main_title['duration']}
+
+        cached_primary_ifo = Cache.get_json('dvd_primary_ifo', self.video_ts_folder_path)
+        if cached_primary_ifo is not None:
+            return {'path': cached_primary_ifo, 'mediainfo_json': Helper.get_mediainfo_json(cached_primary_ifo)}
+
         ifo_files = [os.path.join(self.video_ts_folder_path, f)
-                     for f in os.listdir(self.video_ts_folder_path) if f.endswith(IFO_EXTS)]
+                     for f in self._get_file_sizes() if f.endswith(IFO_EXTS)]
 
         # Preliminary choosing; pick first IFO file as the primary
         primary_ifo_file = ifo_files[0]
         primary_mediainfo_json = {}
         longest_duration = 0
 
-        for ifo_file in ifo_files:
-            mediainfo_json = Helper.get_mediainfo_json(ifo_file)
+        ifo_mediainfo_jsons = ProbePool.map(Helper.get_mediainfo_json, ifo_files, label='Probed IFO')
+        for ifo_file, mediainfo_json in zip(ifo_files, ifo_mediainfo_jsons):
             general_info = Helper.get_track(mediainfo_json, track_type='General')
             if general_info.get('Duration') is None:
                 continue
@@ -33,25 +55,75 @@ class DvdAnalyzer:
                 longest_duration = duration_secs
                 primary_ifo_file = ifo_file
                 primary_mediainfo_json = mediainfo_json
-                
+
+        Cache.put_json('dvd_primary_ifo', self.video_ts_folder_path, primary_ifo_file)
         return {'path': primary_ifo_file, 'mediainfo_json': primary_mediainfo_json}
 
     def get_main_vob_files(self) -> list:
         """
-        Get primary movie VOB files (ie. largest-size VOB files), which are similar in size
+        Get primary movie VOB files; those holding the main title according to the IFO cell tables, or if those
+        can't be read, the largest-size VOB files, which are similar in size
         :return list<str>: File paths of the VOB files found
         """
-        vob_files = [os.path.join(self.video_ts_folder_path, f)
-                     for f in os.listdir(self.video_ts_folder_path) if f.endswith(VOB_EXTS)]
-        assert len(vob_files) > 0, 'No VOB files found in VIDEO_TS'
+        main_title = self._get_main_title()
+        if main_title:
+            return [os.path.join(self.video_ts_folder_path, f) for f in main_title['vob_files']]
 
-        largest_vob_filepath = Helper.get_largest_file(vob_files)
+        vob_sizes = {f: size for f, size in self._get_file_sizes().items() if f.endswith(VOB_EXTS)}
+        assert len(vob_sizes) > 0, 'No VOB files found in VIDEO_TS'
+
+        largest_vob_size = max(vob_sizes.values())
 
         main_vob_files = []
-        for vob_file in vob_files:
-            if os.path.getsize(vob_file)/os.path.getsize(largest_vob_filepath) < 0.9:
+        for vob_file, size in vob_sizes.items():
+            if size/largest_vob_size < 0.9:
                 continue
-            main_vob_files.append(vob_file)
+            main_vob_files.append(os.path.join(self.video_ts_folder_path, vob_file))
 
         main_vob_files.sort()
         return main_vob_files
+
+    def get_main_vob_durations(self) -> dict:
+        """
+        Runtime of the main title within each of its VOB files, from the IFO cell tables
+        :return dict<str, float>: VOB file path -> seconds; empty if the IFO files could not be read
+        """
+        main_title = self._get_main_title()
+        if not main_title:
+            return {}
+        return {os.path.join(self.video_ts_folder_path, f): duration
+                for f, duration in zip(main_title['vob_files'], main_title['vob_durations'])}
+
+    def _get_main_title(self) -> dict:
+        """
+        Reads the longest title of the disc from the IFO files
+        :return dict: see IfoParser.get_main_title(); empty if the IFO files could not be read
+        """
+        if self._main_title is not None:
+            return self._main_title
+
+        self._main_title = Cache.get_json('dvd_main_title', self.video_ts_folder_path)
+        if self._main_title is None:
+            try:
+                if self.iso_path:
+                    ifo_parser = IfoParser.from_iso(*self.iso_path)
+                else:
+                    ifo_parser = IfoParser.from_folder(self.video_ts_folder_path)
+                self._main_title = ifo_parser.get_main_title()
+            except (IfoParseError, IsoImageError, OSError) as e:
+                print(f'Could not read DVD title tables ({e}); using mediainfo to find the main title')
+                self._main_title = {}
+
+            if not self._main_title.get('vob_files'):
+                self._main_title = {}
+            Cache.put_json('dvd_main_title', self.video_ts_folder_path, self._main_title)
+
+        return self._main_title
+
+    def _get_file_sizes(self) -> dict:
+        """
+        :return dict<str, int>: file name -> size in bytes, for every file in VIDEO_TS (of the folder or disc image)
+        """
+        if self.iso_path:
+            return IsoImage.open(self.iso_path[0]).list_dir(self.iso_path[1])
+        return {entry.name: entry.stat().st_size for entry in os.scandir(self.video_ts_folder_path) if entry.is_file()}
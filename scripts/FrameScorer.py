@@ -0,0 +1,71 @@
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# frames are scored on a subsampled luma plane about this wide; plenty to rank detail, and fast for 4K frames
+SCORING_WIDTH = 640
+# mean luma outside this range is a (near) black or white frame
+MIN_BRIGHTNESS = 24
+MAX_BRIGHTNESS = 232
+# frames with less luma entropy (bits) or sharpness (variance of the Laplacian) than this are flat or blurry
+MIN_ENTROPY = 3.0
+MIN_SHARPNESS = 10.0
+# Rec. 601 luma weights
+LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+
+def is_available() -> bool:
+    """
+    :return bool: True if NumPy is installed, which frame scoring requires
+    """
+    return numpy is not None
+
+
+def score_rgb_frame(frame: bytes, width: int, height: int) -> dict:
+    """
+    Scores a raw rgb24 frame, as piped from ffmpeg
+    :param frame (bytes): width * height * 3 bytes of packed RGB
+    :param width (int): frame width in pixels
+    :param height (int): frame height in pixels
+    :return dict: see score_luma()
+    """
+    rgb = numpy.frombuffer(frame, dtype=numpy.uint8).reshape(height, width, 3)
+    step = max(1, width // SCORING_WIDTH)
+    luma = rgb[::step, ::step].astype(numpy.float32) @ numpy.array(LUMA_WEIGHTS, dtype=numpy.float32)
+    return score_luma(luma)
+
+
+def score_luma(luma) -> dict:
+    """
+    Scores how much visible detail a frame has; dark, washed-out, flat or blurry frames score low
+    :param luma (numpy.ndarray): 2D luma plane, values 0-255
+    :return dict: 'brightness' (mean luma), 'entropy' (bits, of the luma histogram), 'sharpness' (variance of the
+            Laplacian) and the combined 'score' used to rank frames
+    """
+    luma = numpy.asarray(luma, dtype=numpy.float32)
+    brightness = float(luma.mean())
+
+    histogram = numpy.bincount(luma.astype(numpy.uint8).ravel(), minlength=256) / luma.size
+    histogram = histogram[histogram > 0]
+    entropy = max(0.0, float(-(histogram * numpy.log2(histogram)).sum()))
+
+    laplacian = (4 * luma[1:-1, 1:-1] - luma[:-2, 1:-1] - luma[2:, 1:-1] - luma[1:-1, :-2] - luma[1:-1, 2:])
+    sharpness = float(laplacian.var()) if laplacian.size else 0.0
+
+    score = entropy * math.log1p(sharpness)
+    if not MIN_BRIGHTNESS <= brightness <= MAX_BRIGHTNESS:
+        score *= 0.1
+
+    return {'brightness': brightness, 'entropy': entropy, 'sharpness': sharpness, 'score': score}
+
+
+def is_good(stats: dict) -> bool:
+    """
+    :param stats (dict): see score_luma()
+    :return bool: True if the frame is neither (near) black or white, flat nor blurry
+    """
+    return (MIN_BRIGHTNESS <= stats['brightness'] <= MAX_BRIGHTNESS and stats['entropy'] >= MIN_ENTROPY
+            and stats['sharpness'] >= MIN_SHARPNESS)
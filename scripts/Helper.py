@@ -1,8 +1,20 @@
-import json
+import hashlib
+import io
 import os
-import subprocess
+import re
 
-from Settings import Settings
+from MediaProbe import MediaProbe
+
+# common scene/P2P release names: dotted, spaced or underscored title, then year or season/episode, with the
+# resolution somewhere after it, eg. Movie.Title.2019.1080p.BluRay.x264-GRP or Show Title S01E02 720p WEB-DL
+RELEASE_NAME_RE = re.compile(r'^(?P<title>[^.\s_].*)[. _]+(?:\(?(?P<year>(?:19|20)\d{2})\)?|S\d{1,2}(?:E\d{1,3})*)'
+                             r'[. _]+(?:.*[. _-])?(?P<screen_size>\d{3,4}[pi])(?:[. _-]|$)', re.IGNORECASE)
+SCREEN_SIZE_RE = re.compile(r'(?:^|[. _-])\d{3,4}[pi](?:[. _-]|$)', re.IGNORECASE)
+SEASON_EPISODE_RE = re.compile(r'(?:^|[. _-])S\d{1,2}(?:E\d{1,3})*(?:[. _-]|$)', re.IGNORECASE)
+TRAILING_YEAR_RE = re.compile(r'^(?P<title>.+) \(?(?P<year>(?:19|20)\d{2})\)?$')
+
+# release name -> gallery name, see get_gallery_name()
+_gallery_names = {}
 
 
 def get_largest_file(files: list) -> str:
@@ -11,16 +23,8 @@ def get_largest_file(files: list) -> str:
     :param files (list<str>): file paths
     :return str:
     """
-    largest_filepath = files[0]
-    largest_filesize = os.path.getsize(files[0])
-
-    for file in files:
-        filesize = os.path.getsize(file)
-        if filesize > largest_filesize:
-            largest_filepath = file
-            largest_filesize = filesize
-
-    return largest_filepath
+    # each file is only stat'd once
+    return max(files, key=os.path.getsize)
 
 
 def get_gallery_name(input_path: str) -> str:
@@ -29,6 +33,46 @@ def get_gallery_name(input_path: str) -> str:
     :param input_path (str): file path of video file
     :return (str): Name to use for gallery (for video hosts that have the option of creating a gallery)
     """
+    release_name = os.path.basename(os.path.normpath(input_path))
+    if os.path.isfile(input_path):
+        release_name = os.path.splitext(release_name)[0]
+    if release_name not in _gallery_names:
+        _gallery_names[release_name] = _parse_release_name(release_name) or _guess_gallery_name(input_path)
+    return _gallery_names[release_name]
+
+
+def _parse_release_name(release_name: str) -> str:
+    """
+    Fast path for get_gallery_name(), which avoids importing guessit (whose regexes take a while to compile)
+    for releases named the usual way
+    :param release_name (str): file name without extension, or folder name
+    :return str: gallery name, or None if the name is not in a recognised form
+    """
+    match = RELEASE_NAME_RE.match(release_name)
+    if match is None:
+        return None
+    title = re.sub(r'[._]', ' ', match.group('title')).strip()
+    # a resolution or episode tag within the title means the name was not split where expected
+    if not title or SCREEN_SIZE_RE.search(title) or SEASON_EPISODE_RE.search(title):
+        return None
+
+    year = match.group('year')
+    # eg. Show.Title.2019.S01E02
+    trailing_year = TRAILING_YEAR_RE.match(title) if year is None else None
+    if trailing_year is not None:
+        title, year = trailing_year.group('title'), trailing_year.group('year')
+
+    gallery_name = title
+    if year is not None:
+        gallery_name += ' ({year})'.format(year=year)
+    return gallery_name + ' - {res}'.format(res=match.group('screen_size').lower())
+
+
+def _guess_gallery_name(input_path: str) -> str:
+    """
+    :param input_path (str): file path of video file
+    :return str: gallery name, as guessed by guessit from the whole path
+    """
     from guessit import guessit
 
     guessed_data = guessit(input_path)
@@ -43,11 +87,12 @@ def get_gallery_name(input_path: str) -> str:
 
 
 def get_mediainfo_json(file: str) -> dict:
-    args = [Settings.paths['mediainfo_bin_path'], '--Output=JSON', file]
-    mediainfo_json = subprocess.check_output(args).decode()
-    mediainfo_json = json.loads(mediainfo_json)
-
-    return mediainfo_json
+    """
+    Gets the structured mediainfo of a file; the result is shared with every other caller for the same file
+    :param file (str): path of the media file
+    :return dict:
+    """
+    return MediaProbe.get(file).json
 
 
 def get_track(mediainfo_json: dict, track_type=None) -> dict:
@@ -55,3 +100,57 @@ def get_track(mediainfo_json: dict, track_type=None) -> dict:
         if track['@type'] == track_type:
             return track
     return {}
+
+
+def open_image(image):
+    """
+    Opens a screenshot for reading, whether it was saved to disk or kept in memory
+    :param image (str|io.BytesIO): file path, or in-memory image with a `name` attribute
+    :return: binary file-like object; close it when done (closing does not discard an in-memory image)
+    """
+    if isinstance(image, io.BytesIO):
+        image_copy = io.BytesIO(image.getvalue())
+        image_copy.name = image.name
+        return image_copy
+    return open(image, 'rb')
+
+
+def read_image(image) -> bytes:
+    """
+    :param image (str|io.BytesIO): file path, or in-memory image
+    :return bytes: content of the image file
+    """
+    if isinstance(image, io.BytesIO):
+        return image.getvalue()
+    with open(image, 'rb') as f:
+        return f.read()
+
+
+def get_image_size(image) -> int:
+    """
+    :param image (str|io.BytesIO): file path, or in-memory image
+    :return int: size of the image file in bytes
+    """
+    if isinstance(image, io.BytesIO):
+        return image.getbuffer().nbytes
+    return os.path.getsize(image)
+
+
+def get_image_hash(image) -> str:
+    """
+    :param image (str|io.BytesIO): file path, or in-memory image
+    :return str: SHA-256 of the image file's content, in hex
+    """
+    hasher = hashlib.sha256()
+    with open_image(image) as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def get_image_name(image) -> str:
+    """
+    :param image (str|io.BytesIO): file path, or in-memory image with a `name` attribute
+    :return str: file name of the image
+    """
+    return os.path.basename(image.name if isinstance(image, io.BytesIO) else image)
@@ -0,0 +1,232 @@
+import concurrent.futures
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+
+import requests
+import requests.adapters
+
+import Helper
+from Settings import Settings
+
+# status codes worth retrying: rate limiting, and transient server/CloudFlare errors
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524)
+# exponential backoff: the delay before retry n is random between 0 and min(BACKOFF_MAX, BACKOFF_BASE * 2^n) seconds
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+# seconds to connect, and to wait for the response once the body is sent
+REQUEST_TIMEOUT = (10, 120)
+# bytes read from an image file at a time while sending it
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+class MultipartBody:
+    """
+    A multipart/form-data request body that is read piece by piece while it is sent, so image files are streamed
+    from disk rather than loaded (or base64-encoded) in memory. Its length is known up front, so it is sent with
+    a Content-Length rather than chunked
+    """
+
+    def __init__(self, fields: dict, files: list):
+        """
+        :param fields (dict<str, str>): form field name -> value
+        :param files (list<tuple<str, str, str|io.BytesIO>>): form field name, file name and image of each file
+        """
+        boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+
+        # bytes, or an image to stream
+        self._parts = []
+        for name, value in fields.items():
+            self._parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                               f'{value}\r\n'.encode())
+        for name, file_name, image in files:
+            self._parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                               f'filename="{file_name}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode())
+            self._parts.append(image)
+            self._parts.append(b'\r\n')
+        self._parts.append(f'--{boundary}--\r\n'.encode())
+
+        self.len = sum(len(part) if isinstance(part, bytes) else Helper.get_image_size(part) for part in self._parts)
+        self._part_index = 0
+        self._part_offset = 0
+        self._open_image = None
+
+    def __len__(self):
+        return self.len
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        :param size (int): most bytes to return; -1 for the whole remaining body
+        :return bytes: the next part of the body; empty once it has all been read
+        """
+        size = self.len if size is None or size < 0 else size
+        chunks = []
+        while size > 0 and self._part_index < len(self._parts):
+            part = self._parts[self._part_index]
+            if isinstance(part, bytes):
+                chunk = part[self._part_offset:self._part_offset + size]
+                self._part_offset += len(chunk)
+                exhausted = self._part_offset >= len(part)
+            else:
+                if self._open_image is None:
+                    self._open_image = Helper.open_image(part)
+                chunk = self._open_image.read(size)
+                exhausted = not chunk or len(chunk) < size
+            chunks.append(chunk)
+            size -= len(chunk)
+            if exhausted:
+                self.close()
+                self._part_index += 1
+                self._part_offset = 0
+        return b''.join(chunks)
+
+    def close(self):
+        if self._open_image is not None:
+            self._open_image.close()
+            self._open_image = None
+
+
+class HttpClient:
+    """
+    Shared HTTP session for uploads: connections are kept alive and reused, requests to any one host are limited
+    in number (`upload_concurrency_per_host`) and rate (`upload_requests_per_second_per_host`), and requests failing
+    with a transient error are retried (`upload_max_retries`) with exponential backoff and jitter
+    """
+    _session = None
+    _executor = None
+    _lock = threading.Lock()
+    _host_semaphores = {}
+    _host_next_request_times = {}
+
+    @classmethod
+    def post_multipart(cls, url: str, fields: dict, files: list) -> requests.Response:
+        """
+        Posts a form with streamed file uploads, retrying transient failures
+        :param url (str): URL to post to
+        :param fields (dict<str, str>): see MultipartBody
+        :param files (list<tuple<str, str, str|io.BytesIO>>): see MultipartBody
+        :return requests.Response: the last response; check its status, as it may still be an error
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        max_retries = Settings.advanced['upload_max_retries']
+        for attempt in range(max_retries + 1):
+            resp = None
+            with cls._get_host_semaphore(host):
+                cls._wait_for_rate_limit(host)
+                body = MultipartBody(fields, files)
+                try:
+                    resp = cls._get_session().post(url, data=body, headers={'Content-Type': body.content_type},
+                                                   timeout=REQUEST_TIMEOUT)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt == max_retries:
+                        raise
+                    print(f'Upload to {host} failed ({e.__class__.__name__}); retrying')
+                finally:
+                    body.close()
+
+            if resp is not None:
+                if resp.status_code not in RETRYABLE_STATUS_CODES or attempt == max_retries:
+                    return resp
+                print(f'Upload to {host} returned status code {resp.status_code}; retrying')
+            time.sleep(cls._get_retry_delay(attempt, resp))
+
+    @classmethod
+    def is_reachable(cls, url: str) -> bool:
+        """
+        Checks with a HEAD request that a previously uploaded image is still served
+        :param url (str): URL of the image
+        :return bool: False if the request fails or does not succeed; not retried
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        with cls._get_host_semaphore(host):
+            cls._wait_for_rate_limit(host)
+            try:
+                resp = cls._get_session().head(url, allow_redirects=True, timeout=REQUEST_TIMEOUT[0])
+            except requests.RequestException:
+                return False
+        return resp.ok
+
+    @classmethod
+    def map(cls, fn, items: list) -> list:
+        """
+        Runs fn (typically an upload) on every item concurrently
+        :param fn (callable): takes an item
+        :param items (list): items to run fn on
+        :return list: fn's results, in the same order as items
+        """
+        return list(cls._get_executor().map(fn, items))
+
+    @classmethod
+    def submit(cls, fn, *args) -> concurrent.futures.Future:
+        """
+        Starts fn (typically an upload) in the background, on the same threads as map()
+        :param fn (callable): takes args
+        :return concurrent.futures.Future: fn's result
+        """
+        return cls._get_executor().submit(fn, *args)
+
+    @classmethod
+    def _get_session(cls) -> requests.Session:
+        with cls._lock:
+            if cls._session is None:
+                pool_size = Settings.advanced['upload_concurrency_per_host']
+                cls._session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+                cls._session.mount('https://', adapter)
+                cls._session.mount('http://', adapter)
+            return cls._session
+
+    @classmethod
+    def _get_executor(cls) -> concurrent.futures.ThreadPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=Settings.advanced['upload_concurrency_per_host'], thread_name_prefix='upload')
+            return cls._executor
+
+    @classmethod
+    def _get_host_semaphore(cls, host: str) -> threading.Semaphore:
+        with cls._lock:
+            if host not in cls._host_semaphores:
+                cls._host_semaphores[host] = threading.Semaphore(Settings.advanced['upload_concurrency_per_host'])
+            return cls._host_semaphores[host]
+
+    @classmethod
+    def _wait_for_rate_limit(cls, host: str):
+        """
+        Waits until the host's rate limit allows another request to start
+        :param host (str): host the request is for
+        :return:
+        """
+        requests_per_second = Settings.advanced['upload_requests_per_second_per_host']
+        if not requests_per_second:
+            return
+
+        with cls._lock:
+            now = time.monotonic()
+            start = max(now, cls._host_next_request_times.get(host, now))
+            cls._host_next_request_times[host] = start + 1 / requests_per_second
+        time.sleep(start - now)
+
+    @staticmethod
+    def _get_retry_delay(attempt: int, resp: requests.Response = None) -> float:
+        """
+        :param attempt (int): number of the failed attempt, from 0
+        :param resp (requests.Response): the failed attempt's response, if it got one
+        :return float: seconds to wait before retrying; the server's Retry-After if it sent one (in seconds),
+                otherwise exponential backoff with full jitter
+        """
+        retry_after = resp.headers.get('Retry-After', '') if resp is not None else ''
+        if retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
@@ -0,0 +1,246 @@
+import os
+import re
+import struct
+
+from IsoImage import IsoImage
+
+DVD_SECTOR_SIZE = 2048
+VMG_IFO_NAME = 'VIDEO_TS.IFO'
+VTS_IFO_NAME_RE = re.compile(r'^VTS_(\d\d)_0\.IFO$', re.IGNORECASE)
+# frame rate flag (top two bits of the frame byte) of a DVD playback time
+BCD_FRAME_RATES = {1: 25.0, 3: 30000 / 1001}
+
+
+class IfoParseError(ValueError):
+    pass
+
+
+def bcd_time_to_seconds(data: bytes) -> float:
+    """
+    Converts a 4-byte DVD playback time (BCD hours, minutes, seconds, then frame rate flag + BCD frames)
+    :param data (bytes): the 4 bytes of the playback time
+    :return float: seconds
+    """
+    def bcd(byte):
+        return (byte >> 4) * 10 + (byte & 0x0F)
+
+    hours, minutes, seconds, frames = data[:4]
+    frame_rate = BCD_FRAME_RATES.get(frames >> 6)
+    frame_secs = bcd(frames & 0x3F) / frame_rate if frame_rate else 0
+    return bcd(hours) * 3600 + bcd(minutes) * 60 + bcd(seconds) + frame_secs
+
+
+class IfoParser:
+    """
+    Reads the title, program chain and cell tables of a DVD's IFO files directly, without decoding any video.
+    Used to find the main title of a disc, and exactly which VOB files (and how much runtime of each) belong to it
+    """
+
+    def __init__(self, file_sizes: dict, read_file):
+        """
+        :param file_sizes (dict<str, int>): file name -> size in bytes, for every file in VIDEO_TS
+        :param read_file (callable): takes a file name from file_sizes, returns that file's content (bytes)
+        """
+        self.file_sizes = file_sizes
+        self.read_file = read_file
+        self._names = {name.upper(): name for name in file_sizes}
+        self._contents = {}
+
+    @classmethod
+    def from_folder(cls, video_ts_folder_path: str) -> 'IfoParser':
+        """
+        :param video_ts_folder_path (str): path of the VIDEO_TS folder
+        :return IfoParser:
+        """
+        file_sizes = {entry.name: entry.stat().st_size for entry in os.scandir(video_ts_folder_path) if entry.is_file()}
+
+        def read_file(name):
+            with open(os.path.join(video_ts_folder_path, name), 'rb') as f:
+                return f.read()
+
+        return cls(file_sizes, read_file)
+
+    @classmethod
+    def from_iso(cls, iso_path: str, video_ts_path: str) -> 'IfoParser':
+        """
+        :param iso_path (str): path of the disc image
+        :param video_ts_path (str): path of the VIDEO_TS folder within the image
+        :return IfoParser:
+        """
+        image = IsoImage.open(iso_path)
+        return cls(image.list_dir(video_ts_path), lambda name: image.read_file(f'{video_ts_path}/{name}'))
+
+    def get_main_title(self) -> dict:
+        """
+        Finds the longest title on the disc
+        :return dict: 'ifo_name': name of the title set's IFO file, 'duration': title runtime in seconds,
+                'vob_files': names of the VOB files holding the title, in playback order,
+                'vob_durations': runtime in seconds of the title within each of those VOB files
+        :raises IfoParseError: if the IFO files are missing, truncated or malformed
+        """
+        titles = self._get_titles()
+        if not titles:
+            raise IfoParseError('No titles found in IFO files')
+
+        vts_number, vts_title_number = max(titles, key=lambda title: self._get_title_duration(*title))
+        try:
+            return self._describe_title(vts_number, vts_title_number)
+        except (IndexError, struct.error) as e:
+            # an offset pointing past the end of a truncated or malformed IFO file
+            raise IfoParseError(f'VTS_{vts_number:02d}_0.IFO is damaged ({e})') from e
+
+    def _get_titles(self) -> list:
+        """
+        Lists the titles of the disc from the VMG title search pointer table. If VIDEO_TS.IFO is missing or damaged,
+        every title of every title set IFO is considered instead
+        :return list<tuple<int, int>>: (title set number, title number within the title set) of each title
+        """
+        try:
+            vmg = self._read(VMG_IFO_NAME)
+            if vmg[:12] != b'DVDVIDEO-VMG':
+                raise IfoParseError(f'{VMG_IFO_NAME} is not a DVD video manager IFO')
+            tt_srpt = self._u32(vmg, 0xC4) * DVD_SECTOR_SIZE
+            n_titles = self._u16(vmg, tt_srpt)
+            return [(vmg[tt_srpt + 8 + i * 12 + 6], vmg[tt_srpt + 8 + i * 12 + 7]) for i in range(n_titles)]
+        except (IfoParseError, IndexError, struct.error):
+            titles = []
+            for name in self._names:
+                match = VTS_IFO_NAME_RE.match(name)
+                if match is None:
+                    continue
+                vts_number = int(match.group(1))
+                try:
+                    vtsi = self._read_vtsi(vts_number)
+                    ptt_srpt = self._u32(vtsi, 0xC8) * DVD_SECTOR_SIZE
+                    titles += [(vts_number, i + 1) for i in range(self._u16(vtsi, ptt_srpt))]
+                except (IfoParseError, IndexError, struct.error):
+                    continue
+            return titles
+
+    def _get_title_duration(self, vts_number: int, vts_title_number: int) -> float:
+        try:
+            return sum(self._get_pgc(vts_number, pgc_number)['duration']
+                       for pgc_number in self._get_title_pgc_numbers(vts_number, vts_title_number))
+        except (IfoParseError, IndexError, struct.error):
+            return 0
+
+    def _describe_title(self, vts_number: int, vts_title_number: int) -> dict:
+        """
+        :param vts_number (int): title set number
+        :param vts_title_number (int): title number within the title set
+        :return dict: see get_main_title()
+        """
+        vob_names = self._get_title_vob_names(vts_number)
+        # first sector (relative to the start of the title VOBs) of each VOB file
+        vob_start_sectors = [0]
+        for name in vob_names:
+            vob_start_sectors.append(vob_start_sectors[-1] + self.file_sizes[name] // DVD_SECTOR_SIZE)
+
+        vob_durations = [0.0] * len(vob_names)
+        for pgc_number in self._get_title_pgc_numbers(vts_number, vts_title_number):
+            for cell in self._get_pgc(vts_number, pgc_number)['cells']:
+                first_sector, last_sector = cell['first_sector'], cell['last_sector']
+                n_sectors = last_sector - first_sector + 1
+                # spread the cell's runtime over the VOB files it is stored in, in proportion to its sectors in each
+                for i in range(len(vob_names)):
+                    overlap = min(last_sector + 1, vob_start_sectors[i + 1]) - max(first_sector, vob_start_sectors[i])
+                    if overlap > 0:
+                        vob_durations[i] += cell['duration'] * overlap / n_sectors
+
+        title_vobs = [(name, duration) for name, duration in zip(vob_names, vob_durations) if duration > 0]
+        return {
+            'ifo_name': self._names[f'VTS_{vts_number:02d}_0.IFO'],
+            'duration': sum(duration for _, duration in title_vobs),
+            'vob_files': [name for name, _ in title_vobs],
+            'vob_durations': [duration for _, duration in title_vobs],
+        }
+
+    def _get_title_vob_names(self, vts_number: int) -> list:
+        """
+        :param vts_number (int): title set number
+        :return list<str>: names of the title set's title VOB files (VTS_NN_1.VOB onwards), in order
+        """
+        vob_names = []
+        for i in range(1, 10):
+            name = self._names.get(f'VTS_{vts_number:02d}_{i}.VOB')
+            if name is None:
+                break
+            vob_names.append(name)
+        return vob_names
+
+    def _get_title_pgc_numbers(self, vts_number: int, vts_title_number: int) -> list:
+        """
+        Reads the part-of-title table to find which program chains make up a title
+        :param vts_number (int): title set number
+        :param vts_title_number (int): title number within the title set
+        :return list<int>: program chain numbers in playback order, without repeats
+        """
+        vtsi = self._read_vtsi(vts_number)
+        ptt_srpt = self._u32(vtsi, 0xC8) * DVD_SECTOR_SIZE
+        n_titles = self._u16(vtsi, ptt_srpt)
+        if not 1 <= vts_title_number <= n_titles:
+            raise IfoParseError(f'Title {vts_title_number} not found in title set {vts_number}')
+
+        ptt_start = ptt_srpt + self._u32(vtsi, ptt_srpt + 8 + (vts_title_number - 1) * 4)
+        if vts_title_number < n_titles:
+            ptt_end = ptt_srpt + self._u32(vtsi, ptt_srpt + 8 + vts_title_number * 4)
+        else:
+            ptt_end = ptt_srpt + self._u32(vtsi, ptt_srpt + 4) + 1
+
+        pgc_numbers = []
+        for offset in range(ptt_start, ptt_end - 3, 4):
+            pgc_number = self._u16(vtsi, offset)
+            if pgc_number not in pgc_numbers:
+                pgc_numbers.append(pgc_number)
+        return pgc_numbers
+
+    def _get_pgc(self, vts_number: int, pgc_number: int) -> dict:
+        """
+        :param vts_number (int): title set number
+        :param pgc_number (int): program chain number within the title set
+        :return dict: 'duration' of the program chain in seconds, and its 'cells' (each with 'duration',
+                'first_sector' and 'last_sector', sectors relative to the start of the title VOBs)
+        """
+        vtsi = self._read_vtsi(vts_number)
+        pgci = self._u32(vtsi, 0xCC) * DVD_SECTOR_SIZE
+        if not 1 <= pgc_number <= self._u16(vtsi, pgci):
+            raise IfoParseError(f'Program chain {pgc_number} not found in title set {vts_number}')
+        pgc = pgci + self._u32(vtsi, pgci + 8 + (pgc_number - 1) * 8 + 4)
+
+        n_cells = vtsi[pgc + 3]
+        cell_playback = pgc + self._u16(vtsi, pgc + 0xE8)
+        cells = []
+        for i in range(n_cells if cell_playback != pgc else 0):
+            cell = cell_playback + i * 24
+            cells.append({
+                'duration': bcd_time_to_seconds(vtsi[cell + 4:cell + 8]),
+                'first_sector': self._u32(vtsi, cell + 8),
+                'last_sector': self._u32(vtsi, cell + 20),
+            })
+
+        return {'duration': bcd_time_to_seconds(vtsi[pgc + 4:pgc + 8]), 'cells': cells}
+
+    def _read_vtsi(self, vts_number: int) -> bytes:
+        vtsi = self._read(f'VTS_{vts_number:02d}_0.IFO')
+        if vtsi[:12] != b'DVDVIDEO-VTS':
+            raise IfoParseError(f'VTS_{vts_number:02d}_0.IFO is not a DVD title set IFO')
+        return vtsi
+
+    def _read(self, name: str) -> bytes:
+        """
+        :param name (str): IFO file name (any case)
+        :return bytes: content of the file; read once and kept for later lookups
+        """
+        if name.upper() not in self._names:
+            raise IfoParseError(f'{name} not found')
+        if name.upper() not in self._contents:
+            self._contents[name.upper()] = self.read_file(self._names[name.upper()])
+        return self._contents[name.upper()]
+
+    @staticmethod
+    def _u16(data: bytes, offset: int) -> int:
+        return struct.unpack_from('>H', data, offset)[0]
+
+    @staticmethod
+    def _u32(data: bytes, offset: int) -> int:
+        return struct.unpack_from('>I', data, offset)[0]
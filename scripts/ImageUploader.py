@@ -1,15 +1,30 @@
-import base64
 import datetime
-import requests
-import os
+import hashlib
+import json
+import re
+import threading
+import time
 
 from string import Template
+import Helper
+from Cache import Cache
+from HttpClient import HttpClient
 from Settings import Settings
 
 ENDPOINT_PTPIMG = 'https://ptpimg.me/upload.php'
 ENDPOINT_IMGBB = 'https://api.imgbb.com/1/upload'
 ENDPOINT_HDBIMG = 'https://img.hdbits.org/upload_api.php'
 ENDPOINT_AHDIMG = 'https://img.awesome-hd.me/api/upload'
+# PTPIMG uses CloudFlare which has a 100mb upload limit, so images are split into batches under it
+# (this limit can be hit with 4k files); each file also adds its multipart headers to the request
+PTPIMG_MAX_UPLOAD_SIZE = 100000000
+PTPIMG_PART_OVERHEAD = 1024
+# hosts that images can be uploaded to one by one, as soon as each is generated
+STREAMING_UPLOAD_HOSTS = ('ptpimg', 'imgbb')
+# hosts that put the images in a named gallery
+GALLERY_UPLOAD_HOSTS = ('hdbimg',)
+# image URLs within hdbimg's pre-formatted gallery
+URL_PATTERN = r'https?://[^\s\[\]]+'
 
 
 class ImageUploader:
@@ -17,11 +32,28 @@ class ImageUploader:
     bbcoded_img_url_template = Template('[img]$direct_url[/img]')
     thumbnailed_bbcoded_img_url_template = Template('[url=$direct_url][img]$thumb_url[/img][/url]')
 
-    def __init__(self, image_files: list, gallery_name: str, image_host):
+    def __init__(self, image_files: list, gallery_name: str, image_host, journal=None):
+        """
+        :param image_files (list<str|io.BytesIO>): images to upload
+        :param gallery_name (str): name of the gallery, for hosts that create one
+        :param image_host (dict): image host to upload to
+        :param journal (ReleaseJournal): journal of the release's run; the URLs of each image are recorded in it as
+                soon as the image is uploaded, and reused from it by a resumed run
+        """
         self.image_host = image_host
         self.image_files = image_files
         self.formatted_urls = ''
         self.gallery_name = gallery_name
+        self.journal = journal
+        # image -> content hash
+        self._image_hashes = {}
+        # screenshot number -> (image, future of the upload it is part of, its position in that upload), for images
+        # added while they are being generated
+        self._pending_uploads = {}
+        self._upload_slots = None
+        # (number, image) of the ptpimg images added since the last batch was uploaded, and their upload size
+        self._ptpimg_batch = []
+        self._ptpimg_batch_size = 0
 
     def get_formatted_urls(self) -> str:
         """
@@ -31,89 +63,321 @@ class ImageUploader:
         return self.formatted_urls
 
     def upload(self):
-        if self.image_host['name'] == 'ptpimg':
-            self._upload_ptpimg()
-        elif self.image_host['name'] == 'imgbb':
-            self._upload_imgbb()
-        elif self.image_host['name'] == 'hdbimg':
-            self._upload_hdbimg()
-        elif self.image_host['name'] == 'ahdimg':
+        if self.image_host['name'] == 'ahdimg':
             print('Error: ahdimg is not yet implemented on this script. Site currently down for testing.')
             exit()
+        if self.image_host['name'] == 'hdbimg':
+            self._upload_hdbimg()
+            return
+
+        # images uploaded before to this host are not uploaded again
+        image_hashes = [self._get_image_hash(img) for img in self.image_files]
+        image_urls = self._get_reused_urls(image_hashes)
+        upload_indexes = [i for i, urls in enumerate(image_urls) if urls is None]
+        if len(upload_indexes) < len(image_urls):
+            print(f'Reusing {len(image_urls) - len(upload_indexes)} previously uploaded images')
+
+        if upload_indexes:
+            upload_images = [self.image_files[i] for i in upload_indexes]
+            if self.image_host['name'] == 'ptpimg':
+                uploaded_urls = self._upload_ptpimg(upload_images)
+            else:
+                uploaded_urls = self._upload_imgbb(upload_images)
+
+            for i, urls in zip(upload_indexes, uploaded_urls):
+                image_urls[i] = urls
 
-    def _upload_imgbb(self):
-        form_data = dict(key=self.image_host['api_key'])
+        self._format_urls(image_urls)
 
-        for i, image in enumerate(self.image_files):
-            now = datetime.datetime.now().strftime('%Y-%m-%d %H-%M-%S')
-            with open(image, 'rb') as f:
-                form_data['image'] = base64.b64encode(f.read())
-                form_data['name'] = f'{i}_snapshot {now}'
+    def start(self):
+        """
+        Starts accepting images with add_image(), to upload each one while later ones are still being generated;
+        only for STREAMING_UPLOAD_HOSTS
+        :return:
+        """
+        # uploads (images, or ptpimg batches) waiting or in progress; beyond this, add_image() blocks until one is done
+        self._upload_slots = threading.BoundedSemaphore(Settings.advanced['upload_concurrency_per_host'] * 2)
 
-                resp = requests.post(url=ENDPOINT_IMGBB, data=form_data)
+    def add_image(self, num: int, image):
+        """
+        Uploads an image in the background. Blocks while too many images are waiting to be uploaded, which holds back
+        the generation of further screenshots. ptpimg images are collected into batches under its upload size limit,
+        and each batch is uploaded once the next image does not fit in it; finish() uploads the last one
+        :param num (int): number of the screenshot; URLs are formatted in this order
+        :param image (str|io.BytesIO): the final image
+        :return:
+        """
+        if self.image_host['name'] == 'ptpimg':
+            size = Helper.get_image_size(image) + PTPIMG_PART_OVERHEAD
+            if self._ptpimg_batch and self._ptpimg_batch_size + size > PTPIMG_MAX_UPLOAD_SIZE:
+                self._submit_ptpimg_batch()
+            self._ptpimg_batch.append((num, image))
+            self._ptpimg_batch_size += size
+            return
 
-            assert resp.ok, f'IMGBB returned status code {resp.status_code}'
-            resp_json = resp.json()
-            direct_url = resp_json['data']['image']['url']
-            thumb_url = resp_json['data']['medium']['url']
+        self._upload_slots.acquire()
+        future = HttpClient.submit(lambda: [self._upload_image(num, image)])
+        future.add_done_callback(lambda _: self._upload_slots.release())
+        self._pending_uploads[num] = (image, future, 0)
 
-            if Settings.use_bbcode_tags:
-                bbcoded_image_url = self.thumbnailed_bbcoded_img_url_template.safe_substitute(
+    def _submit_ptpimg_batch(self):
+        """
+        Uploads the collected ptpimg images in the background, as one batch
+        :return:
+        """
+        batch = self._ptpimg_batch
+        self._ptpimg_batch, self._ptpimg_batch_size = [], 0
+        self._upload_slots.acquire()
+        future = HttpClient.submit(self._upload_ptpimg_images, [image for _, image in batch])
+        future.add_done_callback(lambda _: self._upload_slots.release())
+        for position, (num, image) in enumerate(batch):
+            self._pending_uploads[num] = (image, future, position)
+
+    def finish(self):
+        """
+        Waits for the images added with add_image() to be uploaded, and formats their URLs in screenshot order
+        :return:
+        """
+        if self._ptpimg_batch:
+            self._submit_ptpimg_batch()
+        nums = sorted(self._pending_uploads)
+        self.image_files = [self._pending_uploads[num][0] for num in nums]
+        uploads = [self._pending_uploads[num][1].result()[self._pending_uploads[num][2]] for num in nums]
+        n_reused = sum(is_reused for _, is_reused in uploads)
+        if n_reused:
+            print(f'Reused {n_reused} previously uploaded images')
+        self._format_urls([urls for urls, _ in uploads])
+
+    def _upload_image(self, num: int, image) -> tuple:
+        """
+        Uploads a single image, unless it was uploaded to this host before
+        :param num (int): number of the screenshot
+        :param image (str|io.BytesIO): image to upload
+        :return tuple<tuple<str, str>, bool>: direct URL and thumbnail URL (None if the host has none) of the image,
+                and whether they were reused
+        """
+        urls = self._get_reusable_urls(image)
+        if urls is not None:
+            return urls, True
+        return self._upload_imgbb_image((num, image)), False
+
+    def _upload_ptpimg_images(self, images: list) -> list:
+        """
+        Uploads a batch of images in one request, except those uploaded to ptpimg before
+        :param images (list<str|io.BytesIO>): images to upload, within ptpimg's upload size limit together
+        :return list<tuple<tuple<str, None>, bool>>: direct URL (ptpimg has no thumbnails) of each image, and whether
+                it was reused, in the same order
+        """
+        uploads = [None if urls is None else (urls, True) for urls in map(self._get_reusable_urls, images)]
+        upload_indexes = [i for i, upload in enumerate(uploads) if upload is None]
+        if upload_indexes:
+            direct_urls = self._upload_ptpimg_batch([images[i] for i in upload_indexes])
+            for i, direct_url in zip(upload_indexes, direct_urls):
+                uploads[i] = ((direct_url, None), False)
+        return uploads
+
+    def _get_reusable_urls(self, image):
+        """
+        :param image (str|io.BytesIO): image to upload
+        :return tuple<str, str>: direct URL and thumbnail URL (None if the host has none) the image was uploaded to
+                by the unfinished previous run of the release, or earlier and still reachable; None if there are none
+        """
+        image_hash = self._get_image_hash(image)
+        urls = self._get_journaled_urls(image_hash)
+        if urls is not None:
+            return urls
+        urls = self._get_stored_urls(image_hash)
+        if urls is not None and HttpClient.is_reachable(urls[0]):
+            return urls
+        return None
+
+    def _get_image_hash(self, image) -> str:
+        """
+        :param image (str|io.BytesIO): image to upload
+        :return str: content hash of the image; only computed once per image
+        """
+        if image not in self._image_hashes:
+            self._image_hashes[image] = Helper.get_image_hash(image)
+        return self._image_hashes[image]
+
+    def _format_urls(self, image_urls: list):
+        """
+        :param image_urls (list<tuple<str, str>>): direct URL and thumbnail URL (None if the host has none)
+                of each image, in screenshot order
+        :return:
+        """
+        for direct_url, thumb_url in image_urls:
+            if Settings.use_bbcode_tags and thumb_url:
+                self.formatted_urls += self.thumbnailed_bbcoded_img_url_template.safe_substitute(
                     direct_url=direct_url,
                     thumb_url=thumb_url
-                )
-                self.formatted_urls += bbcoded_image_url + '\n'
+                ) + '\n'
+            elif Settings.use_bbcode_tags:
+                self.formatted_urls += self.bbcoded_img_url_template.safe_substitute(direct_url=direct_url) + '\n'
             else:
                 self.formatted_urls += direct_url + '\n'
 
-    def _upload_ptpimg(self):
-        form_data = dict(api_key=self.image_host['api_key'])
-        files = {}
-
-        file_descriptors = []
-        image_urls = []
-        totalsize = 0        
-        for img in self.image_files:
-            size = os.path.getsize(img)
-            # PTPIMG uses CloudFlare which has a 100mb upload limit, so we split into batches <100mb
-            # This limit can be hit with 4k files
-            if totalsize + size > 100000000:
-                # ptpimg does not retain filenames
-                print(f'Uploading {len(files)} images totaling {round(totalsize /1000000, 2)}mb')
-                resp = requests.post(url=ENDPOINT_PTPIMG, files=files, data=form_data)
-                assert resp.ok, f'PTPIMG returned status code {resp.status_code}'
-
-                resp_json = resp.json()
-                image_urls = image_urls + ['https://ptpimg.me/{}.png'.format(img['code']) for img in resp_json]
-                files = {}
-                totalsize = 0
-
-            fd = open(img, 'rb')
-            file_descriptors.append(fd)
-            files[ f'file-upload[{len(files)}]' ] = ('potatoes_boilem_mashem_ptpimg_dont_care', fd)
-            totalsize += size
-
-        if len(files) > 0:
-            # ptpimg does not retain filenames
-            print(f'Uploading {len(files)} images totaling {round(totalsize / 1000/1000, 2)}mb')
-            resp = requests.post(url=ENDPOINT_PTPIMG, files=files, data=form_data)
-            assert resp.ok, f'PTPIMG returned status code {resp.status_code}'
-
-            resp_json = resp.json()
-            image_urls = image_urls + ['https://ptpimg.me/{}.png'.format(img['code']) for img in resp_json]
-            files = {}
-
-        for direct_url in image_urls:
-            if Settings.use_bbcode_tags:
-                bbcoded_image_url = self.bbcoded_img_url_template.safe_substitute(
-                    direct_url=direct_url
-                )
-                self.formatted_urls += bbcoded_image_url + '\n'
+    def _get_reused_urls(self, image_hashes: list) -> list:
+        """
+        Looks up images uploaded by the unfinished previous run of the release, then images already uploaded to this
+        host within `upload_reuse_days`, checking concurrently that the latter's URLs are still reachable
+        :param image_hashes (list<str>): content hash of each image
+        :return list<tuple<str, str>|None>: direct URL and thumbnail URL (None if the host has none) of each image
+                that can be reused; None for images that need uploading
+        """
+        image_urls = [self._get_journaled_urls(image_hash) for image_hash in image_hashes]
+        reused = [i for i, urls in enumerate(image_urls) if urls is None]
+        for i in reused:
+            image_urls[i] = self._get_stored_urls(image_hashes[i])
+        reused = [i for i in reused if image_urls[i] is not None]
+        reachable = HttpClient.map(HttpClient.is_reachable, [image_urls[i][0] for i in reused])
+        for i, is_reachable in zip(reused, reachable):
+            if not is_reachable:
+                image_urls[i] = None
+        return image_urls
+
+    def _get_journaled_urls(self, image_hash: str):
+        """
+        :param image_hash (str): content hash of an image
+        :return tuple<str, str>: direct URL and thumbnail URL (None if the host has none) the image was uploaded to
+                by the unfinished previous run of the release; these are recent enough to be used unchecked.
+                None if there are none
+        """
+        if self.journal is None:
+            return None
+        journaled_urls = (self.journal.get('uploads') or {}).get(f'{self.image_host["name"]}|{image_hash}')
+        return None if journaled_urls is None else tuple(journaled_urls)
+
+    def _get_stored_urls(self, image_hash: str):
+        """
+        :param image_hash (str): content hash of an image
+        :return tuple<str, str>: direct URL and thumbnail URL (None if the host has none) the image was uploaded to
+                within `upload_reuse_days`; None if it was not, or reuse is turned off
+        """
+        reuse_seconds = Settings.advanced['upload_reuse_days'].get(self.image_host['name'], 0) * 24 * 60 * 60
+        if not reuse_seconds or not Cache.enabled:
+            return None
+
+        data = Cache.get_blob(f'upload|{self.image_host["name"]}|{image_hash}')
+        if data is None:
+            return None
+        upload = json.loads(data.decode())
+        if time.time() - upload['uploaded_at'] >= reuse_seconds:
+            return None
+        return upload['direct_url'], upload['thumb_url']
+
+    def _store_uploaded_urls(self, image, urls: tuple):
+        """
+        Records an image's URLs as soon as it is uploaded, so they are not lost if a later upload fails
+        :param image (str|io.BytesIO): the uploaded image
+        :param urls (tuple<str, str>): its direct URL and thumbnail URL (None if the host has none)
+        :return:
+        """
+        image_hash = self._get_image_hash(image)
+        if self.journal is not None:
+            self.journal.put_item('uploads', f'{self.image_host["name"]}|{image_hash}', urls)
+        if not Cache.enabled:
+            return
+        direct_url, thumb_url = urls
+        Cache.put_blob(f'upload|{self.image_host["name"]}|{image_hash}', json.dumps(
+            {'direct_url': direct_url, 'thumb_url': thumb_url, 'uploaded_at': time.time()}).encode())
+
+    def _upload_imgbb(self, images: list) -> list:
+        """
+        Uploads the images concurrently, each as a streamed binary file rather than base64
+        :param images (list<str|io.BytesIO>): images to upload
+        :return list<tuple<str, str>>: direct URL and thumbnail URL of each image, in the same order
+        """
+        return HttpClient.map(self._upload_imgbb_image, list(enumerate(images)))
+
+    def _upload_imgbb_image(self, numbered_image: tuple) -> tuple:
+        """
+        :param numbered_image (tuple<int, str|io.BytesIO>): number of the screenshot, and the image
+        :return tuple<str>: direct URL and thumbnail URL of the uploaded image
+        """
+        i, image = numbered_image
+        now = datetime.datetime.now().strftime('%Y-%m-%d %H-%M-%S')
+        form_data = dict(key=self.image_host['api_key'], name=f'{i}_snapshot {now}')
+
+        resp = HttpClient.post_multipart(ENDPOINT_IMGBB, form_data, [('image', Helper.get_image_name(image), image)])
+        assert resp.ok, f'IMGBB returned status code {resp.status_code}'
+        resp_json = resp.json()
+        urls = resp_json['data']['image']['url'], resp_json['data']['medium']['url']
+        self._store_uploaded_urls(image, urls)
+        return urls
+
+    def _upload_ptpimg(self, images: list) -> list:
+        """
+        Uploads the images in batches, concurrently; each batch retries on its own if it fails
+        :param images (list<str|io.BytesIO>): images to upload
+        :return list<tuple<str, None>>: direct URL of each image (ptpimg has no thumbnails), in the same order
+        """
+        batches = self._plan_ptpimg_batches([Helper.get_image_size(img) for img in images])
+        batch_urls = HttpClient.map(self._upload_ptpimg_batch, [[images[i] for i in batch] for batch in batches])
+
+        image_urls = [None] * len(images)
+        for batch, urls in zip(batches, batch_urls):
+            for i, direct_url in zip(batch, urls):
+                image_urls[i] = (direct_url, None)
+        return image_urls
+
+    def _upload_ptpimg_batch(self, batch: list) -> list:
+        """
+        :param batch (list<str|io.BytesIO>): images to upload together
+        :return list<str>: direct URLs of the uploaded images, in the same order as batch
+        """
+        # ptpimg does not retain filenames
+        files = [(f'file-upload[{i}]', 'potatoes_boilem_mashem_ptpimg_dont_care', img) for i, img in enumerate(batch)]
+        totalsize = sum(Helper.get_image_size(img) for img in batch)
+        print(f'Uploading {len(files)} images totaling {round(totalsize / 1000 / 1000, 2)}mb')
+
+        resp = HttpClient.post_multipart(ENDPOINT_PTPIMG, dict(api_key=self.image_host['api_key']), files)
+        assert resp.ok, f'PTPIMG returned status code {resp.status_code}'
+
+        resp_json = resp.json()
+        assert len(resp_json) == len(batch), f'PTPIMG returned {len(resp_json)} URLs for {len(batch)} images'
+        image_urls = ['https://ptpimg.me/{}.png'.format(img['code']) for img in resp_json]
+        for img, direct_url in zip(batch, image_urls):
+            self._store_uploaded_urls(img, (direct_url, None))
+        return image_urls
+
+    @staticmethod
+    def _plan_ptpimg_batches(sizes: list) -> list:
+        """
+        Packs images into as few upload batches as possible under ptpimg's upload size limit, by first-fit decreasing
+        :param sizes (list<int>): size in bytes of each image
+        :return list<list<int>>: indexes of the images in each batch, in their original order; an image over the limit
+                on its own gets a batch to itself
+        """
+        batches = []
+        batch_sizes = []
+        for i in sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True):
+            size = sizes[i] + PTPIMG_PART_OVERHEAD
+            for j, batch_size in enumerate(batch_sizes):
+                if batch_size + size <= PTPIMG_MAX_UPLOAD_SIZE:
+                    batches[j].append(i)
+                    batch_sizes[j] += size
+                    break
             else:
-                self.formatted_urls += direct_url + '\n'
-        [fd.close() for fd in file_descriptors]
+                batches.append([i])
+                batch_sizes.append(size)
+
+        return sorted(sorted(batch) for batch in batches)
 
     def _upload_hdbimg(self):
+        # hdbimg returns the URLs of a whole gallery pre-formatted, so only an identical set of images can be reused
+        gallery_hash = hashlib.sha256(''.join(Helper.get_image_hash(img) for img in self.image_files).encode())
+        gallery_key = f'upload|hdbimg|{gallery_hash.hexdigest()}'
+        reuse_seconds = Settings.advanced['upload_reuse_days'].get('hdbimg', 0) * 24 * 60 * 60
+        data = Cache.get_blob(gallery_key) if reuse_seconds and Cache.enabled else None
+        if data is not None:
+            upload = json.loads(data.decode())
+            if time.time() - upload['uploaded_at'] < reuse_seconds and \
+                    all(HttpClient.map(HttpClient.is_reachable, re.findall(URL_PATTERN, upload['formatted_urls']))):
+                print(f'Reusing {len(self.image_files)} previously uploaded images')
+                self.formatted_urls = upload['formatted_urls']
+                return
+
         # galleryoption == '0' indicates no new gallery will be created
         # galleryoption == '0' is not honored; new gallery is created regardless
         # galleryoption == '1' indicates new gallery will be created
@@ -123,15 +387,13 @@ class ImageUploader:
             galleryoption='1',
             galleryname=self.gallery_name
         )
-        files = {}
-
-        file_descriptors = [open(img, 'rb') for img in self.image_files]
-        for i, fd in enumerate(file_descriptors):
-            files[f'images_files[{i}]'] = (os.path.basename(self.image_files[i]), fd)
+        files = [(f'images_files[{i}]', Helper.get_image_name(img), img) for i, img in enumerate(self.image_files)]
 
-        resp = requests.post(url=ENDPOINT_HDBIMG, files=files, data=form_data)
+        resp = HttpClient.post_multipart(ENDPOINT_HDBIMG, form_data, files)
         assert resp.ok, f'HDBIMG returned status code {resp.status_code}'
 
         # image urls come pre-formatted for use within hdbits
         self.formatted_urls = resp.text
-        [fd.close() for fd in file_descriptors]
+        if Cache.enabled:
+            Cache.put_blob(gallery_key, json.dumps(
+                {'formatted_urls': self.formatted_urls, 'uploaded_at': time.time()}).encode())
@@ -0,0 +1,293 @@
+import os
+import struct
+import threading
+
+ISO_EXTS = ('.iso', '.ISO')
+SECTOR_SIZE = 2048
+
+# UDF (ECMA-167) descriptor tag identifiers
+UDF_ANCHOR_SECTOR = 256
+UDF_PARTITION_DESCRIPTOR = 5
+UDF_LOGICAL_VOLUME_DESCRIPTOR = 6
+UDF_TERMINATING_DESCRIPTOR = 8
+UDF_FILE_SET_DESCRIPTOR = 256
+UDF_FILE_IDENTIFIER_DESCRIPTOR = 257
+UDF_FILE_ENTRY = 261
+UDF_EXTENDED_FILE_ENTRY = 266
+UDF_AD_SHORT, UDF_AD_LONG, UDF_AD_EMBEDDED = 0, 1, 3
+
+# ISO 9660 primary volume descriptor
+ISO9660_PVD_SECTOR = 16
+ISO9660_DIRECTORY_FLAG = 0x02
+
+
+class IsoImageError(ValueError):
+    pass
+
+
+class IsoImage:
+    """
+    Reads the directory tree of a DVD disc image (UDF, or ISO 9660 for images without UDF) to locate the byte
+    ranges of the files within it, so they can be read in place rather than extracted. Use IsoImage.open() rather
+    than the constructor so the tree of an image is only read once
+    """
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, iso_path: str):
+        """
+        :param iso_path (str): path of the disc image
+        """
+        self.iso_path = iso_path
+        # upper-cased path within the image -> (name, size, list of (byte offset, byte length) extents)
+        self.files = {}
+        with open(iso_path, 'rb') as f:
+            self._f = f
+            try:
+                self._read_udf()
+            except (IsoImageError, struct.error):
+                self.files = {}
+                self._read_iso9660()
+        self._f = None
+
+    @classmethod
+    def open(cls, iso_path: str) -> 'IsoImage':
+        """
+        Gets the shared reader for a disc image, reading its directory tree on first use
+        :param iso_path (str): path of the disc image
+        :return IsoImage:
+        """
+        key = os.path.abspath(iso_path)
+        with cls._registry_lock:
+            image = cls._registry.get(key)
+            if image is None:
+                image = cls._registry[key] = cls(key)
+        return image
+
+    @staticmethod
+    def split_path(path: str):
+        """
+        Paths of files inside a disc image are the image's path followed by the path within the image,
+        eg. /media/disc.iso/VIDEO_TS/VTS_01_1.VOB
+        :param path (str): any file path
+        :return tuple<str, str>: path of the image file and path within the image ('/'-separated, no leading '/'),
+                or None if the path is not inside a disc image
+        """
+        if os.path.exists(path):
+            return None
+
+        parent = os.path.abspath(path)
+        inner_parts = []
+        while True:
+            if parent.endswith(ISO_EXTS) and os.path.isfile(parent):
+                return (parent, '/'.join(reversed(inner_parts))) if inner_parts else None
+            parent, name = os.path.split(parent)
+            if not name:
+                return None
+            inner_parts.append(name)
+
+    @classmethod
+    def get_ffmpeg_input(cls, path: str) -> str:
+        """
+        :param path (str): path of a video file, possibly inside a disc image
+        :return str: ffmpeg input for the file; files inside an image are read in place through ffmpeg's
+                subfile protocol
+        """
+        iso_path = cls.split_path(path)
+        if iso_path is None:
+            return path
+        offset, size = cls.open(iso_path[0]).get_extent(iso_path[1])
+        return f'subfile,,start,{offset},end,{offset + size},,:{iso_path[0]}'
+
+    def list_dir(self, inner_path: str) -> dict:
+        """
+        :param inner_path (str): folder within the image, eg. 'VIDEO_TS'
+        :return dict<str, int>: file name -> size in bytes, for every file directly in the folder
+        """
+        prefix = inner_path.strip('/').upper() + '/'
+        return {name: size for path, (name, size, _) in self.files.items()
+                if path.startswith(prefix) and '/' not in path[len(prefix):]}
+
+    def is_dir(self, inner_path: str) -> bool:
+        """
+        :param inner_path (str): folder within the image
+        :return bool: True if the folder exists and holds any files
+        """
+        prefix = inner_path.strip('/').upper() + '/'
+        return any(path.startswith(prefix) for path in self.files)
+
+    def get_extent(self, inner_path: str) -> tuple:
+        """
+        :param inner_path (str): file within the image
+        :return tuple<int, int>: byte offset of the file within the image, and its size
+        """
+        _, size, extents = self._get_file(inner_path)
+        offset = extents[0][0] if extents else 0
+        if any(extent_offset != offset + sum(length for _, length in extents[:i])
+               for i, (extent_offset, _) in enumerate(extents)):
+            raise IsoImageError(f'{inner_path} is fragmented within {self.iso_path}')
+        return offset, size
+
+    def read_file(self, inner_path: str) -> bytes:
+        """
+        :param inner_path (str): file within the image
+        :return bytes: content of the file
+        """
+        _, size, extents = self._get_file(inner_path)
+        chunks = []
+        with open(self.iso_path, 'rb') as f:
+            for offset, length in extents:
+                f.seek(offset)
+                chunks.append(f.read(length))
+        return b''.join(chunks)[:size]
+
+    def _get_file(self, inner_path: str) -> tuple:
+        try:
+            return self.files[inner_path.strip('/').upper()]
+        except KeyError:
+            raise IsoImageError(f'{inner_path} not found in {self.iso_path}') from None
+
+    def _read_sector(self, sector: int, count: int = 1) -> bytes:
+        self._f.seek(sector * SECTOR_SIZE)
+        data = self._f.read(count * SECTOR_SIZE)
+        if len(data) < count * SECTOR_SIZE:
+            raise IsoImageError(f'{self.iso_path} is truncated')
+        return data
+
+    def _read_udf(self):
+        anchor = self._read_sector(UDF_ANCHOR_SECTOR)
+        if self._u16(anchor, 0) != 2:
+            raise IsoImageError('No UDF anchor volume descriptor')
+        sequence_length, sequence_sector = struct.unpack_from('<II', anchor, 16)
+
+        partition_start = file_set_block = None
+        for sector in range(sequence_sector, sequence_sector + sequence_length // SECTOR_SIZE):
+            descriptor = self._read_sector(sector)
+            tag = self._u16(descriptor, 0)
+            if tag == UDF_PARTITION_DESCRIPTOR:
+                partition_start = self._u32(descriptor, 188)
+            elif tag == UDF_LOGICAL_VOLUME_DESCRIPTOR:
+                if self._u32(descriptor, 212) != SECTOR_SIZE:
+                    raise IsoImageError('Unsupported UDF logical block size')
+                file_set_block = self._u32(descriptor, 252)
+            elif tag == UDF_TERMINATING_DESCRIPTOR:
+                break
+        if partition_start is None or file_set_block is None:
+            raise IsoImageError('Incomplete UDF volume descriptor sequence')
+        self._partition_start = partition_start
+
+        file_set = self._read_sector(partition_start + file_set_block)
+        if self._u16(file_set, 0) != UDF_FILE_SET_DESCRIPTOR:
+            raise IsoImageError('No UDF file set descriptor')
+        self._read_udf_directory(self._u32(file_set, 404), '')
+
+    def _read_udf_directory(self, icb_block: int, parent_path: str):
+        directory = self._read_udf_file_data(icb_block)
+        offset = 0
+        while offset + 38 <= len(directory):
+            if self._u16(directory, offset) != UDF_FILE_IDENTIFIER_DESCRIPTOR:
+                raise IsoImageError('Invalid UDF file identifier descriptor')
+            characteristics = directory[offset + 18]
+            identifier_length = directory[offset + 19]
+            child_block = self._u32(directory, offset + 24)
+            implementation_length = self._u16(directory, offset + 36)
+            identifier_start = offset + 38 + implementation_length
+            identifier = directory[identifier_start:identifier_start + identifier_length]
+            offset += (38 + implementation_length + identifier_length + 3) & ~3
+
+            # skip the parent entry and deleted files
+            if characteristics & 0x08 or characteristics & 0x04 or not identifier:
+                continue
+            name = self._decode_udf_name(identifier)
+            path = f'{parent_path}{name}'
+            if characteristics & 0x02:
+                self._read_udf_directory(child_block, path + '/')
+            else:
+                size, extents = self._read_udf_file_entry(child_block)
+                self.files[path.upper()] = (name, size, extents)
+
+    def _read_udf_file_data(self, icb_block: int) -> bytes:
+        size, extents = self._read_udf_file_entry(icb_block)
+        data = b''
+        for offset, length in extents:
+            self._f.seek(offset)
+            data += self._f.read(length)
+        return data[:size]
+
+    def _read_udf_file_entry(self, icb_block: int) -> tuple:
+        """
+        :param icb_block (int): logical block of the file entry, within the partition
+        :return tuple: file size, list of (byte offset, byte length) extents within the image
+        """
+        sector = self._partition_start + icb_block
+        entry = self._read_sector(sector)
+        tag = self._u16(entry, 0)
+        if tag == UDF_FILE_ENTRY:
+            descriptors_start, extended_attributes_length, descriptors_length = 176, *struct.unpack_from('<II', entry, 168)
+        elif tag == UDF_EXTENDED_FILE_ENTRY:
+            descriptors_start, extended_attributes_length, descriptors_length = 216, *struct.unpack_from('<II', entry, 208)
+        else:
+            raise IsoImageError('Invalid UDF file entry')
+
+        size = struct.unpack_from('<Q', entry, 56)[0]
+        descriptors_start += extended_attributes_length
+        descriptor_type = self._u16(entry, 34) & 0x07
+        if descriptor_type == UDF_AD_EMBEDDED:
+            return size, [(sector * SECTOR_SIZE + descriptors_start, size)]
+
+        descriptor_size = {UDF_AD_SHORT: 8, UDF_AD_LONG: 16}.get(descriptor_type)
+        if descriptor_size is None:
+            raise IsoImageError('Unsupported UDF allocation descriptor type')
+        extents = []
+        for offset in range(descriptors_start, descriptors_start + descriptors_length, descriptor_size):
+            length, block = struct.unpack_from('<II', entry, offset)
+            # the top two bits of the length are the extent type; 0 is recorded and allocated
+            if length >> 30 == 0 and length & 0x3FFFFFFF:
+                extents.append(((self._partition_start + block) * SECTOR_SIZE, length & 0x3FFFFFFF))
+        return size, extents
+
+    @staticmethod
+    def _decode_udf_name(identifier: bytes) -> str:
+        if identifier[0] == 16:
+            return identifier[1:].decode('utf-16-be')
+        return identifier[1:].decode('latin-1')
+
+    def _read_iso9660(self):
+        descriptor = self._read_sector(ISO9660_PVD_SECTOR)
+        if descriptor[1:6] != b'CD001' or descriptor[0] != 1:
+            raise IsoImageError(f'{self.iso_path} is neither a UDF nor an ISO 9660 image')
+        root_sector, root_length = struct.unpack_from('<I4xI', descriptor, 156 + 2)
+        self._read_iso9660_directory(root_sector, root_length, '')
+
+    def _read_iso9660_directory(self, sector: int, length: int, parent_path: str):
+        directory = self._read_sector(sector, (length + SECTOR_SIZE - 1) // SECTOR_SIZE)
+        offset = 0
+        while offset < length:
+            record_length = directory[offset]
+            if record_length == 0:
+                # records do not cross sector boundaries; the rest of this sector is padding
+                offset = (offset // SECTOR_SIZE + 1) * SECTOR_SIZE
+                continue
+            extent_sector, extent_length = struct.unpack_from('<I4xI', directory, offset + 2)
+            flags = directory[offset + 25]
+            name_length = directory[offset + 32]
+            raw_name = directory[offset + 33:offset + 33 + name_length]
+            offset += record_length
+
+            # skip the '.' and '..' entries
+            if raw_name in (b'\x00', b'\x01'):
+                continue
+            name = raw_name.decode('latin-1').split(';')[0].rstrip('.')
+            path = f'{parent_path}{name}'
+            if flags & ISO9660_DIRECTORY_FLAG:
+                self._read_iso9660_directory(extent_sector, extent_length, path + '/')
+            else:
+                self.files[path.upper()] = (name, extent_length, [(extent_sector * SECTOR_SIZE, extent_length)])
+
+    @staticmethod
+    def _u16(data: bytes, offset: int) -> int:
+        return struct.unpack_from('<H', data, offset)[0]
+
+    @staticmethod
+    def _u32(data: bytes, offset: int) -> int:
+        return struct.unpack_from('<I', data, offset)[0]
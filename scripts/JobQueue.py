@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import threading
+import time
+
+from Settings import Settings
+
+# times a job is started again after the process stopped while running it, before it is marked as failed
+MAX_ATTEMPTS = 3
+
+
+class JobQueue:
+    """
+    Persistent queue of releases for the watch-folder daemon. Every change is committed to SQLite straight away,
+    so queued jobs survive a crash or restart, and jobs that were running at the time are picked up again
+    """
+    queue_file_name = 'ReleaseInfoCreator.queue.sqlite'
+    queue_file_path = os.path.join(os.path.dirname(Settings.settings_file_path), queue_file_name)
+
+    _connection = None
+    _lock = threading.RLock()
+
+    @classmethod
+    def add(cls, input_path: str, signature: str) -> bool:
+        """
+        Queues a release, unless it was already queued in this state
+        :param input_path (str): absolute path of the release
+        :param signature (str): identifies the release's current contents (eg. sizes and mtimes), so a release
+                that is replaced is queued again
+        :return bool: True if a new job was queued
+        """
+        with cls._lock:
+            connection = cls._connect()
+            cursor = connection.execute('INSERT OR IGNORE INTO jobs (input_path, signature, state, queued_at) '
+                                        'VALUES (?, ?, ?, ?)', (input_path, signature, 'queued', time.time()))
+            connection.commit()
+            return cursor.rowcount > 0
+
+    @classmethod
+    def requeue_interrupted(cls) -> int:
+        """
+        Queues the jobs that were running when the process last stopped again; those that have already been
+        started MAX_ATTEMPTS times are marked as failed instead
+        :return int: number of jobs queued again
+        """
+        with cls._lock:
+            connection = cls._connect()
+            connection.execute("UPDATE jobs SET state = 'failed', finished_at = ?, error = ? "
+                               "WHERE state = 'running' AND attempts >= ?",
+                               (time.time(), f'Interrupted {MAX_ATTEMPTS} times', MAX_ATTEMPTS))
+            cursor = connection.execute("UPDATE jobs SET state = 'queued' WHERE state = 'running'")
+            connection.commit()
+            return cursor.rowcount
+
+    @classmethod
+    def claim(cls):
+        """
+        Takes the oldest queued job and marks it as running
+        :return tuple<int, str>: job id and input path; None if the queue is empty
+        """
+        with cls._lock:
+            connection = cls._connect()
+            row = connection.execute("SELECT id, input_path FROM jobs WHERE state = 'queued' "
+                                     "ORDER BY queued_at, id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE jobs SET state = 'running', started_at = ?, attempts = attempts + 1 "
+                               "WHERE id = ?", (time.time(), row[0]))
+            connection.commit()
+            return row
+
+    @classmethod
+    def finish(cls, job_id: int, error: str = None):
+        """
+        :param job_id (int): id of a running job
+        :param error (str): why the job failed; None if it succeeded
+        :return:
+        """
+        with cls._lock:
+            connection = cls._connect()
+            connection.execute('UPDATE jobs SET state = ?, finished_at = ?, error = ? WHERE id = ?',
+                               ('done' if error is None else 'failed', time.time(), error, job_id))
+            connection.commit()
+
+    @classmethod
+    def get_counts(cls) -> dict:
+        """
+        :return dict<str, int>: number of jobs in each state ('queued', 'running', 'done', 'failed')
+        """
+        with cls._lock:
+            rows = cls._connect().execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        return {'queued': 0, 'running': 0, 'done': 0, 'failed': 0, **dict(rows)}
+
+    @classmethod
+    def _connect(cls) -> sqlite3.Connection:
+        """
+        Opens the queue database on first use
+        :return sqlite3.Connection:
+        """
+        with cls._lock:
+            if cls._connection is None:
+                cls._connection = sqlite3.connect(cls.queue_file_path, check_same_thread=False)
+                # the write-ahead log keeps the queue intact if the process is killed mid-write
+                cls._connection.execute('PRAGMA journal_mode=WAL')
+                cls._connection.execute('PRAGMA synchronous=FULL')
+                cls._connection.execute('CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                        'input_path TEXT NOT NULL, signature TEXT NOT NULL, state TEXT NOT NULL, '
+                                        'attempts INTEGER NOT NULL DEFAULT 0, queued_at REAL NOT NULL, '
+                                        'started_at REAL, finished_at REAL, error TEXT, '
+                                        'UNIQUE (input_path, signature))')
+                cls._connection.commit()
+            return cls._connection
@@ -0,0 +1,149 @@
+import concurrent.futures
+import os
+import threading
+
+from Settings import Settings
+
+# memory an ffmpeg process needs regardless of the frames it decodes
+FFMPEG_BASE_MEMORY = 64 * 1024 * 1024
+# decoded frames a decoder typically holds at once (reference frames plus frames in flight)
+DECODER_FRAMES_IN_FLIGHT = 20
+
+
+def estimate_decode_memory(width: int, height: int, bit_depth: int = 8) -> int:
+    """
+    Rough memory cost of decoding (and converting to RGB) one input of a video of the given size
+    :param width (int): frame width in pixels
+    :param height (int): frame height in pixels
+    :param bit_depth (int): bits per sample; anything above 8 is stored as 16 bits
+    :return int: bytes
+    """
+    bytes_per_sample = 1 if bit_depth <= 8 else 2
+    # 4:2:0 frames are 1.5 samples per pixel; converted rgb24 output adds 3 bytes per pixel
+    frame_bytes = width * height * (1.5 * bytes_per_sample + 3)
+    return FFMPEG_BASE_MEMORY + int(frame_bytes * DECODER_FRAMES_IN_FLIGHT)
+
+
+def estimate_image_memory(width: int, height: int) -> int:
+    """
+    Rough memory cost of an image optimiser working on an RGB image of the given size
+    :return int: bytes
+    """
+    return width * height * 3 * 4
+
+
+class JobScheduler:
+    """
+    Runs external tools (ffmpeg, oxipng) with bounded concurrency. The number of jobs running at once, across all
+    callers, is capped by the CPU core count and by an estimate of each job's memory use against the available
+    memory; the remaining jobs wait in a queue. Each job is told how many threads it may use, so the running jobs
+    together do not oversubscribe the CPU
+    """
+    _condition = threading.Condition()
+    _running_jobs = 0
+    _running_memory = 0
+
+    @classmethod
+    def run(cls, starters: list, memory_per_job: int = 0) -> list:
+        """
+        Runs jobs and waits for all of them to finish
+        :param starters (list<callable>): one per job; takes the number of threads the job may use,
+                starts the job's process and returns it (subprocess.Popen)
+        :param memory_per_job (int): estimated bytes of memory each job needs
+        :return list<int>: exit code of each job, in the same order as starters
+        """
+        return [returncode for returncode, _, _ in cls._run(starters, memory_per_job)]
+
+    @classmethod
+    def run_for_output(cls, starters: list, memory_per_job: int = 0, inputs: list = None) -> list:
+        """
+        Runs jobs whose processes were started with stdout=subprocess.PIPE, and collects their output
+        :param starters (list<callable>): see run()
+        :param memory_per_job (int): estimated bytes of memory each job needs
+        :param inputs (list<bytes>): data to send to each job's stdin (started with stdin=subprocess.PIPE)
+        :return list<bytes>: standard output of each job, in the same order as starters
+        """
+        return [stdout for _, stdout, _ in cls._run(starters, memory_per_job, inputs)]
+
+    @classmethod
+    def run_for_streams(cls, starters: list, memory_per_job: int = 0) -> list:
+        """
+        Runs jobs whose processes were started with both stdout and stderr set to subprocess.PIPE
+        :param starters (list<callable>): see run()
+        :param memory_per_job (int): estimated bytes of memory each job needs
+        :return list<tuple<bytes, bytes>>: standard output and standard error of each job, in the same order as starters
+        """
+        return [(stdout, stderr) for _, stdout, stderr in cls._run(starters, memory_per_job)]
+
+    @classmethod
+    def _run(cls, starters: list, memory_per_job: int, inputs: list = None) -> list:
+        """
+        :return list<tuple<int, bytes, bytes>>: exit code, standard output and standard error (None if not piped)
+                of each job
+        """
+        if not starters:
+            return []
+
+        max_jobs = cls.get_max_jobs()
+        memory_limit = cls._get_memory_limit()
+        n_slots = min(max_jobs, len(starters))
+        threads_per_job = max(1, (os.cpu_count() or 1) // n_slots)
+
+        def run_job(starter, stdin_data):
+            cls._acquire(memory_per_job, max_jobs, memory_limit)
+            try:
+                proc = starter(threads_per_job)
+                stdout, stderr = proc.communicate(stdin_data)
+                return proc.returncode, stdout, stderr
+            finally:
+                cls._release(memory_per_job)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n_slots) as executor:
+            return list(executor.map(run_job, starters, inputs or [None] * len(starters)))
+
+    @staticmethod
+    def get_max_jobs() -> int:
+        """
+        :return int: most jobs allowed to run at once, from `max_parallel_jobs` (0 means one per CPU core)
+        """
+        return Settings.advanced['max_parallel_jobs'] or os.cpu_count() or 1
+
+    @classmethod
+    def _acquire(cls, memory: int, max_jobs: int, memory_limit: float):
+        """
+        Waits until a job slot is free and the job's memory fits in the memory budget. A job is always let through
+        when nothing else is running, so a job larger than the whole budget still runs (alone)
+        """
+        with cls._condition:
+            cls._condition.wait_for(lambda: cls._running_jobs == 0 or (
+                    cls._running_jobs < max_jobs and cls._running_memory + memory <= memory_limit))
+            cls._running_jobs += 1
+            cls._running_memory += memory
+
+    @classmethod
+    def _release(cls, memory: int):
+        with cls._condition:
+            cls._running_jobs -= 1
+            cls._running_memory -= memory
+            cls._condition.notify_all()
+
+    @staticmethod
+    def _get_memory_limit() -> float:
+        """
+        :return float: bytes of memory jobs may use in total; `job_memory_limit_mb`, or if that is 0, three quarters
+                of the memory currently available (unlimited if that cannot be determined)
+        """
+        if Settings.advanced['job_memory_limit_mb']:
+            return Settings.advanced['job_memory_limit_mb'] * 1024 * 1024
+
+        try:
+            with open('/proc/meminfo', 'r') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) * 1024 * 0.75
+        except OSError:
+            pass
+        try:
+            return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') * 0.75
+        except (AttributeError, ValueError, OSError):
+            return float('inf')
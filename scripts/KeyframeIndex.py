@@ -0,0 +1,379 @@
+import os
+import struct
+
+from Cache import Cache
+
+MATROSKA_EXTS = ('.mkv', '.MKV', '.webm')
+MP4_EXTS = ('.mp4', '.MP4', '.m4v', '.mov')
+
+# Matroska element IDs
+EBML_ID = 0x1A45DFA3
+SEGMENT_ID = 0x18538067
+SEEK_HEAD_ID = 0x114D9B74
+SEEK_ID = 0x4DBB
+SEEK_ID_ID = 0x53AB
+SEEK_POSITION_ID = 0x53AC
+INFO_ID = 0x1549A966
+TIMECODE_SCALE_ID = 0x2AD7B1
+TRACKS_ID = 0x1654AE6B
+TRACK_ENTRY_ID = 0xAE
+TRACK_NUMBER_ID = 0xD7
+TRACK_TYPE_ID = 0x83
+CUES_ID = 0x1C53BB6B
+CUE_POINT_ID = 0xBB
+CUE_TIME_ID = 0xB3
+CUE_TRACK_POSITIONS_ID = 0xB7
+CUE_TRACK_ID = 0xF7
+CLUSTER_ID = 0x1F43B675
+MATROSKA_VIDEO_TRACK_TYPE = 1
+
+
+class KeyframeIndexError(ValueError):
+    pass
+
+
+def get_keyframes(video_file: str) -> list:
+    """
+    Gets the keyframe timestamps of a video file's main video track, from the container's index (Matroska Cues,
+    or the MP4 sync sample table). Nothing is decoded, and only the index itself is read from the file
+    :param video_file (str): path to video file
+    :return list<float>: keyframe timestamps in seconds, sorted; empty if the container or its index is unsupported
+    """
+    keyframes = Cache.get_json('keyframes', video_file)
+    if keyframes is not None:
+        return keyframes
+
+    try:
+        with open(video_file, 'rb') as f:
+            if video_file.endswith(MATROSKA_EXTS):
+                keyframes = MatroskaIndexReader(f).read_keyframes()
+            elif video_file.endswith(MP4_EXTS):
+                keyframes = Mp4IndexReader(f).read_keyframes()
+            else:
+                keyframes = []
+    except (KeyframeIndexError, OSError, struct.error, IndexError):
+        keyframes = []
+
+    keyframes = sorted(set(keyframes))
+    Cache.put_json('keyframes', video_file, keyframes)
+    return keyframes
+
+
+def snap_to_keyframe(keyframes: list, timestamp: float, window_start: float, window_end: float) -> float:
+    """
+    Moves a timestamp onto the nearest keyframe within a window; seeking to a keyframe needs only that one frame
+    decoded, while any other timestamp needs everything from the previous keyframe decoded first
+    :param keyframes (list<float>): sorted keyframe timestamps
+    :param timestamp (float): planned timestamp
+    :param window_start (float): earliest acceptable timestamp
+    :param window_end (float): latest acceptable timestamp
+    :return float: the nearest keyframe in the window, or the unchanged timestamp if there is none
+    """
+    candidates = [keyframe for keyframe in keyframes if window_start <= keyframe <= window_end]
+    if not candidates:
+        return timestamp
+    return min(candidates, key=lambda keyframe: abs(keyframe - timestamp))
+
+
+class MatroskaIndexReader:
+    """
+    Reads keyframe times from a Matroska file's Cues, located through the SeekHead (or by stepping over the
+    Segment's top-level elements when there is none)
+    """
+
+    def __init__(self, f):
+        """
+        :param f: binary file object of the Matroska file
+        """
+        self.f = f
+        self.file_size = os.fstat(f.fileno()).st_size
+
+    def read_keyframes(self) -> list:
+        element_id, size, data_start = self._read_element_header(0)
+        if element_id != EBML_ID or size is None:
+            raise KeyframeIndexError('Not a Matroska file')
+        element_id, segment_size, segment_start = self._read_element_header(data_start + size)
+        if element_id != SEGMENT_ID:
+            raise KeyframeIndexError('Matroska Segment not found')
+
+        positions = self._find_top_level_elements(segment_start, segment_size)
+        if CUES_ID not in positions:
+            raise KeyframeIndexError('Matroska file has no Cues')
+
+        timecode_scale = 1000000
+        if INFO_ID in positions:
+            info = self._read_children(positions[INFO_ID])
+            timecode_scale = self._read_uint(info.get(TIMECODE_SCALE_ID, [b''])[0]) or timecode_scale
+
+        video_track = None
+        if TRACKS_ID in positions:
+            for track_entry in self._read_children(positions[TRACKS_ID]).get(TRACK_ENTRY_ID, []):
+                track = self._parse_children(track_entry)
+                if self._read_uint(track.get(TRACK_TYPE_ID, [b''])[0]) == MATROSKA_VIDEO_TRACK_TYPE:
+                    video_track = self._read_uint(self._get_required(track, TRACK_NUMBER_ID))
+                    break
+
+        keyframes = []
+        for cue_point in self._read_children(positions[CUES_ID]).get(CUE_POINT_ID, []):
+            cue = self._parse_children(cue_point)
+            cue_tracks = [self._read_uint(self._parse_children(positions_data).get(CUE_TRACK_ID, [b''])[0])
+                          for positions_data in cue.get(CUE_TRACK_POSITIONS_ID, [])]
+            if video_track is None or video_track in cue_tracks:
+                keyframes.append(self._read_uint(self._get_required(cue, CUE_TIME_ID)) * timecode_scale / 1e9)
+        return keyframes
+
+    def _find_top_level_elements(self, segment_start: int, segment_size: int) -> dict:
+        """
+        :return dict<int, int>: element ID -> file offset of the Info, Tracks and Cues elements
+        """
+        positions = {}
+        element_id, size, data_start = self._read_element_header(segment_start)
+        if element_id == SEEK_HEAD_ID:
+            for seek in self._read_children(segment_start).get(SEEK_ID, []):
+                seek_entry = self._parse_children(seek)
+                target_id = self._read_uint(self._get_required(seek_entry, SEEK_ID_ID))
+                positions[target_id] = segment_start + self._read_uint(self._get_required(seek_entry,
+                                                                                          SEEK_POSITION_ID))
+            if CUES_ID in positions:
+                return positions
+
+        # no SeekHead (or no Cues in it); step over the top-level elements, reading only their headers
+        segment_end = self.file_size if segment_size is None else min(segment_start + segment_size, self.file_size)
+        offset = segment_start
+        while offset < segment_end:
+            element_id, size, data_start = self._read_element_header(offset)
+            if size is None:
+                break
+            positions.setdefault(element_id, offset)
+            offset = data_start + size
+        return positions
+
+    def _read_children(self, offset: int) -> dict:
+        """
+        :param offset (int): file offset of a master element
+        :return dict<int, list<bytes>>: child element ID -> data of each child with that ID
+        """
+        element_id, size, data_start = self._read_element_header(offset)
+        if size is None:
+            raise KeyframeIndexError(f'Matroska element {element_id:X} has unknown size')
+        self.f.seek(data_start)
+        return self._parse_children(self.f.read(size))
+
+    @staticmethod
+    def _get_required(children: dict, element_id: int) -> bytes:
+        """
+        :param children (dict<int, list<bytes>>): see _parse_children()
+        :param element_id (int): ID of a child element the parent must have
+        :return bytes: data of the first child with that ID
+        """
+        if element_id not in children:
+            raise KeyframeIndexError(f'Matroska element {element_id:X} is missing')
+        return children[element_id][0]
+
+    @classmethod
+    def _parse_children(cls, data: bytes) -> dict:
+        children = {}
+        offset = 0
+        while offset < len(data):
+            element_id, offset = cls._read_vint(data, offset, keep_marker=True)
+            size, offset = cls._read_vint(data, offset)
+            children.setdefault(element_id, []).append(data[offset:offset + size])
+            offset += size
+        return children
+
+    def _read_element_header(self, offset: int) -> tuple:
+        """
+        :return tuple: element ID, data size (None if unknown), file offset of the data
+        """
+        self.f.seek(offset)
+        header = self.f.read(12)
+        element_id, header_offset = self._read_vint(header, 0, keep_marker=True)
+        size_length = self._get_vint_length(header[header_offset])
+        size, header_offset = self._read_vint(header, header_offset)
+        if size == (1 << (7 * size_length)) - 1:
+            size = None
+        return element_id, size, offset + header_offset
+
+    @staticmethod
+    def _get_vint_length(first_byte: int) -> int:
+        for length in range(1, 9):
+            if first_byte & (0x80 >> (length - 1)):
+                return length
+        raise KeyframeIndexError('Invalid EBML variable-length integer')
+
+    @classmethod
+    def _read_vint(cls, data: bytes, offset: int, keep_marker: bool = False) -> tuple:
+        """
+        :param keep_marker (bool): keep the length marker bit, as element IDs do
+        :return tuple: the integer, offset just after it
+        """
+        length = cls._get_vint_length(data[offset])
+        value = data[offset] if keep_marker else data[offset] & (0xFF >> length)
+        for byte in data[offset + 1:offset + length]:
+            value = (value << 8) | byte
+        return value, offset + length
+
+    @staticmethod
+    def _read_uint(data: bytes) -> int:
+        return int.from_bytes(data, 'big')
+
+
+class Mp4IndexReader:
+    """
+    Reads keyframe times of an MP4/MOV file's first video track from its sample tables: the sync samples (stss),
+    sample durations (stts), composition offsets (ctts) and the edit list (elst)
+    """
+
+    def __init__(self, f):
+        """
+        :param f: binary file object of the MP4 file
+        """
+        self.f = f
+        self.file_size = os.fstat(f.fileno()).st_size
+
+    def read_keyframes(self) -> list:
+        moov = self._find_box(0, self.file_size, b'moov', read=True)
+        if moov is None:
+            raise KeyframeIndexError('MP4 file has no moov box')
+
+        for trak in self._iter_boxes(moov, b'trak'):
+            mdia = self._get_box(trak, b'mdia')
+            hdlr = self._get_box(mdia, b'hdlr')
+            if hdlr is None or hdlr[8:12] != b'vide':
+                continue
+
+            mdhd = self._get_required_box(mdia, b'mdhd')
+            timescale = struct.unpack_from('>I', mdhd, 20 if mdhd[0] == 1 else 12)[0]
+            if not timescale:
+                raise KeyframeIndexError('MP4 video track has no timescale')
+            stbl = self._get_required_box(self._get_required_box(mdia, b'minf'), b'stbl')
+            stss = self._get_box(stbl, b'stss')
+            if stss is None:
+                # every sample is a sync sample; keyframes give nothing to snap to
+                return []
+
+            sync_samples = struct.unpack_from(f'>{struct.unpack_from(">I", stss, 4)[0]}I', stss, 8)
+            if not sync_samples:
+                raise KeyframeIndexError('MP4 video track has no sync samples')
+            decode_times = self._get_decode_times(self._get_required_box(stbl, b'stts'), max(sync_samples))
+            composition_offsets = self._get_composition_offsets(self._get_box(stbl, b'ctts'), max(sync_samples))
+            media_start = self._get_edit_media_start(trak)
+
+            return [(decode_times[n - 1] + composition_offsets.get(n, 0) - media_start) / timescale
+                    for n in sync_samples]
+        raise KeyframeIndexError('MP4 file has no video track')
+
+    @staticmethod
+    def _get_decode_times(stts: bytes, n_samples: int) -> list:
+        decode_times = []
+        current_time = 0
+        for i in range(struct.unpack_from('>I', stts, 4)[0]):
+            count, delta = struct.unpack_from('>II', stts, 8 + i * 8)
+            for _ in range(min(count, n_samples - len(decode_times))):
+                decode_times.append(current_time)
+                current_time += delta
+            if len(decode_times) >= n_samples:
+                break
+        return decode_times
+
+    @staticmethod
+    def _get_composition_offsets(ctts: bytes, n_samples: int) -> dict:
+        """
+        :return dict<int, int>: 1-based sample number -> composition offset, for samples with a non-zero offset
+        """
+        offsets = {}
+        if ctts is None:
+            return offsets
+        # version 1 offsets are signed
+        offset_format = '>Ii' if ctts[0] == 1 else '>II'
+        sample = 1
+        for i in range(struct.unpack_from('>I', ctts, 4)[0]):
+            count, offset = struct.unpack_from(offset_format, ctts, 8 + i * 8)
+            if offset:
+                for n in range(sample, min(sample + count, n_samples + 1)):
+                    offsets[n] = offset
+            sample += count
+            if sample > n_samples:
+                break
+        return offsets
+
+    def _get_edit_media_start(self, trak: bytes) -> int:
+        """
+        :return int: media time (in the track's timescale) at which presentation starts, from the first
+                non-empty edit of the track's edit list
+        """
+        edts = self._get_box(trak, b'edts')
+        elst = self._get_box(edts, b'elst') if edts is not None else None
+        if elst is None:
+            return 0
+
+        version = elst[0]
+        entry_format, entry_size = ('>QqHH', 20) if version == 1 else ('>IiHH', 12)
+        for i in range(struct.unpack_from('>I', elst, 4)[0]):
+            _, media_time, _, _ = struct.unpack_from(entry_format, elst, 8 + i * entry_size)
+            if media_time >= 0:
+                return media_time
+        return 0
+
+    def _find_box(self, start: int, end: int, box_type: bytes, read: bool = False):
+        """
+        Finds a top-level box by reading only box headers
+        :return bytes: the box's payload
+        """
+        offset = start
+        while offset + 8 <= end:
+            self.f.seek(offset)
+            size, current_type = struct.unpack('>I4s', self.f.read(8))
+            header_size = 8
+            if size == 1:
+                size = struct.unpack('>Q', self.f.read(8))[0]
+                header_size = 16
+            elif size == 0:
+                size = end - offset
+            if size < header_size:
+                raise KeyframeIndexError('Invalid MP4 box size')
+            if current_type == box_type:
+                return self.f.read(size - header_size)
+            offset += size
+        return None
+
+    @classmethod
+    def _iter_boxes(cls, data: bytes, box_type: bytes = None):
+        """
+        :param data (bytes): payload of a container box
+        :param box_type (bytes): only yield boxes of this type
+        :return generator<bytes>: payloads of the child boxes
+        """
+        offset = 0
+        while offset + 8 <= len(data):
+            size, current_type = struct.unpack_from('>I4s', data, offset)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from('>Q', data, offset + 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = len(data) - offset
+            if size < header_size:
+                raise KeyframeIndexError('Invalid MP4 box size')
+            if box_type is None or current_type == box_type:
+                yield data[offset + header_size:offset + size]
+            offset += size
+
+    @classmethod
+    def _get_box(cls, data: bytes, box_type: bytes):
+        """
+        :return bytes: payload of the first child box of the given type, or None
+        """
+        if data is None:
+            return None
+        return next(cls._iter_boxes(data, box_type), None)
+
+    @classmethod
+    def _get_required_box(cls, data: bytes, box_type: bytes) -> bytes:
+        """
+        :return bytes: payload of the first child box of the given type, which the container box must have
+        """
+        box = cls._get_box(data, box_type)
+        if box is None:
+            raise KeyframeIndexError(f'MP4 {box_type.decode()} box is missing')
+        return box
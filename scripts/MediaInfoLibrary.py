@@ -0,0 +1,139 @@
+import ctypes
+import ctypes.util
+import os
+import threading
+
+from Settings import Settings
+
+# library names tried when no explicit `mediainfo_library_path` is set
+LIBRARY_NAMES = ('libmediainfo.so.0', 'libmediainfo.so', 'libmediainfo.0.dylib', 'libmediainfo.dylib', 'MediaInfo.dll')
+# bytes handed to libmediainfo per call when it reads from a buffer rather than opening a file itself
+BUFFER_CHUNK_SIZE = 1024 * 1024
+# Open_Buffer_Continue status bit set once libmediainfo has all it needs
+BUFFER_STATUS_FINALIZED = 0x08
+# Open_Buffer_Continue_GoTo_Get value meaning no seek is requested
+BUFFER_NO_SEEK = 2 ** 64 - 1
+
+
+class MediaInfoLibrary:
+    """
+    In-process access to libmediainfo through ctypes; avoids spawning the mediainfo CLI for every file.
+    A single open of a file yields both the JSON tree and the text report
+    """
+    _lib = None
+    _load_attempted = False
+    _load_lock = threading.Lock()
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """
+        Loads libmediainfo on first use, according to the `mediainfo_backend` setting
+        :return bool: True if probes should go through the library, False if they should use the CLI
+        """
+        with cls._load_lock:
+            if not cls._load_attempted:
+                cls._load_attempted = True
+                if Settings.advanced['mediainfo_backend'] != 'cli':
+                    cls._lib = cls._load_library(Settings.advanced['mediainfo_library_path'])
+                    if cls._lib is None and Settings.advanced['mediainfo_backend'] == 'library':
+                        print('libmediainfo could not be loaded; falling back to the mediainfo CLI')
+            return cls._lib is not None
+
+    @classmethod
+    def inform(cls, path: str, output_formats: tuple) -> list:
+        """
+        Opens a media file once and renders its mediainfo in each of the requested formats
+        :param path (str): path of the media file
+        :param output_formats (tuple<str>): mediainfo 'Inform' values, eg. 'JSON'; '' renders the text report
+        :return list<str>: one report per requested format
+        """
+        handle = cls._lib.MediaInfo_New()
+        try:
+            if not cls._lib.MediaInfo_Open(handle, path):
+                raise OSError(f'libmediainfo could not open {path}')
+            return cls._render(handle, output_formats)
+        finally:
+            cls._lib.MediaInfo_Close(handle)
+            cls._lib.MediaInfo_Delete(handle)
+
+    @classmethod
+    def inform_range(cls, path: str, offset: int, size: int, name: str, output_formats: tuple) -> list:
+        """
+        Feeds a byte range of a file (eg. a VOB file inside a disc image) to libmediainfo through its buffer API,
+        following the seeks it requests, and renders its mediainfo in each of the requested formats
+        :param path (str): path of the file holding the media
+        :param offset (int): byte offset of the media within the file
+        :param size (int): size of the media in bytes
+        :param name (str): file name to report for the media
+        :param output_formats (tuple<str>): see inform()
+        :return list<str>: one report per requested format
+        """
+        handle = cls._lib.MediaInfo_New()
+        try:
+            cls._lib.MediaInfo_Option(handle, 'File_FileName', name)
+            cls._lib.MediaInfo_Open_Buffer_Init(handle, size, 0)
+            position = 0
+            with open(path, 'rb') as f:
+                while position < size:
+                    f.seek(offset + position)
+                    chunk = f.read(min(BUFFER_CHUNK_SIZE, size - position))
+                    if not chunk:
+                        break
+                    status = cls._lib.MediaInfo_Open_Buffer_Continue(handle, chunk, len(chunk))
+                    if status & BUFFER_STATUS_FINALIZED:
+                        break
+                    position += len(chunk)
+
+                    seek_position = cls._lib.MediaInfo_Open_Buffer_Continue_GoTo_Get(handle)
+                    if seek_position != BUFFER_NO_SEEK:
+                        position = seek_position
+                        cls._lib.MediaInfo_Open_Buffer_Init(handle, size, position)
+            cls._lib.MediaInfo_Open_Buffer_Finalize(handle)
+            return cls._render(handle, output_formats)
+        finally:
+            cls._lib.MediaInfo_Close(handle)
+            cls._lib.MediaInfo_Delete(handle)
+
+    @classmethod
+    def _render(cls, handle, output_formats: tuple) -> list:
+        reports = []
+        for output_format in output_formats:
+            cls._lib.MediaInfo_Option(handle, 'Inform', output_format)
+            reports.append(cls._lib.MediaInfo_Inform(handle, 0))
+        return reports
+
+    @staticmethod
+    def _load_library(library_path: str):
+        """
+        :param library_path (str): explicit library path; if empty, the usual library names are searched for
+        :return ctypes.CDLL: the library with its function signatures declared, or None if it cannot be loaded
+        """
+        candidates = [library_path] if library_path else [ctypes.util.find_library('mediainfo'), *LIBRARY_NAMES]
+        for candidate in filter(None, candidates):
+            try:
+                lib = ctypes.WinDLL(candidate) if os.name == 'nt' else ctypes.CDLL(candidate)
+            except OSError:
+                continue
+
+            lib.MediaInfo_New.argtypes = []
+            lib.MediaInfo_New.restype = ctypes.c_void_p
+            lib.MediaInfo_Delete.argtypes = [ctypes.c_void_p]
+            lib.MediaInfo_Delete.restype = None
+            lib.MediaInfo_Open.argtypes = [ctypes.c_void_p, ctypes.c_wchar_p]
+            lib.MediaInfo_Open.restype = ctypes.c_size_t
+            lib.MediaInfo_Option.argtypes = [ctypes.c_void_p, ctypes.c_wchar_p, ctypes.c_wchar_p]
+            lib.MediaInfo_Option.restype = ctypes.c_wchar_p
+            lib.MediaInfo_Inform.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+            lib.MediaInfo_Inform.restype = ctypes.c_wchar_p
+            lib.MediaInfo_Open_Buffer_Init.argtypes = [ctypes.c_void_p, ctypes.c_uint64, ctypes.c_uint64]
+            lib.MediaInfo_Open_Buffer_Init.restype = ctypes.c_size_t
+            lib.MediaInfo_Open_Buffer_Continue.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t]
+            lib.MediaInfo_Open_Buffer_Continue.restype = ctypes.c_size_t
+            lib.MediaInfo_Open_Buffer_Continue_GoTo_Get.argtypes = [ctypes.c_void_p]
+            lib.MediaInfo_Open_Buffer_Continue_GoTo_Get.restype = ctypes.c_uint64
+            lib.MediaInfo_Open_Buffer_Finalize.argtypes = [ctypes.c_void_p]
+            lib.MediaInfo_Open_Buffer_Finalize.restype = ctypes.c_size_t
+            lib.MediaInfo_Close.argtypes = [ctypes.c_void_p]
+            lib.MediaInfo_Close.restype = None
+            return lib
+        return None
@@ -0,0 +1,128 @@
+import json
+import os
+import subprocess
+import threading
+
+from Cache import Cache
+from IsoImage import IsoImage
+from MediaInfoLibrary import MediaInfoLibrary
+from Settings import Settings
+
+
+class MediaProbe:
+    """
+    Memoized mediainfo results for a single media file. Use MediaProbe.get() rather than the constructor so
+    every part of the script shares the same probe for a given path, and mediainfo is only run once per file
+    """
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        """
+        :param path (str): path of the media file to probe
+        """
+        self.path = path
+        self._json = None
+        self._text = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, path: str) -> 'MediaProbe':
+        """
+        Gets the shared probe for a path, creating it on first use
+        :param path (str): path of the media file
+        :return MediaProbe:
+        """
+        key = os.path.abspath(path)
+        with cls._registry_lock:
+            probe = cls._registry.get(key)
+            if probe is None:
+                probe = cls._registry[key] = cls(key)
+        return probe
+
+    @classmethod
+    def clear(cls):
+        """
+        Forget all memoized probes (eg. if files were modified during the run)
+        :return:
+        """
+        with cls._registry_lock:
+            cls._registry = {}
+
+    @property
+    def json(self) -> dict:
+        """
+        Structured mediainfo of the file, as returned by `mediainfo --Output=JSON`
+        :return dict:
+        """
+        with self._lock:
+            if self._json is None:
+                self._json = Cache.get_json('mediainfo_json', self.path)
+            if self._json is None:
+                if MediaInfoLibrary.is_available():
+                    self._probe_library()
+                else:
+                    self._json = json.loads(self._run_cli('--Output=JSON'))
+                    Cache.put_json('mediainfo_json', self.path, self._json)
+            return self._json
+
+    @property
+    def text(self) -> str:
+        """
+        Human-readable mediainfo report of the file, as printed by plain `mediainfo`
+        :return str:
+        """
+        with self._lock:
+            if self._text is None:
+                self._text = Cache.get_json('mediainfo_text', self.path)
+            if self._text is None:
+                if MediaInfoLibrary.is_available():
+                    self._probe_library()
+                else:
+                    self._text = self._run_cli().replace('\r\n', '\n')
+                    Cache.put_json('mediainfo_text', self.path, self._text)
+            return self._text
+
+    def get_track(self, track_type=None) -> dict:
+        """
+        Gets the first track of the given type from the structured mediainfo
+        :param track_type (str): mediainfo track type, eg. 'General', 'Video'
+        :return dict: the track, or an empty dict if the file has no such track
+        """
+        for track in self.json['media']['track']:
+            if track['@type'] == track_type:
+                return track
+        return {}
+
+    def get_duration(self) -> float:
+        """
+        :return float: duration of the file in seconds, or 0 if mediainfo does not report one
+        """
+        return float(self.get_track(track_type='General').get('Duration') or 0)
+
+    def _probe_library(self):
+        """
+        Fills in both the JSON and text mediainfo from a single libmediainfo open
+        :return:
+        """
+        iso_path = IsoImage.split_path(self.path)
+        if iso_path is None:
+            json_report, text_report = MediaInfoLibrary.inform(self.path, ('JSON', ''))
+        else:
+            offset, size = IsoImage.open(iso_path[0]).get_extent(iso_path[1])
+            json_report, text_report = MediaInfoLibrary.inform_range(iso_path[0], offset, size,
+                                                                     os.path.basename(self.path), ('JSON', ''))
+        self._json = json.loads(json_report)
+        self._text = text_report.replace('\r\n', '\n')
+        Cache.put_json('mediainfo_json', self.path, self._json)
+        Cache.put_json('mediainfo_text', self.path, self._text)
+
+    def _run_cli(self, *options) -> str:
+        """
+        Files inside disc images cannot be read by the CLI, which only opens files on disk; ReleaseInfo rejects disc
+        images up front when libmediainfo is not available
+        :param options (str): extra mediainfo CLI options, eg. '--Output=JSON'
+        :return str: the CLI's output for this file
+        """
+        args = [Settings.paths['mediainfo_bin_path'], *options, self.path]
+        return subprocess.check_output(args).decode()
@@ -0,0 +1,76 @@
+import concurrent.futures
+import os
+import threading
+import time
+
+from IsoImage import IsoImage
+from Settings import Settings
+
+
+class ProbePool:
+    """
+    Shared thread pool for probing several files at once (mediainfo, IFO reads). Besides the overall worker limit,
+    the number of probes running against any one storage device is capped, so spinning disks are not thrashed
+    by many concurrent seeks
+    """
+    _executor = None
+    _lock = threading.Lock()
+    _device_semaphores = {}
+
+    @classmethod
+    def map(cls, fn, paths: list, label: str = 'Probed') -> list:
+        """
+        Runs fn on every path concurrently, then reports the batch's wall time and peak concurrency
+        :param fn (callable): takes a path, returns its probe result
+        :param paths (list<str>): paths to probe
+        :param label (str): start of the report line, eg. 'Probed'
+        :return list: fn's results, in the same order as paths
+        """
+        if len(paths) <= 1:
+            return [fn(path) for path in paths]
+
+        stats = {'running': 0, 'peak': 0}
+        stats_lock = threading.Lock()
+
+        def run(path):
+            with cls._get_device_semaphore(path):
+                with stats_lock:
+                    stats['running'] += 1
+                    stats['peak'] = max(stats['peak'], stats['running'])
+                try:
+                    return fn(path)
+                finally:
+                    with stats_lock:
+                        stats['running'] -= 1
+
+        start = time.perf_counter()
+        results = list(cls._get_executor().map(run, paths))
+        print(f'{label} {len(paths)} files in {time.perf_counter() - start:.2f}s '
+              f'(peak concurrency {stats["peak"]})')
+        return results
+
+    @classmethod
+    def _get_executor(cls) -> concurrent.futures.ThreadPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=Settings.advanced['probe_workers'], thread_name_prefix='probe')
+            return cls._executor
+
+    @classmethod
+    def _get_device_semaphore(cls, path: str) -> threading.Semaphore:
+        """
+        :param path (str): path that is about to be probed
+        :return threading.Semaphore: limits concurrent probes on the storage device holding path
+        """
+        # files inside a disc image are on the image's device
+        iso_path = IsoImage.split_path(path)
+        try:
+            device = os.stat(iso_path[0] if iso_path else path).st_dev
+        except OSError:
+            device = None
+
+        with cls._lock:
+            if device not in cls._device_semaphores:
+                cls._device_semaphores[device] = threading.Semaphore(Settings.advanced['probe_concurrency_per_device'])
+            return cls._device_semaphores[device]
@@ -1,12 +1,20 @@
 import os
 import re
-import subprocess
 
-import Helper
-from Settings import Settings
+from MediaProbe import MediaProbe
+from ProbePool import ProbePool
+from BlurayAnalyzer import BlurayAnalyzer
 from DvdAnalyzer import DvdAnalyzer
+from IsoImage import IsoImage, ISO_EXTS
+from MediaInfoLibrary import MediaInfoLibrary
+from Settings import Settings
 
 VIDEO_FILE_TYPES = ('.mkv', '.avi', '.mp4', '.ts')
+# episode numbering in file names, eg. S01E02 or 1x02; folders with several such files are season packs.
+# Not \b, which does not match next to '_', as in Show_S01E02_720p
+EPISODE_RE = r'(?i)(?:(?<![A-Za-z0-9])S\d{1,2}[ ._-]?E\d{1,3}|(?<![A-Za-z0-9])\d{1,2}x\d{2,3}(?![A-Za-z0-9]))'
+# sample clips and extras are not part of the release itself
+SKIPPED_NAME_RE = r'(?i)(?<![A-Za-z0-9])sample(?![A-Za-z0-9])'
 
 
 class ReleaseInfo:
@@ -19,38 +27,59 @@ class ReleaseInfo:
         self.input_path = input_path
         self.release_type = ''
         self.primary_ifo_info = {}
+        self.main_playlist_info = {}
         self.main_video_files = []
+        # video file path -> duration in seconds, where known without probing the file
+        self.main_video_durations = {}
+        # video file path -> timestamp within the file at which the main title starts, where not at the start
+        self.main_video_start_times = {}
         self.media_infos = []
+        self.relevant_files = None
+        # season packs: every episode, in order, and the size of each file found
+        self.episode_files = []
+        self.video_file_sizes = {}
 
     def get_complete_mediainfo(self) -> str:
         """
-        Gathers mediainfo for video file. If DVD folder, gather mediainfo from primary IFO file as well
+        Gathers mediainfo for video file. If DVD folder, gather mediainfo from primary IFO file as well;
+        if Blu-ray folder, from the main playlist file as well; if season pack, from its first episode,
+        followed by a summary table of every episode
         :return str: All mediainfos gathered, joined to a single string
         """
         header = ''
-        relevant_files = self._get_relevant_files()
-        if self.release_type == 'dvd':
+        relevant_files = self.find_relevant_files()
+        if self.release_type in ('dvd', 'bluray', 'season'):
             header = '[size=4][b]' + os.path.basename(self.input_path) + '[/b][/size]\n\n'
 
-        for file in relevant_files:
+        mediainfo_texts = ProbePool.map(lambda file: MediaProbe.get(file).text, relevant_files)
+        for file, mediainfo in zip(relevant_files, mediainfo_texts):
             base_video_name = os.path.basename(file)
 
-            args = '"{mediainfo_bin_location}" "{file}"'.format(
-                mediainfo_bin_location=Settings.paths['mediainfo_bin_path'],
-                file=file
-            )
-            mediainfo = subprocess.check_output(args, shell=True).decode()
             mediainfo = re.sub(ReleaseInfo.mediainfo_complete_name_re, fr'\1 {base_video_name}', mediainfo)
-            mediainfo = mediainfo.replace('\r\n', '\n')
 
             self.media_infos.append(mediainfo.strip() + '\n\n')
 
+        if self.release_type == 'season':
+            self.media_infos.append(self._get_episode_table())
         return header + ''.join(self.media_infos)
 
+    def find_relevant_files(self) -> list:
+        """
+        Works out the type of release and its main video files, without gathering any mediainfo;
+        screenshots can be generated once this is done
+        :return list<str>: see _get_relevant_files(); only looked up once
+        """
+        if self.relevant_files is None:
+            self.relevant_files = self._get_relevant_files()
+        return self.relevant_files
+
     def _get_relevant_files(self) -> list:
         """
-        Gets relevant video files for mediainfo. If DVD, includes the primary IFO along with the primary VOB file
-        :return list<str>: file paths of primary IFO (if applicable) and primary video file
+        Gets relevant video files for mediainfo. If DVD, includes the primary IFO along with the primary VOB file;
+        if Blu-ray, the main playlist along with its main stream file.
+        DVD disc images are read in place; their files' paths continue from the image's path
+        (see IsoImage.split_path())
+        :return list<str>: file paths of primary IFO or main playlist (if applicable) and primary video file
         """
         # check if user-set path is of a proper video type
         if os.path.isfile(self.input_path) and self.input_path.endswith(VIDEO_FILE_TYPES):
@@ -58,24 +87,142 @@ class ReleaseInfo:
             self.main_video_files.append(self.input_path)
             return [self.input_path]
 
+        if os.path.isfile(self.input_path) and self.input_path.endswith(ISO_EXTS):
+            assert IsoImage.open(self.input_path).is_dir('VIDEO_TS'), 'Disc image has no VIDEO_TS folder'
+            # the VOBs are read from within the image, which the mediainfo CLI cannot do
+            assert MediaInfoLibrary.is_available(), \
+                'Reading a disc image needs libmediainfo; the mediainfo CLI can only read files on disk. ' \
+                'Install libmediainfo (or set mediainfo_library_path) and set mediainfo_backend to "auto" or ' \
+                '"library", or extract the image first'
+            return self._get_dvd_files()
+
         assert os.path.isdir(
-            self.input_path), 'Input path is not a DVD folder or a file of relevant video type: ' + ', '.join(
-            VIDEO_FILE_TYPES)
+            self.input_path), 'Input path is not a DVD/Blu-ray folder, DVD image or a file of relevant video type: ' + \
+            ', '.join(VIDEO_FILE_TYPES)
 
         # check if user-set path contains folder 'VIDEO_TS'
         if os.path.isdir(os.path.join(self.input_path, 'VIDEO_TS')):
-            self.release_type = 'dvd'
-
-            dvd_info = DvdAnalyzer(self.input_path)
-            self.primary_ifo_info = dvd_info.get_primary_ifo_info()
-            self.main_video_files = dvd_info.get_main_vob_files()
-
-            return [self.primary_ifo_info['path'], self.main_video_files[0]]
+            return self._get_dvd_files()
+        # check if user-set path is, or contains, a Blu-ray 'BDMV' folder
+        elif os.path.isdir(os.path.join(self.input_path, 'BDMV')):
+            return self._get_bluray_files(os.path.join(self.input_path, 'BDMV'))
+        elif os.path.isdir(os.path.join(self.input_path, 'PLAYLIST')) and \
+                os.path.isdir(os.path.join(self.input_path, 'STREAM')):
+            return self._get_bluray_files(self.input_path)
         else:
+            self.video_file_sizes = self._find_video_files(self.input_path)
+            assert self.video_file_sizes, 'No video files of relevant type found in ' + self.input_path
+            episode_files = [f for f in self.video_file_sizes if re.search(EPISODE_RE, os.path.basename(f))]
+            if len(episode_files) > 1:
+                return self._get_season_files(episode_files)
+
             self.release_type = 'single'
-            video_files = [os.path.join(self.input_path, f) for f in os.listdir(self.input_path) if
-                           f.endswith(VIDEO_FILE_TYPES)]
-            largest_filepath = Helper.get_largest_file(video_files)
+            largest_filepath = max(self.video_file_sizes, key=self.video_file_sizes.get)
             self.main_video_files = [largest_filepath]
 
             return [largest_filepath]
+
+    @staticmethod
+    def _find_video_files(folder_path: str) -> dict:
+        """
+        Finds the video files in a folder and all its subfolders, skipping samples and hidden files
+        :param folder_path (str): folder to search
+        :return dict<str, int>: path -> size in bytes of every video file found, in natural order
+                (eg. 'Episode 2' before 'Episode 10')
+        """
+        video_file_sizes = {}
+        folders = [folder_path]
+        while folders:
+            for entry in os.scandir(folders.pop()):
+                if entry.name.startswith('.') or re.search(SKIPPED_NAME_RE, entry.name):
+                    continue
+                if entry.is_dir():
+                    folders.append(entry.path)
+                elif entry.name.endswith(VIDEO_FILE_TYPES) and entry.is_file():
+                    # the stat result is reused for the file's size
+                    video_file_sizes[entry.path] = entry.stat().st_size
+
+        def natural_key(path):
+            return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', path)]
+
+        return {path: video_file_sizes[path] for path in sorted(video_file_sizes, key=natural_key)}
+
+    def _get_season_files(self, episode_files: list) -> list:
+        """
+        :param episode_files (list<str>): file paths of the episodes, in order
+        :return list<str>: file path of the first episode, whose full mediainfo is shown
+        """
+        self.release_type = 'season'
+        self.episode_files = episode_files
+        self.main_video_files = episode_files
+
+        return [episode_files[0]]
+
+    def _get_episode_table(self) -> str:
+        """
+        Probes the episodes concurrently (every one, or with `season_probe_episodes` set to 'representative',
+        only the first, middle and last) and summarises them one line per episode
+        :return str: the summary table
+        """
+        if Settings.advanced['season_probe_episodes'] == 'representative':
+            probed_files = list(dict.fromkeys(self.episode_files[i] for i in
+                                              (0, len(self.episode_files) // 2, len(self.episode_files) - 1)))
+        else:
+            probed_files = self.episode_files
+        # reading the JSON is what runs mediainfo, so it is read in the pool; the probes keep it for the rows below
+        ProbePool.map(lambda file: MediaProbe.get(file).json, probed_files)
+        probes = {file: MediaProbe.get(file) for file in probed_files}
+
+        rows = [('File', 'Duration', 'Resolution', 'Video', 'Audio', 'Subs', 'Size')]
+        for file in self.episode_files:
+            size = f'{self.video_file_sizes[file] / 1024 ** 3:.2f} GiB'
+            probe = probes.get(file)
+            if probe is None:
+                rows.append((os.path.basename(file), '-', '-', '-', '-', '-', size))
+                continue
+
+            duration = int(probe.get_duration())
+            video = probe.get_track(track_type='Video')
+            tracks = probe.json['media']['track']
+            audio_languages = [track.get('Language', 'und') for track in tracks if track['@type'] == 'Audio']
+            rows.append((
+                os.path.basename(file),
+                f'{duration // 3600}:{duration // 60 % 60:02}:{duration % 60:02}',
+                f'{video.get("Width", "?")}x{video.get("Height", "?")}',
+                video.get('Format', '-'),
+                ', '.join(audio_languages) or '-',
+                str(sum(track['@type'] == 'Text' for track in tracks)),
+                size,
+            ))
+
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = ['  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows]
+        return f'{len(self.episode_files)} episodes:\n' + '\n'.join(lines) + '\n\n'
+
+    def _get_dvd_files(self) -> list:
+        """
+        :return list<str>: file paths of the primary IFO and the primary VOB file
+        """
+        self.release_type = 'dvd'
+
+        dvd_info = DvdAnalyzer(self.input_path)
+        self.primary_ifo_info = dvd_info.get_primary_ifo_info()
+        self.main_video_files = dvd_info.get_main_vob_files()
+        self.main_video_durations = dvd_info.get_main_vob_durations()
+
+        return [self.primary_ifo_info['path'], self.main_video_files[0]]
+
+    def _get_bluray_files(self, bdmv_folder_path: str) -> list:
+        """
+        :param bdmv_folder_path (str): path of the BDMV folder
+        :return list<str>: file paths of the main playlist (if it could be read) and its main stream file
+        """
+        self.release_type = 'bluray'
+
+        bluray_info = BlurayAnalyzer(bdmv_folder_path)
+        self.main_playlist_info = bluray_info.get_main_playlist_info()
+        self.main_video_files = bluray_info.get_main_clip_files()
+        self.main_video_durations = bluray_info.get_main_clip_durations()
+        self.main_video_start_times = bluray_info.get_main_clip_start_times()
+
+        return [f for f in (self.main_playlist_info['path'], self.main_playlist_info['main_clip']) if f]
@@ -1,48 +1,237 @@
 #!python3
 
+import argparse
+import concurrent.futures
+import glob
+import json
 import os
-import pyperclip
+import re
 import subprocess
-import sys
+import threading
 import time
+import traceback
 
 import Helper
+from Cache import Cache
 from Settings import Settings
 from ReleaseInfo import ReleaseInfo
-from ScreenshotGenerator import ScreenshotGenerator
-from ImageUploader import ImageUploader
+from ReleaseJournal import ReleaseJournal
+from StageGraph import StageGraph
 
 CLEAR_FN = 'cls' if os.name == 'nt' else 'clear'
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generates mediainfo and screenshots for a video file or DVD folder, '
+                                                 'and uploads the screenshots')
+    parser.add_argument('input_paths', nargs='*', metavar='input_path',
+                        help='video file, DVD image (.iso), or folder containing a video file, VIDEO_TS or BDMV folder; '
+                             'give several (or a glob pattern) for batch mode')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='ignore cached mediainfo/screenshots/uploads from previous runs, and do not cache this run')
+    parser.add_argument('--list', dest='list_file',
+                        help='batch mode: text file listing input paths (or glob patterns), one per line')
+    parser.add_argument('--output-dir',
+                        help='batch mode: write the mediainfo + image URLs of each release to a .txt file in this folder')
+    parser.add_argument('--jsonl',
+                        help='batch mode: append a JSON line with the mediainfo + image URLs of each release to this file')
+    parser.add_argument('--watch', action='append', metavar='FOLDER',
+                        help='daemon mode: keep running, and process every release added to this folder once it stops '
+                             'changing, writing the result next to it; may be given more than once')
+    parser.add_argument('--status-file', default=os.path.join(os.path.dirname(Settings.settings_file_path),
+                                                              'ReleaseInfoCreator.status.json'),
+                        help='daemon mode: JSON file to write the queue and throughput status to')
+    args = parser.parse_args()
+
+    args.input_paths = get_input_paths(args.input_paths, args.list_file)
+    if args.watch:
+        args.batch = False
+        return args
+    if not args.input_paths:
+        parser.error('no input paths given (or no files match)')
+    args.batch = len(args.input_paths) > 1 or args.list_file or args.output_dir or args.jsonl
+    if args.batch and not (args.output_dir or args.jsonl):
+        parser.error('batch mode needs --output-dir and/or --jsonl')
+    return args
+
+
+def get_input_paths(input_paths: list, list_file: str = None) -> list:
+    """
+    :param input_paths (list<str>): input paths from the command line, which may be glob patterns
+    :param list_file (str): path of a text file of further input paths or patterns, one per line;
+            blank lines and lines starting with # are skipped
+    :return list<str>: absolute input paths, with patterns expanded and duplicates removed
+    """
+    if list_file:
+        with open(list_file, 'r', encoding='utf8') as f:
+            input_paths = input_paths + [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    expanded_paths = []
+    for input_path in input_paths:
+        # shells on Windows do not expand patterns themselves
+        if any(c in input_path for c in '*?['):
+            expanded_paths.extend(sorted(glob.glob(input_path)))
+        else:
+            expanded_paths.append(input_path)
+    return list(dict.fromkeys(os.path.abspath(input_path) for input_path in expanded_paths))
+
+
+def process_release(input_path: str, image_host: dict, image_name_prefix: str = '') -> tuple:
+    """
+    Gathers the mediainfo of a release, and generates and uploads its screenshots
+    :param input_path (str): absolute input path of the release
+    :param image_host (dict): image host to upload to
+    :param image_name_prefix (str): see ScreenshotGenerator
+    :return tuple<str, str, StageGraph>: mediainfo, formatted image URLs, and the stages that produced them
+    """
+    # PIL, NumPy and requests are only imported once a release needs them, so starting up stays quick
+    from ImageUploader import ImageUploader, GALLERY_UPLOAD_HOSTS, STREAMING_UPLOAD_HOSTS
+
+    # completed stages are recorded, so that if this run fails, the next one resumes where it stopped
+    journal = ReleaseJournal(input_path)
+    # each screenshot is uploaded as soon as it is final, while later ones are still being generated
+    upload_while_generating = Settings.advanced['upload_while_generating'] and \
+        image_host['name'] in STREAMING_UPLOAD_HOSTS
+    uploader = ImageUploader([], '', image_host, journal)
+    if upload_while_generating:
+        uploader.start()
+
+    def find_release():
+        print('Gathering media info')
+        rls = ReleaseInfo(input_path)
+        rls.find_relevant_files()
+        return rls
+
+    def get_mediainfo(release):
+        release_info = journal.get('mediainfo')
+        if release_info is None:
+            release_info = release.get_complete_mediainfo()
+            journal.put('mediainfo', release_info)
+        return release_info
+
+    def generate_screenshots(release):
+        from ScreenshotGenerator import ScreenshotGenerator
+
+        print('Generating screenshots')
+        return ScreenshotGenerator(image_name_prefix=image_name_prefix).generate_screenshots(
+            release, on_final_image=uploader.add_image if upload_while_generating else None, journal=journal)
+
+    def upload(screenshots, gallery_name=''):
+        uploader.gallery_name = gallery_name
+        if upload_while_generating:
+            uploader.finish()
+        else:
+            print( 'Uploading images to {}'.format(image_host['name']) )
+            uploader.image_files = screenshots
+            uploader.upload()
+        return uploader.get_formatted_urls()
+
+    # the text mediainfo, the gallery name and the screenshots are independent of one another
+    stages = StageGraph()
+    stages.add('release', find_release)
+    stages.add('mediainfo', get_mediainfo, deps=('release',))
+    stages.add('screenshots', generate_screenshots, deps=('release',))
+    if image_host['name'] in GALLERY_UPLOAD_HOSTS:
+        stages.add('gallery_name', lambda: Helper.get_gallery_name(input_path))
+        stages.add('upload', upload, deps=('screenshots', 'gallery_name'))
+    else:
+        stages.add('upload', upload, deps=('screenshots',))
+    results = stages.run()
+    journal.complete()
+    return results['mediainfo'], results['upload'], stages
+
+
+def process_batch(args: argparse.Namespace, image_host: dict):
+    """
+    Processes several releases at once (`batch_parallel_releases`), so one release's screenshots can be uploaded
+    while the next one's are generated; all of them share the same probe, ffmpeg and upload limits. Each release's
+    output is written as soon as it is done; a release that fails is reported without stopping the others
+    :param args (argparse.Namespace): parsed command line arguments
+    :param image_host (dict): image host to upload to
+    :return:
+    """
+    # unique per release, for output files and screenshot names
+    release_names = []
+    for input_path in args.input_paths:
+        release_name = os.path.basename(input_path)
+        if os.path.isfile(input_path):
+            release_name = os.path.splitext(release_name)[0]
+        release_name = re.sub(r'[<>:"/\\|?*]', '_', release_name)
+
+        unique_name = release_name
+        n = 2
+        while unique_name.lower() in {name.lower() for name in release_names}:
+            unique_name = f'{release_name} ({n})'
+            n += 1
+        release_names.append(unique_name)
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    output_lock = threading.Lock()
+
+    def process(input_path, release_name):
+        print(f'Processing {input_path}')
+        try:
+            release_info, formatted_urls, stages = process_release(input_path, image_host, f'{release_name} ')
+            error = None
+        except Exception as e:
+            traceback.print_exc()
+            release_info, formatted_urls, stages = '', '', None
+            error = f'{e.__class__.__name__}: {e}'
+
+        with output_lock:
+            if args.output_dir and error is None:
+                with open(os.path.join(args.output_dir, release_name + '.txt'), 'w', encoding='utf8') as f:
+                    f.write(release_info + formatted_urls)
+            if args.jsonl:
+                with open(args.jsonl, 'a', encoding='utf8') as f:
+                    f.write(json.dumps({'input_path': input_path, 'mediainfo': release_info,
+                                        'image_urls': formatted_urls, 'error': error}) + '\n')
+            if error is None:
+                print(f'Finished {input_path}')
+                stages.print_timings()
+            else:
+                print(f'Failed {input_path} ({error})')
+        return error is None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=Settings.advanced['batch_parallel_releases']) as executor:
+        succeeded = list(executor.map(process, args.input_paths, release_names))
+    print(f'\n{sum(succeeded)} of {len(succeeded)} releases done')
+
+
 def main():
+    args = parse_args()
     Settings.load_settings()
+    if args.no_cache:
+        Cache.disable()
     image_host = Settings.get_preferred_host()
 
-    assert len(sys.argv) > 1, 'Error, need input file'
+    if args.watch:
+        from WatchDaemon import WatchDaemon
+
+        print( 'Image host "{}" will be used for uploading\n'.format(image_host['name']) )
+        WatchDaemon(args.watch, image_host, process_release, args.status_file).run()
+        return
+    if args.batch:
+        print( 'Image host "{}" will be used for uploading\n'.format(image_host['name']) )
+        process_batch(args, image_host)
+        return
 
     subprocess.run(CLEAR_FN, shell=True)
 
     print( 'Image host "{}" will be used for uploading\n'.format(image_host['name']) )
-    print('Gathering media info')
-    rls = ReleaseInfo( os.path.abspath(sys.argv[1]) )
-    release_info = rls.get_complete_mediainfo()
-
-    print('Generating screenshots')
-    images = ScreenshotGenerator().generate_screenshots(rls)
-
-    print( 'Uploading images to {}'.format(image_host['name']) )
-    gallery_name = Helper.get_gallery_name(sys.argv[1])
-    uploader = ImageUploader(images, gallery_name, image_host)
-    uploader.upload()
-    formatted_urls = uploader.get_formatted_urls()
+    release_info, formatted_urls, stages = process_release(args.input_paths[0], image_host)
 
     if Settings.print_not_copy:
         subprocess.run(CLEAR_FN, shell=True)
         print(release_info + formatted_urls)
     else:
+        import pyperclip
+
         pyperclip.copy(release_info + formatted_urls)
         print('\nMediainfo + image URLs have been copied to clipboard')
+    stages.print_timings()
+    if not Settings.print_not_copy:
         time.sleep(5)
 
 
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import threading
+
+from Cache import Cache
+from Settings import Settings
+
+JOURNAL_FOLDER_NAME = '.journal'
+
+
+class ReleaseJournal:
+    """
+    Records the stages of a release's run as they complete (mediainfo, final screenshots, the URL of each uploaded
+    image) in a small JSON file in the image save location. If the run fails part way, eg. on an upload, the next run
+    of the same release resumes from the first incomplete stage. The journal is deleted once the run completes,
+    and ignored (then overwritten) with --no-cache
+    """
+
+    def __init__(self, input_path: str):
+        """
+        :param input_path (str): absolute input path of the release
+        """
+        release_key = hashlib.blake2b(Cache.fingerprint(input_path).encode(), digest_size=16).hexdigest()
+        self.journal_file_path = os.path.join(Settings.paths['image_save_location'], JOURNAL_FOLDER_NAME,
+                                              f'{release_key}.json')
+        self._lock = threading.Lock()
+        self._stages = {}
+
+        if Cache.enabled:
+            try:
+                with open(self.journal_file_path, 'r', encoding='utf8') as f:
+                    self._stages = json.load(f)
+                print('Resuming the unfinished previous run of this release')
+            except FileNotFoundError:
+                pass
+            except (OSError, json.decoder.JSONDecodeError) as e:
+                print(f'Error reading journal {self.journal_file_path} ({e}); starting from scratch')
+
+    def get(self, stage: str):
+        """
+        :param stage (str): name of the stage, eg. 'mediainfo'
+        :return: what was recorded for the stage; None if it has not been done
+        """
+        with self._lock:
+            return self._stages.get(stage)
+
+    def put(self, stage: str, value):
+        """
+        Records a completed stage
+        :param stage (str): name of the stage
+        :param value: JSON-serializable result of the stage
+        :return:
+        """
+        with self._lock:
+            self._stages[stage] = value
+            self._write()
+
+    def put_item(self, stage: str, key: str, value):
+        """
+        Records one completed item of a stage made of many independent items (eg. the upload of one image)
+        :param stage (str): name of the stage
+        :param key (str): identifies the item within the stage
+        :param value: JSON-serializable result of the item
+        :return:
+        """
+        with self._lock:
+            self._stages.setdefault(stage, {})[key] = value
+            self._write()
+
+    def complete(self):
+        """
+        Deletes the journal once every stage of the run is done
+        :return:
+        """
+        with self._lock:
+            self._stages = {}
+            try:
+                os.unlink(self.journal_file_path)
+            except FileNotFoundError:
+                pass
+
+    def _write(self):
+        """
+        Writes the journal, replacing the previous one atomically so a crash never leaves it half-written
+        :return:
+        """
+        os.makedirs(os.path.dirname(self.journal_file_path), exist_ok=True)
+        temp_path = self.journal_file_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf8') as f:
+            json.dump(self._stages, f)
+        os.replace(temp_path, self.journal_file_path)
@@ -0,0 +1,124 @@
+import re
+import subprocess
+
+import FrameScorer
+from Cache import Cache
+from IsoImage import IsoImage
+from JobScheduler import JobScheduler
+from Settings import Settings
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# keyframes are scaled down to this before being piped out; enough for brightness, detail and scene-change statistics
+PREPASS_WIDTH = 160
+PREPASS_HEIGHT = 90
+# mean absolute luma difference (0-255) between consecutive keyframes above which they are in different shots
+SCENE_CUT_THRESHOLD = 32
+SHOWINFO_PTS_TIME = re.compile(rb'pts_time:\s*(-?[\d.]+)')
+
+
+def is_available() -> bool:
+    """
+    :return bool: True if the pre-pass can run; it scores frames with NumPy
+    """
+    return FrameScorer.is_available()
+
+
+def get_keyframe_stats(windows: list, decode_memory: int = 0) -> list:
+    """
+    Decodes only the keyframes of each window, at a tiny scale, and scores them. The windows are split into chunks
+    decoded concurrently. Results are cached per file and window
+    :param windows (list<tuple<str, float, float>>): video file, start and end timestamp of each window
+    :param decode_memory (int): estimated bytes of memory one decoder of the video needs
+    :return list<list<dict>>: for each window, its keyframes in order, with 'time' (seconds within the file),
+            'shot' (number of scene cuts since the start of the window), 'scene_change' (mean absolute luma
+            difference to the previous keyframe) and the FrameScorer statistics
+    """
+    cache_extras = [f'{start:.3f}|{end:.3f}|{PREPASS_WIDTH}x{PREPASS_HEIGHT}' for _, start, end in windows]
+    stats = [Cache.get_json('scene_stats', video_file, extra=extra)
+             for (video_file, _, _), extra in zip(windows, cache_extras)]
+
+    uncached = [i for i, window_stats in enumerate(stats) if window_stats is None]
+    if not uncached:
+        return stats
+
+    # split the windows so the chunks together roughly fill the job slots
+    n_chunks = max(1, JobScheduler.get_max_jobs() // len(uncached))
+    chunks = []
+    for i in uncached:
+        video_file, start, end = windows[i]
+        chunk_length = (end - start) / n_chunks
+        chunks += [(i, video_file, start + n * chunk_length, chunk_length) for n in range(n_chunks)]
+
+    outputs = JobScheduler.run_for_streams([
+        lambda threads, video_file=video_file, start=start, length=length: subprocess.Popen(
+            _get_keyframes_args(video_file, start, length, threads), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        for _, video_file, start, length in chunks
+    ], memory_per_job=decode_memory)
+
+    frames_per_window = {i: [] for i in uncached}
+    frame_size = PREPASS_WIDTH * PREPASS_HEIGHT
+    for (i, _, start, _), (stdout, stderr) in zip(chunks, outputs):
+        for n, pts_time in enumerate(SHOWINFO_PTS_TIME.findall(stderr)):
+            frame = stdout[n * frame_size:(n + 1) * frame_size]
+            if len(frame) == frame_size:
+                frames_per_window[i].append((start + float(pts_time), frame))
+
+    for i in uncached:
+        stats[i] = _score_keyframes(frames_per_window[i])
+        Cache.put_json('scene_stats', windows[i][0], stats[i], extra=cache_extras[i])
+    return stats
+
+
+def choose_keyframe(keyframe_stats: list, window_start: float, window_end: float, avoid_shot: int = None):
+    """
+    Picks the best-scoring keyframe in a window, preferring one from a different shot than the previous pick
+    :param keyframe_stats (list<dict>): see get_keyframe_stats()
+    :param window_start (float): earliest acceptable timestamp
+    :param window_end (float): latest acceptable timestamp
+    :param avoid_shot (int): shot of the previously picked keyframe
+    :return dict: the keyframe's statistics, or None if the window has no keyframes
+    """
+    candidates = [stats for stats in keyframe_stats if window_start <= stats['time'] <= window_end]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda stats: (stats['shot'] != avoid_shot, stats['score']))
+
+
+def _score_keyframes(frames: list) -> list:
+    """
+    :param frames (list<tuple<float, bytes>>): timestamp and raw gray frame of each keyframe
+    :return list<dict>: see get_keyframe_stats()
+    """
+    keyframe_stats = []
+    previous_luma = None
+    shot = 0
+    for time, frame in sorted(frames, key=lambda timed_frame: timed_frame[0]):
+        luma = numpy.frombuffer(frame, dtype=numpy.uint8).reshape(PREPASS_HEIGHT, PREPASS_WIDTH).astype(numpy.float32)
+        scene_change = float(numpy.abs(luma - previous_luma).mean()) if previous_luma is not None else 0.0
+        if scene_change > SCENE_CUT_THRESHOLD:
+            shot += 1
+        keyframe_stats.append({'time': time, 'shot': shot, 'scene_change': scene_change,
+                               **FrameScorer.score_luma(luma)})
+        previous_luma = luma
+    return keyframe_stats
+
+
+def _get_keyframes_args(video_file: str, start: float, length: float, threads: int = 0) -> list:
+    """
+    Builds an ffmpeg command decoding only the keyframes of part of a video, writing them to stdout as tiny raw gray
+    frames, and logging their timestamps (relative to start) to stderr
+    :param video_file (str): path to video file
+    :param start (float): timestamp to start at
+    :param length (float): seconds of video to read
+    :param threads (int): threads the process may use; 0 lets ffmpeg decide
+    :return list<str>: ffmpeg arguments
+    """
+    return [Settings.paths['ffmpeg_bin_path'], '-hide_banner', '-nostats', '-loglevel', 'info',
+            '-threads', str(threads), '-skip_frame', 'nokey', '-ss', str(start), '-t', str(length),
+            '-i', IsoImage.get_ffmpeg_input(video_file),
+            '-map', '0:V:0', '-vf', f'scale={PREPASS_WIDTH}:{PREPASS_HEIGHT}:flags=fast_bilinear,showinfo',
+            '-vsync', 'passthrough', '-f', 'rawvideo', '-pix_fmt', 'gray', 'pipe:1']
@@ -1,120 +1,720 @@
 import datetime
+import hashlib
+import io
 from typing import Tuple
 import Helper
 import os
 import subprocess
-from PIL import Image
-
+import time
+
+import FrameScorer
+import KeyframeIndex
+import SceneAnalyzer
+from Cache import Cache
+from IsoImage import IsoImage
+from JobScheduler import JobScheduler, estimate_decode_memory, estimate_image_memory
+from MediaProbe import MediaProbe
+from ProbePool import ProbePool
 from Settings import Settings
+from Timeline import Timeline
 
 
 class ScreenshotGenerator:
-    FFMPEG_SCREENSHOT_ARGS = r'"{ffmpeg_bin_location}" -hide_banner -loglevel panic -ss {timestamp} ' \
-                             r'-i "{video_filepath}" -vf "select=gt(scene\,0.01)" {param_DAR} -r 1 ' \
+    FFMPEG_SCREENSHOT_ARGS = r'"{ffmpeg_bin_location}" -hide_banner -loglevel panic -threads {threads} -ss {timestamp} ' \
+                             r'-i "{video_filepath}" {param_DAR} -r 1 ' \
                              r'-frames:v 1 "{output_filepath}"'
 
-    OXIPNG_ARGS = r'"{oxi_bin_location}" -o 2 -s -a {images}'
+    # output options of each screenshot; identical for both the one-process-per-screenshot and
+    # single-pass extraction modes, so both produce the same frames
+    FFMPEG_SCREENSHOT_OUTPUT_ARGS = ['-pix_fmt', 'rgb24', '-r', '1', '-frames:v', '1']
+
+    OXIPNG_ARGS = r'"{oxi_bin_location}" -o 2 -s -a -t {threads} {images}'
+    # same optimisation, reading the PNG from stdin and writing the result to stdout
+    OXIPNG_STDIO_ARGS = ['-o', '2', '-s', '-a', '--stdout', '-']
 
-    def __init__(self, n_images=6):
+    # times a rejected screenshot is retaken a little further from its planned time before settling for its best frame
+    MAX_RESEEKS = 4
+    # in 'single' extraction mode, the timestamps of a file at most this many seconds apart are taken in one decoding
+    # pass; further apart, seeking to each one (which decodes from the keyframe before it) is faster than decoding
+    # the whole gap between them
+    SINGLE_PASS_MAX_GAP = 10
+    # without NumPy, frames whose low-quality JPEG is smaller than this (bytes per pixel) are rejected as featureless
+    MIN_JPEG_BYTES_PER_PIXEL = 0.01
+
+    def __init__(self, n_images=6, image_name_prefix=''):
         """
-        :param n_images (int): Number of screenshots to generate; 2 extra images will be generated
-        in case some come out dark/blurry;
+        :param n_images (int): Number of screenshots to generate; when frames are scored, rejected frames are retaken
+        nearby, otherwise 2 extra images will be generated in case some come out dark/blurry
+        :param image_name_prefix (str): prepended to the screenshot file names, so the screenshots of releases
+        processed at the same time (batch mode) do not overwrite each other
         """
+        self.image_name_prefix = image_name_prefix
         self.n_final_images = n_images
         self.n_total_images = n_images + 2
         self.saved_images = []
+        # image path -> (video file name, timestamp in seconds) the screenshot was taken from
+        self.image_timestamps = {}
 
+        self.scale_filter = ''
         self.param_DAR = ''
+        # estimated memory of decoding one input of the video, and of optimising one screenshot
+        self.decode_memory = 0
+        self.image_memory = 0
 
-    def generate_screenshots(self, rls: object) -> list:
+    def generate_screenshots(self, rls: object, on_final_image=None, journal=None) -> list:
         """
         Generate screenshots for file or DVD
         :param rls (ReleaseInfo): Object containing video's/DVD's paths and any already-gathered mediainfo
+        :param on_final_image (callable): called with the number and image of each screenshot as soon as it is final
+                (eg. to upload it while later frames are still decoding); generation waits while it blocks
+        :param journal (ReleaseJournal): journal of the release's run; the final screenshots are recorded in it, or
+                reused from it if an earlier run got that far
         :return:
         """
 
         display_width, display_height = self._get_display_dimensions(rls)
-        self.param_DAR = f'-vf "scale={display_width}:{display_height}:flags=full_chroma_int+full_chroma_inp+accurate_rnd+spline" -pix_fmt rgb24'
+        self.scale_filter = f'scale={display_width}:{display_height}:flags=full_chroma_int+full_chroma_inp+accurate_rnd+spline'
+        self.param_DAR = f'-vf "{self.scale_filter}" -pix_fmt rgb24'
+
+        video_info = Helper.get_track(self._get_video_mediainfo_json(rls), track_type='Video')
+        self.decode_memory = estimate_decode_memory(int(video_info['Width']), int(video_info['Height']),
+                                                    int(video_info.get('BitDepth') or 8))
+        self.image_memory = estimate_image_memory(display_width, display_height)
+
+        cache_params = (f'{self.n_final_images}|{self.param_DAR}|{Settings.use_png_optimise}'
+                        f'|{Settings.advanced["snap_to_keyframes"]}|{Settings.advanced["scene_prepass"]}')
+        cached_images = self._restore_journaled_screenshots(journal, cache_params) or \
+            self._restore_cached_screenshots(rls, cache_params)
+        if cached_images:
+            self.saved_images = cached_images
+            self._save_local_copies()
+            self._journal_screenshots(journal, cache_params)
+            if on_final_image is not None:
+                for i, image in enumerate(self.saved_images):
+                    on_final_image(i, image)
+            return self.saved_images
+
+        # scored frames are checked one by one and retaken if rejected, so no spare screenshots are needed
+        scored = FrameScorer.is_available() or Settings.advanced['in_memory_images']
+        n_planned_images = self.n_final_images if scored else self.n_total_images
+
+        if rls.release_type == 'season':
+            screenshot_plan, screenshot_interval = self._plan_season_screenshots(rls, n_planned_images)
+        else:
+            # the main title over all its files (eg. a DVD title's VOBs); durations come from the IFO cell times
+            # where known, otherwise from one (cached) probe per file, all run at once
+            timeline = Timeline.from_release(rls)
+            total_runtime_secs = timeline.duration
+
+            # first screenshot will be at the 5% mark of the duration
+            min_timestamp_secs = total_runtime_secs * 0.05
+            # last screenshot should be at the 60% mark of the duration; prevents late-video spoilers
+            max_timestamp_secs = total_runtime_secs * 0.6
+            screenshot_interval = (max_timestamp_secs - min_timestamp_secs) // n_planned_images
+
+            screenshot_plan = self._plan_screenshots(timeline, min_timestamp_secs, screenshot_interval,
+                                                     n_planned_images)
+        if Settings.advanced['scene_prepass'] and SceneAnalyzer.is_available():
+            screenshot_plan = self._choose_scene_timestamps(rls, screenshot_plan, screenshot_interval)
+        elif Settings.advanced['snap_to_keyframes'] and rls.release_type != 'dvd':
+            screenshot_plan = self._snap_to_keyframes(rls, screenshot_plan, screenshot_interval)
+        if scored:
+            self.saved_images = self._take_scored_screenshots(rls, screenshot_plan, screenshot_interval,
+                                                              display_width, display_height, on_final_image)
+        else:
+            # the spare screenshots are only discarded once all are taken, so none are final before then
+            self._take_screenshots(screenshot_plan)
+            compressed_images = self._create_compressed_images()
+            self.saved_images = self._discard_smallest_images(compressed_images)
+            if Settings.use_png_optimise: self._optimise_images(self.saved_images)
+            if on_final_image is not None:
+                for i, image in enumerate(self.saved_images):
+                    on_final_image(i, image)
+        self._cache_screenshots(rls, cache_params)
+        self._save_local_copies()
+        self._journal_screenshots(journal, cache_params)
 
-        if rls.release_type == 'dvd':
-            general_info = Helper.get_track(rls.primary_ifo_info['mediainfo_json'], track_type='General')
+        return self.saved_images
+
+    def _save_local_copies(self) -> None:
+        """
+        Writes in-memory screenshots to the image save location, if the user wants to keep local copies
+        :return:
+        """
+        if not Settings.advanced['keep_local_copies']:
+            return
+        for image in self.saved_images:
+            if isinstance(image, io.BytesIO):
+                with open(os.path.join(Settings.paths['image_save_location'], image.name), 'wb') as f:
+                    f.write(image.getvalue())
+
+    def _journal_screenshots(self, journal: object, cache_params: str) -> None:
+        """
+        Records the final images (after optimisation) in the release's journal, if they were saved to disk
+        :param journal (ReleaseJournal): may be None
+        :param cache_params (str): screenshot parameters the images depend on
+        :return:
+        """
+        if journal is None:
+            return
+
+        journaled_images = []
+        for image in self.saved_images:
+            if isinstance(image, io.BytesIO):
+                # in-memory images can only be resumed from the cache
+                if not Settings.advanced['keep_local_copies']:
+                    return
+                image_path = os.path.join(Settings.paths['image_save_location'], image.name)
+            else:
+                image_path = image
+            journaled_images.append({'path': image_path, 'hash': Helper.get_image_hash(image),
+                                     'timestamp': self.image_timestamps.get(image)})
+        journal.put('screenshots', {'params': cache_params, 'images': journaled_images})
+
+    def _restore_journaled_screenshots(self, journal: object, cache_params: str) -> list:
+        """
+        Reuses the final images of an unfinished earlier run, if they are all still in the image save location
+        unchanged
+        :param journal (ReleaseJournal): may be None
+        :param cache_params (str): screenshot parameters the images depend on
+        :return list<str|io.BytesIO>: the images; empty if there are none to reuse
+        """
+        journaled_screenshots = journal.get('screenshots') if journal is not None else None
+        if journaled_screenshots is None or journaled_screenshots['params'] != cache_params:
+            return []
+
+        for journaled_image in journaled_screenshots['images']:
+            if not os.path.isfile(journaled_image['path']) or \
+                    Helper.get_image_hash(journaled_image['path']) != journaled_image['hash']:
+                return []
+
+        restored_images = []
+        for journaled_image in journaled_screenshots['images']:
+            image = journaled_image['path']
+            if Settings.advanced['in_memory_images']:
+                image = io.BytesIO(Helper.read_image(journaled_image['path']))
+                image.name = os.path.basename(journaled_image['path'])
+            restored_images.append(image)
+            if journaled_image['timestamp'] is not None:
+                self.image_timestamps[image] = tuple(journaled_image['timestamp'])
+
+        print(f'Reusing {len(restored_images)} screenshots from the unfinished previous run')
+        return restored_images
+
+    def _cache_screenshots(self, rls: object, cache_params: str) -> None:
+        """
+        Stores the final images and the timestamps they were taken at, so a re-run can skip generating them
+        :param rls (ReleaseInfo): Object containing video's/DVD's paths
+        :param cache_params (str): screenshot parameters the images depend on
+        :return:
+        """
+        if not Cache.enabled:
+            return
+
+        image_hashes = []
+        for image in self.saved_images:
+            data = Helper.read_image(image)
+            image_hash = hashlib.sha256(data).hexdigest()
+            Cache.put_blob(f'image|{image_hash}', data)
+            image_hashes.append(image_hash)
+
+        Cache.put_json('screenshots', rls.input_path, {
+            'images': image_hashes,
+            'timestamps': [self.image_timestamps.get(image) for image in self.saved_images]
+        }, extra=cache_params)
+
+    def _restore_cached_screenshots(self, rls: object, cache_params: str) -> list:
+        """
+        Writes previously generated images for this release back into the image save location
+        (or into memory, when `in_memory_images` is set)
+        :param rls (ReleaseInfo): Object containing video's/DVD's paths
+        :param cache_params (str): screenshot parameters the images depend on
+        :return list<str|io.BytesIO>: the restored images; empty if they are not (or no longer all) cached
+        """
+        cached_screenshots = Cache.get_json('screenshots', rls.input_path, extra=cache_params)
+        if cached_screenshots is None:
+            return []
+
+        images_data = [Cache.get_blob(f'image|{image_hash}') for image_hash in cached_screenshots['images']]
+        if any(data is None for data in images_data):
+            return []
+
+        restored_images = []
+        for i, data in enumerate(images_data):
+            image = self._store_image(data, i)
+            restored_images.append(image)
+            self.image_timestamps[image] = cached_screenshots['timestamps'][i]
+
+        print(f'Reusing {len(restored_images)} cached screenshots')
+        return restored_images
+
+    @staticmethod
+    def _plan_screenshots(timeline: Timeline, min_timestamp: float, screenshot_interval: float,
+                          n_screenshots: int) -> list:
+        """
+        Spreads the candidate screenshots evenly over the title; for DVDs, the timeline carries on
+        from one VOB file into the next
+        :param timeline (Timeline): the main title's video files
+        :param min_timestamp (float): timestamp of the first screenshot, from the start of the title
+        :param screenshot_interval (float): interval between screenshots
+        :param n_screenshots (int): number of screenshots to plan
+        :return list<tuple<str, float>>: video file and timestamp within that file of each candidate screenshot
+        """
+        return [timeline.locate(min_timestamp + i * screenshot_interval) for i in range(n_screenshots)
+                if min_timestamp + i * screenshot_interval < timeline.duration]
+
+    @staticmethod
+    def _plan_season_screenshots(rls: object, n_screenshots: int) -> Tuple[list, float]:
+        """
+        Spreads the screenshots of a season pack over episodes evenly spaced through the season, each taken
+        within the same 5%-60% part of its episode as for a single video, at a point that moves along with every
+        screenshot; the episodes are decoded in parallel. Only the chosen episodes are probed for their durations
+        :param rls (ReleaseInfo): Object containing the episodes' paths
+        :param n_screenshots (int): number of screenshots to plan
+        :return tuple<list<tuple<str, float>>, float>: episode file and timestamp of each screenshot,
+                and the interval to keep between screenshots (eg. when retaking one)
+        """
+        episodes = rls.episode_files
+        chosen_episodes = [episodes[(2 * i + 1) * len(episodes) // (2 * n_screenshots)] for i in range(n_screenshots)]
+        unknown_duration_files = [f for f in dict.fromkeys(chosen_episodes) if f not in rls.main_video_durations]
+        durations = ProbePool.map(lambda f: MediaProbe.get(f).get_duration(), unknown_duration_files)
+        rls.main_video_durations.update(zip(unknown_duration_files, durations))
+
+        screenshot_plan = [(episode, rls.main_video_durations[episode] * (0.05 + 0.55 * (i + 0.5) / n_screenshots))
+                           for i, episode in enumerate(chosen_episodes)]
+        # as for a single video as long as the shortest chosen episode
+        screenshot_interval = min(rls.main_video_durations[f] for f in chosen_episodes) * 0.55 // n_screenshots
+        return screenshot_plan, screenshot_interval
+
+    @staticmethod
+    def _get_title_span(rls: object, video_file: str) -> Tuple[float, float]:
+        """
+        :param rls (ReleaseInfo): Object containing video's/DVD's paths, durations and start times
+        :param video_file (str): one of the main video files
+        :return tuple<float>: first and last timestamp within the file that belong to the main title
+        """
+        file_start = rls.main_video_start_times.get(video_file, 0.0)
+        return file_start, file_start + rls.main_video_durations[video_file]
+
+    @classmethod
+    def _snap_to_keyframes(cls, rls: object, screenshot_plan: list, screenshot_interval: float) -> list:
+        """
+        Moves each planned screenshot onto the nearest keyframe within half an interval of it, keeping the
+        screenshots spread out while letting ffmpeg seek straight to a decodable frame
+        :param rls (ReleaseInfo): Object containing video's paths and durations
+        :param screenshot_plan (list<tuple<str, float>>): see _plan_screenshots()
+        :param screenshot_interval (float): interval between screenshots
+        :return list<tuple<str, float>>: the plan, with timestamps snapped where the file has a keyframe index
+        """
+        video_files = list(dict.fromkeys(video_file for video_file, _ in screenshot_plan))
+        keyframes = dict(zip(video_files, ProbePool.map(KeyframeIndex.get_keyframes, video_files,
+                                                        label='Read keyframe index of')))
+
+        snapped_plan = []
+        for video_file, timestamp in screenshot_plan:
+            file_start, file_end = cls._get_title_span(rls, video_file)
+            window_start = max(file_start, timestamp - screenshot_interval / 2)
+            window_end = min(file_end, timestamp + screenshot_interval / 2)
+            snapped_plan.append((video_file, KeyframeIndex.snap_to_keyframe(keyframes[video_file], timestamp,
+                                                                            window_start, window_end)))
+        return snapped_plan
+
+    def _choose_scene_timestamps(self, rls: object, screenshot_plan: list, screenshot_interval: float) -> list:
+        """
+        Runs the keyframe-only scene pre-pass over the screenshot window, then moves each planned screenshot to the
+        best-scoring keyframe within half an interval of it, avoiding fades, black frames and repeats of the
+        previous screenshot's shot
+        :param rls (ReleaseInfo): Object containing video's/DVD's paths and durations
+        :param screenshot_plan (list<tuple<str, float>>): see _plan_screenshots()
+        :param screenshot_interval (float): interval between screenshots
+        :return list<tuple<str, float>>: the plan, with timestamps moved where the pre-pass found a keyframe
+        """
+        windows = {}
+        for video_file, timestamp in screenshot_plan:
+            file_start, file_end = self._get_title_span(rls, video_file)
+            window_start = max(file_start, timestamp - screenshot_interval / 2)
+            window_end = min(file_end, timestamp + screenshot_interval / 2)
+            start, end = windows.get(video_file, (window_start, window_end))
+            windows[video_file] = (min(start, window_start), max(end, window_end))
+
+        start = time.perf_counter()
+        all_stats = SceneAnalyzer.get_keyframe_stats([(video_file, *window) for video_file, window in windows.items()],
+                                                     self.decode_memory)
+        keyframe_stats = dict(zip(windows, all_stats))
+        print(f'Scene pre-pass scored {sum(len(stats) for stats in all_stats)} keyframes in '
+              f'{time.perf_counter() - start:.1f}s')
+
+        chosen_plan = []
+        previous_shot = None
+        for video_file, timestamp in screenshot_plan:
+            chosen = SceneAnalyzer.choose_keyframe(keyframe_stats[video_file],
+                                                   timestamp - screenshot_interval / 2,
+                                                   timestamp + screenshot_interval / 2, previous_shot)
+            if chosen is None:
+                chosen_plan.append((video_file, timestamp))
+                previous_shot = None
+            else:
+                chosen_plan.append((video_file, chosen['time']))
+                previous_shot = chosen['shot']
+        return chosen_plan
+
+    def _take_screenshots(self, screenshot_plan: list) -> None:
+        """
+        Take the planned screenshots, saved as PNG files. The screenshots of all the video files (eg. every VOB of
+        a DVD title) are scheduled together, rather than one file after another
+        :param screenshot_plan (list<tuple<str, float>>): video file and timestamp within that file of each screenshot
+        :return:
+        """
+        screenshot_jobs = {}
+        for video_file, timestamp in screenshot_plan:
+            image_file = self._get_output_filepath()
+            screenshot_jobs.setdefault(video_file, []).append((timestamp, image_file))
+            self.saved_images.append(image_file)
+            self.image_timestamps[image_file] = (os.path.basename(video_file), timestamp)
+        if not screenshot_jobs:
+            return
+
+        if Settings.advanced['screenshot_extraction'] == 'single':
+            groups = [(video_file, group) for video_file, jobs in screenshot_jobs.items()
+                      for group in self._group_nearby(jobs)]
         else:
-            mediainfo_json = Helper.get_mediainfo_json(rls.main_video_files[0])
-            general_info = Helper.get_track(mediainfo_json, track_type='General')
+            groups = [(video_file, [job]) for video_file, jobs in screenshot_jobs.items() for job in jobs]
+        # a screenshot with no other nearby is taken on its own, the same as in 'fanout' mode
+        JobScheduler.run([
+            lambda threads, video_file=video_file, group=group:
+                subprocess.Popen(self._get_multi_screenshot_args(video_file, group, threads)) if len(group) > 1
+                else self._execute_screenshot(group[0][0], video_file, group[0][1], threads)
+            for video_file, group in groups
+        ], memory_per_job=self.decode_memory)
+
+    def _take_scored_screenshots(self, rls: object, screenshot_plan: list, screenshot_interval: float,
+                                 width: int, height: int, on_final_image=None) -> list:
+        """
+        Decodes the planned frames straight into memory and scores them; each rejected frame (dark, flat or blurry)
+        is retaken a short offset away, up to MAX_RESEEKS times, so decoding stops as soon as every screenshot has a
+        good frame. Only the final frames are encoded as PNG, each round's as soon as that round is scored.
+        Scores are cached per frame, so a re-run with the same candidates only needs to decode the final frames
+        :param rls (ReleaseInfo): Object containing video's/DVD's paths and durations
+        :param screenshot_plan (list<tuple<str, float>>): video file and timestamp of each screenshot
+        :param screenshot_interval (float): interval between screenshots
+        :param width (int): width of the (display-scaled) frames
+        :param height (int): height of the (display-scaled) frames
+        :param on_final_image (callable): see generate_screenshots()
+        :return list<str|io.BytesIO>: the PNG images (see _store_image()), in chronological order
+        """
+        score_params = f'{self.scale_filter}|{"numpy" if FrameScorer.is_available() else "jpeg"}'
+        n_decoded = 0
+        # frames tried for each screenshot
+        n_attempts = [0] * len(screenshot_plan)
+        # number of each unfinished screenshot -> (candidate, score) of its best frame so far, and that frame itself
+        # while it is decoded; only the best frame is kept, as full-size frames of 4K video are large
+        best = {}
+        best_frames = {}
+        final_images = {}
+
+        def rank(score):
+            # good frames first, then by score
+            return self._is_good_frame(score, width, height), score['score']
+
+        candidates = dict(enumerate(screenshot_plan))
+        for n_reseek in range(1, self.MAX_RESEEKS + 2):
+            scores = {i: Cache.get_json('frame_score', video_file, extra=f'{timestamp}|{score_params}')
+                      for i, (video_file, timestamp) in candidates.items()}
+
+            # the frames of a round are decoded together, so each round takes about as long as one frame
+            undecoded = [i for i, score in scores.items() if score is None]
+            frames = dict(zip(undecoded, self._grab_frames([candidates[i] for i in undecoded], width, height)))
+            for i, frame in frames.items():
+                video_file, timestamp = candidates[i]
+                scores[i] = self._score_frame(frame, width, height)
+                if frame is not None:
+                    Cache.put_json('frame_score', video_file, scores[i], extra=f'{timestamp}|{score_params}')
+            n_decoded += len(undecoded)
+
+            for i, candidate in candidates.items():
+                n_attempts[i] += 1
+                if i not in best or rank(scores[i]) > rank(best[i][1]):
+                    best[i] = (candidate, scores[i])
+                    if i in frames:
+                        best_frames[i] = frames[i]
+                    else:
+                        best_frames.pop(i, None)
+            del frames
+
+            # screenshots with a good frame are final, and are passed on while the others are retaken; after the
+            # last retake, the rest settle for their best rejected frame
+            winners = [i for i in candidates
+                       if self._is_good_frame(scores[i], width, height) or n_reseek > self.MAX_RESEEKS]
+            undecoded_winners = [i for i in winners if i not in best_frames]
+            best_frames.update(zip(undecoded_winners,
+                                   self._grab_frames([best[i][0] for i in undecoded_winners], width, height)))
+            n_decoded += len(undecoded_winners)
+            final_images.update(self._finalise_screenshots({i: best.pop(i)[0] for i in winners},
+                                                           {i: best_frames.pop(i) for i in winners},
+                                                           width, height, on_final_image))
+
+            candidates = {i: self._get_reseek_candidate(rls, screenshot_plan[i], screenshot_interval, n_reseek)
+                          for i in candidates if i not in winners}
+            if not candidates:
+                break
+
+        n_retaken = sum(n_attempts) - len(screenshot_plan)
+        print(f'Decoded {n_decoded} frames for {len(final_images)} screenshots ({n_retaken} retaken)')
+        return [final_images[i] for i in range(len(screenshot_plan)) if i in final_images]
+
+    def _finalise_screenshots(self, winners: dict, frames: dict, width: int, height: int, on_final_image) -> dict:
+        """
+        Encodes the chosen frames of finished screenshots as PNG (optimised, if `use_png_optimise` is set)
+        and passes them on
+        :param winners (dict<int, tuple<str, float>>): number of each finished screenshot -> its chosen frame
+        :param frames (dict<int, bytes>): number of each finished screenshot -> its chosen raw rgb24 frame;
+                None where ffmpeg returned no frame, and the screenshot is left out
+        :param width (int): width of the frames
+        :param height (int): height of the frames
+        :param on_final_image (callable): see generate_screenshots(); may be None
+        :return dict<int, str|io.BytesIO>: number of each screenshot -> its PNG image (see _store_image())
+        """
+        from PIL import Image
 
-        total_runtime_secs = float(general_info['Duration'])
-        # first screenshot will be at the 5% mark of the duration
-        min_timestamp_secs = total_runtime_secs * 0.05
-        # last screenshot should be at the 60% mark of the duration; prevents late-video spoilers
-        max_timestamp_secs = total_runtime_secs * 0.6
+        final_images = {}
+        for i, (video_file, timestamp) in sorted(winners.items()):
+            if frames[i] is None:
+                print(f'Skipping screenshot {i}: ffmpeg did not return a frame for {video_file} near {timestamp}s')
+                continue
+            png_buffer = io.BytesIO()
+            Image.frombytes('RGB', (width, height), frames[i]).save(png_buffer, format='PNG')
+            final_images[i] = self._store_image(png_buffer.getvalue(), i)
+            self.image_timestamps[final_images[i]] = (os.path.basename(video_file), timestamp)
+
+        if Settings.use_png_optimise and final_images:
+            self._optimise_images(list(final_images.values()))
+        if on_final_image is not None:
+            for i, image in final_images.items():
+                on_final_image(i, image)
+        return final_images
 
-        screenshot_interval = (max_timestamp_secs - min_timestamp_secs) // self.n_total_images
-        current_timestamp = min_timestamp_secs
+    def _get_reseek_candidate(self, rls: object, planned: tuple, screenshot_interval: float, n_reseek: int) -> tuple:
+        """
+        Gets where to retake a rejected screenshot: alternately after and before its planned time, a little further
+        each time, and on a keyframe when the file has a keyframe index
+        :param rls (ReleaseInfo): Object containing video's/DVD's paths and durations
+        :param planned (tuple<str, float>): video file and planned timestamp of the screenshot
+        :param screenshot_interval (float): interval between screenshots
+        :param n_reseek (int): number of this retake, from 1
+        :return tuple<str, float>: video file and timestamp to retake the screenshot at
+        """
+        video_file, timestamp = planned
+        # stays within a quarter interval of the planned time, clear of the neighbouring screenshots
+        offset_step = screenshot_interval / (4 * ((self.MAX_RESEEKS + 1) // 2))
+        offset = offset_step * ((n_reseek + 1) // 2) * (1 if n_reseek % 2 else -1)
+        file_start, file_end = self._get_title_span(rls, video_file)
+        retake_timestamp = min(max(file_start, timestamp + offset), file_end - 1)
+
+        if Settings.advanced['snap_to_keyframes'] and rls.release_type != 'dvd':
+            retake_timestamp = KeyframeIndex.snap_to_keyframe(KeyframeIndex.get_keyframes(video_file),
+                                                              retake_timestamp,
+                                                              retake_timestamp - offset_step / 2,
+                                                              retake_timestamp + offset_step / 2)
+        return video_file, retake_timestamp
+
+    def _is_good_frame(self, score: dict, width: int, height: int) -> bool:
+        """
+        :param score (dict): see _score_frame()
+        :param width (int): frame width
+        :param height (int): frame height
+        :return bool: False if the frame should be retaken
+        """
+        if 'brightness' in score:
+            return FrameScorer.is_good(score)
+        return score['score'] >= width * height * self.MIN_JPEG_BYTES_PER_PIXEL
 
-        # import pdb; pdb.set_trace()
-        for video_file in rls.main_video_files:
-            next_timestamp = self._take_screenshots(video_file, current_timestamp, screenshot_interval)
-            current_timestamp = next_timestamp
+    @staticmethod
+    def _score_frame(frame: bytes, width: int, height: int) -> dict:
+        """
+        :param frame (bytes): raw rgb24 frame; None if ffmpeg returned no frame
+        :param width (int): frame width
+        :param height (int): frame height
+        :return dict: at least a 'score'; higher for more detailed frames
+        """
+        # a missing frame is rejected, and ranks below every decoded one
+        if frame is None:
+            return {'score': float('-inf')}
+        if FrameScorer.is_available():
+            return FrameScorer.score_rgb_frame(frame, width, height)
 
-        compressed_images = self._create_compressed_images()
-        self.saved_images = self._discard_smallest_images(compressed_images)
-        if Settings.use_png_optimise: self._optimise_images()
+        # without NumPy, use the size of a low-quality JPEG of the frame; low-detail frames compress much smaller
+        from PIL import Image
 
-        return self.saved_images
+        jpeg_buffer = io.BytesIO()
+        Image.frombytes('RGB', (width, height), frame).save(jpeg_buffer, format='JPEG', optimize=True, quality=15)
+        return {'score': jpeg_buffer.tell()}
+
+    def _store_image(self, data: bytes, num: int):
+        """
+        Keeps an encoded screenshot in memory if `in_memory_images` is set, otherwise saves it to the image save location
+        :param data (bytes): PNG file content
+        :param num (int): number of the screenshot
+        :return str|io.BytesIO: file path of the saved image, or the in-memory image (named like the file would be)
+        """
+        output_filepath = self._get_output_filepath(num)
+        if Settings.advanced['in_memory_images']:
+            image = io.BytesIO(data)
+            image.name = os.path.basename(output_filepath)
+            return image
+
+        with open(output_filepath, 'wb') as f:
+            f.write(data)
+        return output_filepath
 
-    def _take_screenshots(self, video_file: str, current_timestamp: float, screenshot_interval: float) -> float:
+    def _grab_frames(self, screenshot_plan: list, width: int, height: int) -> list:
         """
-        Take screenshots for a given video file.
+        Decodes frames to raw rgb24, piped from ffmpeg, without writing anything to disk
+        :param screenshot_plan (list<tuple<str, float>>): video file and timestamp of each frame
+        :param width (int): width of the (display-scaled) frames
+        :param height (int): height of the (display-scaled) frames
+        :return list<bytes|None>: one frame per planned screenshot, in the same order; None where ffmpeg returned no
+                frame (eg. a decoding error, or a timestamp past the last frame)
+        """
+        if not screenshot_plan:
+            return []
+
+        frame_size = width * height * 3
+
+        if Settings.advanced['screenshot_extraction'] == 'single':
+            # one process per group of nearby frames, outputting them back to back
+            plan_per_file = {}
+            for i, (video_file, timestamp) in enumerate(screenshot_plan):
+                plan_per_file.setdefault(video_file, []).append((timestamp, i))
+            groups = [(video_file, group) for video_file, plan in plan_per_file.items()
+                      for group in self._group_nearby(plan)]
+            outputs = JobScheduler.run_for_output([
+                lambda threads, video_file=video_file, group=group: subprocess.Popen(
+                    self._get_raw_frames_args(video_file, [timestamp for timestamp, _ in group], threads),
+                    stdout=subprocess.PIPE)
+                for video_file, group in groups
+            ], memory_per_job=self.decode_memory)
+
+            frames = [b''] * len(screenshot_plan)
+            for (_, group), output in zip(groups, outputs):
+                for n, (_, i) in enumerate(group):
+                    frames[i] = output[n * frame_size:(n + 1) * frame_size]
+        else:
+            frames = JobScheduler.run_for_output([
+                lambda threads, video_file=video_file, timestamp=timestamp: subprocess.Popen(
+                    self._get_raw_frames_args(video_file, [timestamp], threads), stdout=subprocess.PIPE)
+                for video_file, timestamp in screenshot_plan
+            ], memory_per_job=self.decode_memory)
+
+        return [frame if len(frame) == frame_size else None for frame in frames]
+
+    def _get_raw_frames_args(self, video_file: str, timestamps: list, threads: int = 0) -> list:
+        """
+        Builds an ffmpeg command writing the frame at each timestamp to stdout as raw rgb24, in order, taken in one
+        decoding pass (see _get_single_pass_filters()), so the frames match those of the PNG screenshots
         :param video_file (str): path to video file
-        :param current_timestamp (float): timestamp at which to take the screenshot
-        :param screenshot_interval (float): interval by which to increase the timestamp for the next screenshot
-        :return next_timestamp (float): time stamp for the next video; applicable only for DVDs where
-                there are multiple VOB files. Screenshots will span throughout several files
-        """
-        mediainfo_json = Helper.get_mediainfo_json(video_file)
-        general_info = Helper.get_track(mediainfo_json, track_type='General')
-        duration_seconds = float(general_info.get('Duration'))
-
-        processes: list[subprocess.Popen] = []
-        while current_timestamp < duration_seconds and len(self.saved_images) < self.n_total_images:
-            image_file, process = self._execute_screenshot(current_timestamp, video_file)
-            processes.append(process)
-            self.saved_images.append(image_file)
-            current_timestamp += screenshot_interval
+        :param timestamps (list<float>): ascending timestamps within the file
+        :param threads (int): threads ffmpeg may use for decoding; 0 lets ffmpeg decide
+        :return list<str>: ffmpeg arguments
+        """
+        filters = self._get_single_pass_filters(timestamps, f'setpts=PTS-STARTPTS,{self.scale_filter},setsar=1')
+        concat = ''.join(f'[v{i}]' for i in range(len(timestamps))) + f'concat=n={len(timestamps)}:v=1:a=0'
+        filter_complex = ';'.join(filters + [f'{concat},format=rgb24[frames]'])
+
+        # the frames all start at 0 after concat; passthrough keeps ffmpeg from dropping them as duplicates
+        return [Settings.paths['ffmpeg_bin_path'], '-hide_banner', '-loglevel', 'panic', '-threads', str(threads),
+                '-ss', str(timestamps[0]), '-i', IsoImage.get_ffmpeg_input(video_file),
+                '-filter_complex', filter_complex, '-map', '[frames]', '-vsync', 'passthrough',
+                '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1']
 
-        for proc in processes:
-            proc.wait()
+    def _get_output_filepath(self, num: int = None) -> str:
+        """
+        :param num (int): number of the screenshot; defaults to the number of screenshots saved so far
+        :return output_filepath (str): File path for the next PNG screenshot file
+        """
+        now = datetime.datetime.now().strftime('%Y-%m-%d %H-%M-%S')
+        num = len(self.saved_images) if num is None else num
+        output_filename = '{prefix}snapshot_{num} {now}.png'.format(prefix=self.image_name_prefix, num=num, now=now)
+        return os.path.join(Settings.paths['image_save_location'], output_filename)
 
-        next_timestamp = current_timestamp - duration_seconds
-        return next_timestamp
+    def _get_multi_screenshot_args(self, video_file: str, screenshot_jobs: list, threads: int = 0) -> list:
+        """
+        Builds a single ffmpeg command taking several nearby screenshots of a video file in one decoding pass
+        (see _get_single_pass_filters()), each mapped to its own output
+        :param video_file (str): path to video file
+        :param screenshot_jobs (list<tuple<float, str>>): timestamp and output PNG path of each screenshot,
+                by ascending timestamp
+        :param threads (int): threads ffmpeg may use for decoding; 0 lets ffmpeg decide
+        :return list<str>: ffmpeg arguments
+        """
+        timestamps = [timestamp for timestamp, _ in screenshot_jobs]
+        args = [Settings.paths['ffmpeg_bin_path'], '-hide_banner', '-loglevel', 'panic', '-threads', str(threads),
+                '-ss', str(timestamps[0]), '-i', IsoImage.get_ffmpeg_input(video_file),
+                '-filter_complex', ';'.join(self._get_single_pass_filters(timestamps, self.scale_filter))]
+        for i, (_, output_filepath) in enumerate(screenshot_jobs):
+            args += ['-map', f'[v{i}]', *self.FFMPEG_SCREENSHOT_OUTPUT_ARGS, output_filepath]
+        return args
 
-    def _execute_screenshot(self, timestamp: float, video_file: str) -> str:
+    @staticmethod
+    def _get_single_pass_filters(timestamps: list, frame_filters: str) -> list:
+        """
+        Filter chains picking the frames at several timestamps of one input, which is seeked to the first of them
+        and decoded once. The decoded video is split, and each branch keeps only the first frame at or after its own
+        timestamp; the same frame that seeking the input to that timestamp gives
+        :param timestamps (list<float>): ascending timestamps; the input must be seeked to the first one
+        :param frame_filters (str): filters applied to each picked frame
+        :return list<str>: filter chains, labelling the picked frames [v0], [v1], ...
+        """
+        splits = ''.join(f'[s{i}]' for i in range(len(timestamps)))
+        filters = [f'[0:V:0]split={len(timestamps)}{splits}']
+        for i, timestamp in enumerate(timestamps):
+            filters.append(f"[s{i}]select='gte(t\\,{timestamp - timestamps[0]})',trim=end_frame=1,"
+                           f"{frame_filters}[v{i}]")
+        return filters
+
+    @classmethod
+    def _group_nearby(cls, jobs: list) -> list:
+        """
+        Groups a file's screenshots whose timestamps are at most SINGLE_PASS_MAX_GAP apart, to be taken in one pass
+        :param jobs (list<tuple>): screenshots, each a tuple starting with its timestamp
+        :return list<list<tuple>>: the groups, each by ascending timestamp
+        """
+        groups = []
+        for job in sorted(jobs, key=lambda job: job[0]):
+            if groups and job[0] - groups[-1][-1][0] <= cls.SINGLE_PASS_MAX_GAP:
+                groups[-1].append(job)
+            else:
+                groups.append([job])
+        return groups
+
+    def _execute_screenshot(self, timestamp: float, video_file: str, output_filepath: str,
+                            threads: int = 0) -> subprocess.Popen:
         """
         Take a screenshot for video_file at given timestamp
         :param timestamp (float): timestamp at which to take a screenshot
         :param video_file (str): path to video file
-        :return output_filepath (str): File path for the resulting PNG screenshot file
+        :param output_filepath (str): File path for the resulting PNG screenshot file
+        :param threads (int): threads ffmpeg may use for decoding; 0 lets ffmpeg decide
+        :return subprocess.Popen: the running ffmpeg process
         """
-        now = datetime.datetime.now().strftime('%Y-%m-%d %H-%M-%S')
-        output_filename = 'snapshot_{num} {now}.png'.format(num=len(self.saved_images), now=now)
-        output_filepath = os.path.join(Settings.paths['image_save_location'], output_filename)
-
         args = self.FFMPEG_SCREENSHOT_ARGS.format(
             ffmpeg_bin_location=Settings.paths['ffmpeg_bin_path'],
+            threads=threads,
             timestamp=timestamp,
-            video_filepath=video_file,
+            video_filepath=IsoImage.get_ffmpeg_input(video_file),
             param_DAR=self.param_DAR,
             output_filepath=output_filepath
         )
         process = subprocess.Popen(args, shell=True)
 
-        return output_filepath, process
+        return process
 
     def _create_compressed_images(self) -> list:
         """
         Create compressed images from the PNG files generated.
         :return compressed_images (list<str>): List of paths of the resulting compressed image files
         """
+        from PIL import Image
+
         compressed_images = []
         for image_path in self.saved_images:
             image_path_no_ext = os.path.splitext(image_path)[0]
@@ -126,20 +726,36 @@ class ScreenshotGenerator:
             compressed_images.append(compressed_image_path)
         return compressed_images
 
-    def _optimise_images(self) -> None:
+    def _optimise_images(self, images: list) -> None:
+        """
+        :param images (list<str|io.BytesIO>): PNG images to optimise in place
+        :return:
+        """
         print("Optimizing images!")
-        processes = []
-        for img in self.saved_images:
-            proc = subprocess.Popen(self.OXIPNG_ARGS.format(
-                oxi_bin_location = Settings.paths['optimise_bin_path'],
+        if Settings.advanced['in_memory_images']:
+            optimised_images = JobScheduler.run_for_output([
+                lambda threads: subprocess.Popen(
+                    [Settings.paths['oxipng_bin_path'], '-t', str(threads), *self.OXIPNG_STDIO_ARGS],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+                for _ in images
+            ], memory_per_job=self.image_memory, inputs=[img.getvalue() for img in images])
+
+            for img, optimised_image in zip(images, optimised_images):
+                # keep the unoptimised image if oxipng failed
+                if optimised_image:
+                    img.seek(0)
+                    img.truncate()
+                    img.write(optimised_image)
+            return
+
+        JobScheduler.run([
+            lambda threads, img=img: subprocess.Popen(self.OXIPNG_ARGS.format(
+                oxi_bin_location = Settings.paths['oxipng_bin_path'],
+                threads = threads,
                 images = f'"{img}"'
             ), shell=True)
-
-            processes.append(proc)
-
-        for proc in processes:
-            proc.wait()
-
+            for img in images
+        ], memory_per_job=self.image_memory)
 
     def _discard_smallest_images(self, compressed_images: list) -> list:
         """
@@ -168,12 +784,7 @@ class ScreenshotGenerator:
         :param rls (ReleaseInfo): Object containing video's/DVD's paths and any already-gathered mediainfo
         :return tuple<int>: Video dimensions: width, height
         """
-        if rls.release_type == 'dvd':
-            mediainfo_json = rls.primary_ifo_info['mediainfo_json']
-        else:
-            mediainfo_json = Helper.get_mediainfo_json(rls.main_video_files[0])
-
-        video_info = Helper.get_track(mediainfo_json, track_type='Video')
+        video_info = Helper.get_track(ScreenshotGenerator._get_video_mediainfo_json(rls), track_type='Video')
 
         pixel_width = display_width = int(video_info['Width'])
         pixel_height = display_height = int(video_info['Height'])
@@ -188,3 +799,16 @@ class ScreenshotGenerator:
             display_height = int(pixel_width / dar_float)
 
         return display_width, display_height
+
+    @staticmethod
+    def _get_video_mediainfo_json(rls: object) -> dict:
+        """
+        :param rls (ReleaseInfo): Object containing video's/DVD's paths and any already-gathered mediainfo
+        :return dict: mediainfo of the file describing the video stream; the primary IFO for DVDs,
+                and the main playlist's main stream file for Blu-rays
+        """
+        if rls.release_type == 'dvd':
+            return rls.primary_ifo_info['mediainfo_json']
+        if rls.release_type == 'bluray':
+            return Helper.get_mediainfo_json(rls.main_playlist_info['main_clip'])
+        return Helper.get_mediainfo_json(rls.main_video_files[0])
@@ -26,6 +26,52 @@ IMAGE_HOSTS_SKELETON = [
         'default': False
     }
 ]
+# tuning values that are not asked for during setup; edit ReleaseInfoCreator.json to change them
+ADVANCED_SETTINGS_SKELETON = {
+    'cache_max_size_mb': 1024,
+    # 'auto' uses libmediainfo in-process when it can be loaded, otherwise the CLI; 'library' or 'cli' to force
+    'mediainfo_backend': 'auto',
+    # leave blank to search the usual install locations for libmediainfo
+    'mediainfo_library_path': '',
+    # concurrent file probes overall, and against any single disk; keep the latter low for spinning disks
+    'probe_workers': 8,
+    'probe_concurrency_per_device': 2,
+    # 'fanout' runs one ffmpeg per screenshot; 'single' also takes the screenshots of a file that are at most 10s apart
+    # in one decoding pass, which only saves work when screenshots are close together (evenly spread ones never are)
+    'screenshot_extraction': 'fanout',
+    # limits for concurrently running ffmpeg/oxipng processes; 0 for one per CPU core, and 3/4 of available memory
+    'max_parallel_jobs': 0,
+    'job_memory_limit_mb': 0,
+    # keep screenshots in memory from ffmpeg to upload, instead of saving them to the image save location;
+    # with keep_local_copies, the final images are also written there
+    'in_memory_images': False,
+    'keep_local_copies': False,
+    # move each screenshot onto the nearest keyframe (from the MKV/MP4 index) within half an interval of its
+    # planned time, so ffmpeg decodes one frame per screenshot instead of a whole GOP
+    'snap_to_keyframes': True,
+    # before taking screenshots, decode only the keyframes of the screenshot window at a tiny size and take each
+    # screenshot at the best-scoring keyframe near its planned time (requires numpy)
+    'scene_prepass': False,
+    # uploads running at once, and started per second (0 for no limit), against any one image host
+    'upload_concurrency_per_host': 4,
+    'upload_requests_per_second_per_host': 0,
+    # times an upload failing with a connection error or a transient server error is retried, with backoff
+    'upload_max_retries': 4,
+    # days an uploaded image's URL is reused for identical images instead of uploading them again (0 to never reuse);
+    # reused URLs are first checked to still be reachable
+    'upload_reuse_days': {'ptpimg': 365, 'imgbb': 180, 'hdbimg': 365},
+    # upload each screenshot as soon as it is final, while later ones are still being generated; ptpimg uploads them in
+    # batches, each as soon as it is full (not for hdbimg, which uploads all screenshots as one gallery)
+    'upload_while_generating': True,
+    # releases processed at once in batch and watch-folder modes; they share the probe, ffmpeg and upload limits above
+    'batch_parallel_releases': 2,
+    # watch-folder mode: seconds a new release must stay unchanged before it is processed (eg. while it is copied),
+    # and how often the watch folders are checked without inotify (or while a release is still changing)
+    'watch_stable_seconds': 60,
+    'watch_poll_seconds': 10,
+    # season packs: probe 'all' episodes for the episode table, or only the first, middle and last ('representative')
+    'season_probe_episodes': 'all',
+}
 
 
 class Settings:
@@ -42,6 +88,7 @@ class Settings:
     print_not_copy = False
     use_bbcode_tags = False
     use_png_optimise = False
+    advanced = dict(ADVANCED_SETTINGS_SKELETON)
 
     @classmethod
     def load_settings(cls):
@@ -59,6 +106,7 @@ class Settings:
             cls.print_not_copy = settings_from_file.get('print_not_copy')
             cls.use_bbcode_tags = settings_from_file.get('use_bbcode_tags')
             cls.use_png_optimise = settings_from_file.get('use_png_optimise')
+            cls.advanced = {**ADVANCED_SETTINGS_SKELETON, **settings_from_file.get('advanced', {})}
 
             cls._append_missing_settings(settings_from_file)
             cls._expand_paths()
@@ -182,6 +230,7 @@ class Settings:
             'print_not_copy': cls.print_not_copy,
             'use_bbcode_tags': cls.use_bbcode_tags,
             'use_png_optimise': cls.use_png_optimise,
+            'advanced': cls.advanced,
         }
 
     @classmethod
@@ -272,6 +321,10 @@ class Settings:
             is_missing_settings = True
             cls._query_oxipng_path()
 
+        # advanced settings have usable defaults, so they are written back without querying the user
+        if any(key not in settings_from_file.get('advanced', {}) for key in ADVANCED_SETTINGS_SKELETON):
+            is_missing_settings = True
+
         if is_missing_settings:
             with open(cls.settings_file_path, 'w', encoding='utf8') as f:
                 json.dump(cls._get_settings_dict(), f, indent=4)
@@ -0,0 +1,91 @@
+import queue
+import threading
+import time
+
+
+class StageGraph:
+    """
+    Runs the stages of a run (eg. gathering mediainfo, generating screenshots, uploading) as soon as the stages
+    they depend on have finished, so independent stages run concurrently. Afterwards, print_timings() shows the
+    critical path: the chain of stages that the total wall time was spent waiting on
+    """
+
+    def __init__(self):
+        # stage name -> (function, names of the stages it depends on)
+        self._stages = {}
+        # stage name -> (start, end) times of the stage
+        self._times = {}
+        self._start_time = None
+        self._end_time = None
+
+    def add(self, name: str, fn, deps: tuple = ()):
+        """
+        :param name (str): name of the stage
+        :param fn (callable): runs the stage; takes the results of the stages it depends on as keyword arguments,
+                named after those stages
+        :param deps (tuple<str>): names of the stages to wait for; these must have been added already
+        :return:
+        """
+        for dep in deps:
+            assert dep in self._stages, f'Stage {name} depends on unknown stage {dep}'
+        self._stages[name] = (fn, tuple(deps))
+
+    def run(self) -> dict:
+        """
+        Runs every stage, each on its own thread. If a stage fails, no further stages are started, and its
+        exception is raised here
+        :return dict: stage name -> result of the stage
+        """
+        results = {}
+        finished_stages = queue.Queue()
+        pending = dict(self._stages)
+        n_running = 0
+        self._start_time = time.monotonic()
+
+        while pending or n_running:
+            for name, (fn, deps) in list(pending.items()):
+                if all(dep in results for dep in deps):
+                    del pending[name]
+                    n_running += 1
+                    threading.Thread(target=self._run_stage, name=f'stage-{name}', daemon=True,
+                                     args=(name, fn, {dep: results[dep] for dep in deps}, finished_stages)).start()
+
+            name, result, error = finished_stages.get()
+            n_running -= 1
+            if error is not None:
+                raise error
+            results[name] = result
+
+        self._end_time = time.monotonic()
+        return results
+
+    def print_timings(self):
+        """
+        Prints the critical path of the last run, and its total wall time
+        :return:
+        """
+        # walk back from the last stage to finish, each time to the dependency that finished last
+        path = []
+        name = max(self._times, key=lambda stage: self._times[stage][1], default=None)
+        while name is not None:
+            path.append(name)
+            name = max(self._stages[name][1], key=lambda dep: self._times[dep][1], default=None)
+
+        print('Critical path: ' + ' -> '.join(
+            f'{name} ({self._times[name][1] - self._times[name][0]:.1f}s)' for name in reversed(path)))
+        print(f'Total wall time: {self._end_time - self._start_time:.1f}s')
+
+    def get_durations(self) -> dict:
+        """
+        :return dict<str, float>: stage name -> seconds the stage ran for in the last run
+        """
+        return {name: end_time - start_time for name, (start_time, end_time) in self._times.items()}
+
+    def _run_stage(self, name: str, fn, kwargs: dict, finished_stages: queue.Queue):
+        start_time = time.monotonic()
+        try:
+            result, error = fn(**kwargs), None
+        except BaseException as e:
+            result, error = None, e
+        self._times[name] = (start_time, time.monotonic())
+        finished_stages.put((name, result, error))
@@ -0,0 +1,48 @@
+import bisect
+
+from MediaProbe import MediaProbe
+from ProbePool import ProbePool
+
+
+class Timeline:
+    """
+    The main title as one continuous timeline over its video files (eg. the VOB files of a DVD title, or the clips
+    of a Blu-ray playlist, played one after another), mapping timestamps within the title onto a file and a
+    timestamp within that file
+    """
+
+    def __init__(self, segments: list):
+        """
+        :param segments (list<tuple<str, float, float>>): video file, the duration in seconds the title plays of it,
+                and the timestamp within the file at which it starts playing, in playback order
+        """
+        self.segments = segments
+        self.segment_starts = []
+        self.duration = 0.0
+        for _, duration, _ in segments:
+            self.segment_starts.append(self.duration)
+            self.duration += duration
+
+    @classmethod
+    def from_release(cls, rls: object) -> 'Timeline':
+        """
+        Builds the timeline of a release's main video files. Durations already known (eg. from the DVD's IFO cell
+        times or Blu-ray play items) are used as they are; the others are probed, all at once, and stored in
+        rls.main_video_durations
+        :param rls (ReleaseInfo): Object containing video's/DVD's paths and any already-known durations
+        :return Timeline:
+        """
+        unknown_duration_files = [f for f in rls.main_video_files if f not in rls.main_video_durations]
+        durations = ProbePool.map(lambda f: MediaProbe.get(f).get_duration(), unknown_duration_files)
+        rls.main_video_durations.update(zip(unknown_duration_files, durations))
+        return cls([(f, rls.main_video_durations[f], rls.main_video_start_times.get(f, 0.0))
+                    for f in rls.main_video_files])
+
+    def locate(self, timestamp: float) -> tuple:
+        """
+        :param timestamp (float): seconds from the start of the title
+        :return tuple<str, float>: the video file playing at that time, and the timestamp within that file
+        """
+        i = max(0, bisect.bisect_right(self.segment_starts, timestamp) - 1)
+        video_file, duration, file_start = self.segments[i]
+        return video_file, file_start + min(timestamp - self.segment_starts[i], duration)
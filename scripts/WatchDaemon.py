@@ -0,0 +1,304 @@
+import collections
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import threading
+import time
+import traceback
+
+from IsoImage import ISO_EXTS
+from JobQueue import JobQueue
+from ReleaseInfo import VIDEO_FILE_TYPES
+from Settings import Settings
+
+# inotify events on a watched folder that may mean a release was added or is still being copied
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+# even with inotify, rescan this often, in case events were missed (eg. on network filesystems)
+FULL_RESCAN_SECONDS = 300
+# stage durations kept for the status file's latency figures
+LATENCY_SAMPLES = 100
+# suffix of the result files written next to each release
+RESULT_FILE_SUFFIX = '.release-info.txt'
+
+
+class InotifyWatcher:
+    """
+    Wakes the daemon as soon as anything is added to or written in a watched folder (Linux only)
+    """
+
+    def __init__(self, folders: list):
+        """
+        :param folders (list<str>): folders to watch
+        :raise OSError: if inotify is not available
+        """
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError('libc not found')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        for folder in folders:
+            if libc.inotify_add_watch(self.fd, os.fsencode(folder),
+                                      IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f'Could not watch {folder}')
+
+    def wait(self, timeout: float) -> bool:
+        """
+        :param timeout (float): most seconds to wait
+        :return bool: True if anything changed in the watched folders
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        # the events themselves are not needed; the folders are rescanned
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+
+class WatchDaemon:
+    """
+    Watches folders for new releases and processes each one once it has stopped changing (eg. finished copying).
+    Releases are queued in JobQueue, so none are lost if the daemon stops, and processed by long-lived workers,
+    which keep imports, the cache and HTTP connections warm between releases. The result of each release is written
+    next to it; queue depth, stage latencies and throughput are written to a JSON status file
+    """
+
+    def __init__(self, watch_folders: list, image_host: dict, process_release, status_file_path: str):
+        """
+        :param watch_folders (list<str>): folders to watch; every video file, disc image or folder directly inside
+                them is a release
+        :param image_host (dict): image host to upload to
+        :param process_release (callable): takes an input path, the image host and a prefix for the screenshot names;
+                returns the release's mediainfo, formatted image URLs and the StageGraph that produced them
+        :param status_file_path (str): path of the JSON status file
+        """
+        self.watch_folders = [os.path.abspath(folder) for folder in watch_folders]
+        self.image_host = image_host
+        self.process_release = process_release
+        self.status_file_path = status_file_path
+
+        # release path -> (signature, time it last changed) of releases waiting to stop changing
+        self._candidates = {}
+        # release path -> signature it was queued with (or found already queued with)
+        self._queued_signatures = {}
+        self._lock = threading.Lock()
+        self._job_available = threading.Condition(self._lock)
+        self._running_jobs = {}
+        # stage name -> durations in seconds of its most recent runs
+        self._stage_durations = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_SAMPLES))
+        self._finish_times = collections.deque()
+        self._watcher_type = 'polling'
+        self._started_at = time.time()
+        # message of the last error writing the status file, if the last write failed
+        self._status_error = None
+
+    def run(self):
+        """
+        Runs until interrupted (Ctrl+C); a job that is interrupted is queued again on the next start
+        :return:
+        """
+        for folder in self.watch_folders:
+            assert os.path.isdir(folder), f'Watch folder does not exist: {folder}'
+
+        n_requeued = JobQueue.requeue_interrupted()
+        if n_requeued:
+            print(f'Resuming {n_requeued} interrupted jobs')
+        self._warm_up()
+
+        try:
+            watcher = InotifyWatcher(self.watch_folders)
+            self._watcher_type = 'inotify'
+        except (OSError, AttributeError) as e:
+            print(f'Could not use inotify ({e}); polling the watch folders instead')
+            watcher = None
+
+        for i in range(Settings.advanced['batch_parallel_releases']):
+            threading.Thread(target=self._work, name=f'watch-worker-{i}', daemon=True).start()
+
+        print(f'Watching {", ".join(self.watch_folders)} ({self._watcher_type}); status in {self.status_file_path}')
+        poll_seconds = Settings.advanced['watch_poll_seconds']
+        last_scan_time = 0
+        while True:
+            if watcher is None:
+                time.sleep(poll_seconds)
+                changed = True
+            else:
+                changed = watcher.wait(poll_seconds)
+            # unstable releases are checked on every poll, as changes deep inside a folder are not reported
+            if changed or self._candidates or time.monotonic() - last_scan_time > FULL_RESCAN_SECONDS:
+                self._scan()
+                last_scan_time = time.monotonic()
+            self._write_status()
+
+    def _warm_up(self):
+        """
+        Pays the one-off import costs once, before the first release arrives
+        :return:
+        """
+        import ImageUploader  # noqa: F401
+        import ScreenshotGenerator  # noqa: F401
+        from PIL import Image  # noqa: F401
+        if self.image_host['name'] in ImageUploader.GALLERY_UPLOAD_HOSTS:
+            import guessit  # noqa: F401
+
+    def _scan(self):
+        """
+        Finds the releases in the watch folders, and queues those that have not changed for `watch_stable_seconds`
+        :return:
+        """
+        # a release removed mid-scan, or a watch folder that is unmounted, is skipped until the next scan
+        signatures = {}
+        for folder in self.watch_folders:
+            try:
+                entries = list(os.scandir(folder))
+            except OSError as e:
+                print(f'Could not scan watch folder {folder} ({e})')
+                continue
+            for entry in entries:
+                try:
+                    if self._is_release(entry):
+                        signatures[entry.path] = self._get_signature(entry)
+                except OSError as e:
+                    print(f'Could not read {entry.path} ({e})')
+
+        now = time.monotonic()
+        with self._lock:
+            for path, signature in signatures.items():
+                if self._queued_signatures.get(path) == signature:
+                    self._candidates.pop(path, None)
+                    continue
+                previous = self._candidates.get(path)
+                if previous is None or previous[0] != signature:
+                    self._candidates[path] = (signature, now)
+                elif now - previous[1] >= Settings.advanced['watch_stable_seconds']:
+                    del self._candidates[path]
+                    self._queued_signatures[path] = signature
+                    if JobQueue.add(path, signature):
+                        print(f'Queued {path}')
+                        self._job_available.notify()
+
+            for path in list(self._candidates):
+                if path not in signatures:
+                    del self._candidates[path]
+
+    @staticmethod
+    def _is_release(entry: os.DirEntry) -> bool:
+        """
+        :param entry (os.DirEntry): entry of a watch folder
+        :return bool: True for video files, disc images and folders; hidden entries are skipped
+        """
+        if entry.name.startswith('.'):
+            return False
+        if entry.is_dir():
+            return True
+        return entry.is_file() and entry.name.endswith(VIDEO_FILE_TYPES + ISO_EXTS)
+
+    @staticmethod
+    def _get_signature(entry: os.DirEntry) -> str:
+        """
+        :param entry (os.DirEntry): a release
+        :return str: changes whenever any file of the release is added, removed, grows or is written to
+        """
+        if not entry.is_dir():
+            stat = entry.stat()
+            return f'{stat.st_size}|{stat.st_mtime_ns}'
+
+        n_files = total_size = latest_mtime = 0
+        for root, _, files in os.walk(entry.path):
+            for file in files:
+                try:
+                    stat = os.stat(os.path.join(root, file))
+                except FileNotFoundError:
+                    continue
+                n_files += 1
+                total_size += stat.st_size
+                latest_mtime = max(latest_mtime, stat.st_mtime_ns)
+        return f'{n_files}|{total_size}|{latest_mtime}'
+
+    def _work(self):
+        """
+        Worker loop: processes queued releases one at a time, and writes each result next to its release
+        :return:
+        """
+        while True:
+            with self._lock:
+                job = JobQueue.claim()
+                while job is None:
+                    self._job_available.wait(Settings.advanced['watch_poll_seconds'])
+                    job = JobQueue.claim()
+                self._running_jobs[job[0]] = job[1]
+
+            job_id, input_path = job
+            print(f'Processing {input_path}')
+            try:
+                release_info, formatted_urls, stages = self.process_release(input_path, self.image_host,
+                                                                              f'job{job_id} ')
+                with open(input_path + RESULT_FILE_SUFFIX, 'w', encoding='utf8') as f:
+                    f.write(release_info + formatted_urls)
+                error = None
+            except Exception as e:
+                traceback.print_exc()
+                stages = None
+                error = f'{e.__class__.__name__}: {e}'
+
+            JobQueue.finish(job_id, error)
+            with self._lock:
+                del self._running_jobs[job_id]
+                if stages is not None:
+                    for stage, duration in stages.get_durations().items():
+                        self._stage_durations[stage].append(duration)
+                    self._finish_times.append(time.time())
+            print(f'Finished {input_path}' if error is None else f'Failed {input_path} ({error})')
+            self._write_status()
+
+    def _write_status(self):
+        """
+        Writes the daemon's status to the status file, replacing it atomically so readers never see a partial file
+        :return:
+        """
+        with self._lock:
+            now = time.time()
+            while self._finish_times and now - self._finish_times[0] > 60 * 60:
+                self._finish_times.popleft()
+            status = {
+                'updated_at': now,
+                'uptime_seconds': round(now - self._started_at),
+                'watch_folders': self.watch_folders,
+                'watcher': self._watcher_type,
+                'jobs': JobQueue.get_counts(),
+                'running': list(self._running_jobs.values()),
+                'waiting_to_stabilise': list(self._candidates),
+                'releases_last_hour': len(self._finish_times),
+                'stage_latency_seconds': {
+                    stage: {'last': round(durations[-1], 2),
+                            'mean': round(sum(durations) / len(durations), 2),
+                            'max': round(max(durations), 2)}
+                    for stage, durations in self._stage_durations.items()
+                },
+            }
+
+            temp_path = self.status_file_path + '.tmp'
+            try:
+                with open(temp_path, 'w', encoding='utf8') as f:
+                    json.dump(status, f, indent=4)
+                os.replace(temp_path, self.status_file_path)
+                self._status_error = None
+            except OSError as e:
+                # reported once, not on every poll
+                if str(e) != self._status_error:
+                    print(f'Could not write status file {self.status_file_path} ({e})')
+                self._status_error = str(e)
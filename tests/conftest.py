@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the scripts are plain modules that import one another by name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
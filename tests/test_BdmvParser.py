@@ -0,0 +1,106 @@
+import struct
+
+import pytest
+
+from BdmvParser import BdmvParser, BdmvParseError, BD_CLOCK_RATE
+
+
+def play_item(clip_name: str, in_time: int, out_time: int, stc_id: int = 0, padding: int = 0) -> bytes:
+    """
+    :param padding (int): extra bytes at the end of the item (eg. angle or STN tables), skipped by its length
+    """
+    data = clip_name.encode('ascii') + b'M2TS' + b'\0\0' + bytes([stc_id]) + struct.pack('>II', in_time, out_time)
+    data += b'\0' * padding
+    return struct.pack('>H', len(data)) + data
+
+
+def make_mpls(*play_items: bytes) -> bytes:
+    """
+    :return bytes: an MPLS file whose playlist holds the given play items
+    """
+    playlist_offset = 40
+    items = b''.join(play_items)
+    header = b'MPLS0200' + struct.pack('>III', playlist_offset, 0, 0)
+    playlist = struct.pack('>IHHH', 6 + len(items), 0, len(play_items), 0) + items
+    return header + b'\0' * (playlist_offset - len(header)) + playlist
+
+
+def make_clpi(presentation_start_times: list, offset_stc_id: int = 0) -> bytes:
+    """
+    :param presentation_start_times (list<int>): start time (45 kHz ticks) of each STC sequence of the clip
+    :return bytes: a CLPI file whose sequence info holds one ATC sequence
+    """
+    sequence_info_offset = 40
+    stc_sequences = b''.join(struct.pack('>HIII', 0x1001, 0, start, start + 1000 * BD_CLOCK_RATE)
+                             for start in presentation_start_times)
+    sequence_info = struct.pack('>IBBIBB', 8 + len(stc_sequences), 0, 1, 0, len(presentation_start_times),
+                                offset_stc_id) + stc_sequences
+    header = b'HDMV0200' + struct.pack('>I', sequence_info_offset)
+    return header + b'\0' * (sequence_info_offset - len(header)) + sequence_info
+
+
+def make_parser(files: dict) -> BdmvParser:
+    def read_file(path):
+        try:
+            return files[path]
+        except KeyError:
+            raise FileNotFoundError(path) from None
+
+    playlist_names = [path.split('/')[1] for path in files if path.startswith('PLAYLIST/')]
+    return BdmvParser(playlist_names, read_file)
+
+
+def test_play_items_in_order():
+    parser = make_parser({
+        'PLAYLIST/00001.mpls': make_mpls(play_item('00010', 0, 90 * BD_CLOCK_RATE, padding=20),
+                                         play_item('00011', 0, 30 * BD_CLOCK_RATE)),
+    })
+    playlist = parser.get_main_playlist()
+    assert playlist['playlist_name'] == '00001.mpls'
+    assert playlist['duration'] == 120
+    assert [(clip['clip_name'], clip['duration']) for clip in playlist['clips']] == [('00010', 90), ('00011', 30)]
+
+
+@pytest.mark.parametrize('clpi, stc_id, start', [
+    (make_clpi([10 * BD_CLOCK_RATE]), 0, 5),
+    (make_clpi([10 * BD_CLOCK_RATE, 12 * BD_CLOCK_RATE]), 1, 3),
+    (make_clpi([10 * BD_CLOCK_RATE, 12 * BD_CLOCK_RATE], offset_stc_id=1), 1, 5),
+    # STC sequence the clip does not have; the first is used
+    (make_clpi([10 * BD_CLOCK_RATE]), 3, 5),
+    (b'not a clpi file', 0, 15),
+    (None, 0, 15),
+], ids=['one STC sequence', 'second STC sequence', 'STC id offset', 'unknown STC id', 'invalid CLPI', 'no CLPI'])
+def test_clip_start_subtracts_stc_start(clpi, stc_id, start):
+    files = {'PLAYLIST/00001.mpls': make_mpls(play_item('00010', 15 * BD_CLOCK_RATE, 75 * BD_CLOCK_RATE, stc_id))}
+    if clpi is not None:
+        files['CLIPINF/00010.clpi'] = clpi
+    [clip] = make_parser(files).get_main_playlist()['clips']
+    assert (clip['start'], clip['duration']) == (start, 60)
+
+
+def test_prefers_playlists_without_repeated_clips():
+    parser = make_parser({
+        # longest, but plays the same clip twice
+        'PLAYLIST/00001.mpls': make_mpls(play_item('00010', 0, 60 * BD_CLOCK_RATE),
+                                         play_item('00011', 0, 60 * BD_CLOCK_RATE),
+                                         play_item('00010', 0, 60 * BD_CLOCK_RATE)),
+        'PLAYLIST/00002.mpls': make_mpls(play_item('00012', 0, 100 * BD_CLOCK_RATE)),
+        'PLAYLIST/00003.mpls': make_mpls(play_item('00013', 0, 20 * BD_CLOCK_RATE)),
+        'PLAYLIST/00004.mpls': b'not an mpls file',
+    })
+    assert parser.get_main_playlist()['playlist_name'] == '00002.mpls'
+
+
+def test_repeated_clips_only_when_there_are_no_others():
+    parser = make_parser({
+        'PLAYLIST/00001.mpls': make_mpls(play_item('00010', 0, 60 * BD_CLOCK_RATE),
+                                         play_item('00010', 0, 60 * BD_CLOCK_RATE)),
+        'PLAYLIST/00002.mpls': make_mpls(play_item('00011', 0, 30 * BD_CLOCK_RATE),
+                                         play_item('00011', 0, 30 * BD_CLOCK_RATE)),
+    })
+    assert parser.get_main_playlist()['playlist_name'] == '00001.mpls'
+
+
+def test_no_readable_playlists():
+    with pytest.raises(BdmvParseError):
+        make_parser({'PLAYLIST/00001.mpls': b'not an mpls file'}).get_main_playlist()
@@ -0,0 +1,33 @@
+import pytest
+
+import Helper
+
+# release name -> gallery name from the fast path, or None where it must fall back to guessit
+RELEASE_NAMES = {
+    'Movie.Title.2019.1080p.BluRay.x264-GRP': 'Movie Title (2019) - 1080p',
+    'Blade.Runner.2049.2017.2160p.UHD.BluRay.x265-GRP': 'Blade Runner 2049 (2017) - 2160p',
+    'Alien.3.1992.1080p.BluRay.x264-GRP': 'Alien 3 (1992) - 1080p',
+    '2012.2009.1080p.BluRay.x264-GRP': '2012 (2009) - 1080p',
+    'Movie.Title.2019.Directors.Cut.1080p.BluRay.x264-GRP': 'Movie Title (2019) - 1080p',
+    'The.Movie.(1999).576i.DVD': 'The Movie (1999) - 576i',
+    'Movie_Title_2001_1080p_x264': 'Movie Title (2001) - 1080p',
+    'Show Title S01E02 720p WEB-DL DD5.1 H.264-GRP': 'Show Title - 720p',
+    'Show.Name.S01.1080p.BluRay.x264-GRP': 'Show Name - 1080p',
+    'Show.Name.S01E01E02.720p.HDTV.x264-GRP': 'Show Name - 720p',
+    'Show.2019.S01E02.1080p.WEB.h264-GRP': 'Show (2019) - 1080p',
+    'Show.S01E02.2019.1080p.WEB': None,
+    'Show.Title.S01E02.Pilot.2019.Recap.1080p': None,
+    'Show.Name.1x02.1080p.WEB': None,
+}
+
+
+@pytest.mark.parametrize('release_name, gallery_name', RELEASE_NAMES.items(), ids=list(RELEASE_NAMES))
+def test_parse_release_name(release_name, gallery_name):
+    assert Helper._parse_release_name(release_name) == gallery_name
+
+
+@pytest.mark.parametrize('release_name', RELEASE_NAMES, ids=list(RELEASE_NAMES))
+def test_gallery_name_matches_guessit(release_name):
+    pytest.importorskip('guessit')
+    expected = Helper._guess_gallery_name(release_name)
+    assert (Helper._parse_release_name(release_name) or expected) == expected
@@ -0,0 +1,31 @@
+import struct
+
+import pytest
+
+from IfoParser import IfoParser, IfoParseError, DVD_SECTOR_SIZE
+
+
+def make_truncated_vtsi() -> bytes:
+    """
+    :return bytes: a title set IFO whose part-of-title table claims one title, but ends before its offsets
+    """
+    header = bytearray(0xD0)
+    header[:12] = b'DVDVIDEO-VTS'
+    struct.pack_into('>I', header, 0xC8, 1)  # part-of-title table in sector 1
+    struct.pack_into('>I', header, 0xCC, 1)  # program chain table in sector 1
+    return bytes(header) + b'\0' * (DVD_SECTOR_SIZE - len(header)) + struct.pack('>H', 1)
+
+
+def make_parser(files: dict) -> IfoParser:
+    return IfoParser({name: len(data) for name, data in files.items()}, files.__getitem__)
+
+
+def test_truncated_vts_ifo_raises_parse_error():
+    parser = make_parser({'VTS_01_0.IFO': make_truncated_vtsi(), 'VTS_01_1.VOB': b'\0' * DVD_SECTOR_SIZE})
+    with pytest.raises(IfoParseError):
+        parser.get_main_title()
+
+
+def test_missing_ifo_files_raise_parse_error():
+    with pytest.raises(IfoParseError):
+        make_parser({'VTS_01_1.VOB': b''}).get_main_title()
@@ -0,0 +1,68 @@
+import io
+
+import pytest
+
+import ImageUploader as uploader_module
+from Cache import Cache
+from ImageUploader import ImageUploader, PTPIMG_MAX_UPLOAD_SIZE, PTPIMG_PART_OVERHEAD
+
+MB = 1000 * 1000
+
+
+@pytest.mark.parametrize('sizes, batches', [
+    ([], []),
+    ([1000, 3000, 2000], [[0, 1, 2]]),
+    ([60 * MB, 50 * MB, 40 * MB], [[0], [1, 2]]),
+    ([60 * MB, 10, 60 * MB, 20], [[0, 1, 3], [2]]),
+    # exactly at the limit once each part's overhead is counted, and one byte over it
+    ([PTPIMG_MAX_UPLOAD_SIZE // 2 - PTPIMG_PART_OVERHEAD] * 2, [[0, 1]]),
+    ([PTPIMG_MAX_UPLOAD_SIZE // 2 - PTPIMG_PART_OVERHEAD + 1, PTPIMG_MAX_UPLOAD_SIZE // 2 - PTPIMG_PART_OVERHEAD],
+     [[0], [1]]),
+    ([150 * MB, 10, 20], [[0], [1, 2]]),
+], ids=['empty', 'one batch', 'first fit', 'mixed', 'at limit', 'over limit', 'image over limit'])
+def test_plan_ptpimg_batches(sizes, batches):
+    assert ImageUploader._plan_ptpimg_batches(sizes) == batches
+
+
+def make_images(sizes: list) -> list:
+    images = []
+    for i, size in enumerate(sizes):
+        images.append(io.BytesIO(b'\0' * size))
+        images[-1].name = str(i)
+    return images
+
+
+@pytest.fixture
+def ptpimg_uploader(monkeypatch):
+    """
+    :return tuple<ImageUploader, list<list<str>>>: a ptpimg uploader with a 3000 byte upload limit, and the names of
+            the images in each batch it uploads
+    """
+    monkeypatch.setattr(uploader_module, 'PTPIMG_MAX_UPLOAD_SIZE', 3000)
+    monkeypatch.setattr(Cache, 'enabled', False)
+    uploaded_batches = []
+
+    def upload_batch(batch):
+        uploaded_batches.append([image.name for image in batch])
+        return [f'https://ptpimg.me/{image.name}.png' for image in batch]
+
+    uploader = ImageUploader([], '', {'name': 'ptpimg', 'api_key': ''})
+    monkeypatch.setattr(uploader, '_upload_ptpimg_batch', upload_batch)
+    return uploader, uploaded_batches
+
+
+def test_ptpimg_urls_in_screenshot_order(ptpimg_uploader):
+    uploader, uploaded_batches = ptpimg_uploader
+    images = make_images([1500, 100, 1500, 200])
+    assert uploader._upload_ptpimg(images) == [(f'https://ptpimg.me/{i}.png', None) for i in range(4)]
+    assert sorted(uploaded_batches) == [['0'], ['1', '3'], ['2']]
+
+
+def test_ptpimg_uploads_while_generating_in_batches(ptpimg_uploader):
+    uploader, uploaded_batches = ptpimg_uploader
+    uploader.start()
+    for i, image in enumerate(make_images([500, 100, 1500, 200])):
+        uploader.add_image(i, image)
+    uploader.finish()
+    assert sorted(uploaded_batches) == [['0', '1'], ['2'], ['3']]
+    assert uploader.get_formatted_urls() == ''.join(f'https://ptpimg.me/{i}.png\n' for i in range(4))
@@ -0,0 +1,158 @@
+import os
+import struct
+
+import pytest
+
+from IsoImage import IsoImage, IsoImageError, SECTOR_SIZE, ISO9660_DIRECTORY_FLAG, ISO9660_PVD_SECTOR, \
+    UDF_AD_EMBEDDED, UDF_AD_SHORT, UDF_ANCHOR_SECTOR, UDF_FILE_ENTRY, UDF_FILE_IDENTIFIER_DESCRIPTOR, \
+    UDF_FILE_SET_DESCRIPTOR, UDF_LOGICAL_VOLUME_DESCRIPTOR, UDF_PARTITION_DESCRIPTOR, UDF_TERMINATING_DESCRIPTOR
+
+# logical block 0 of the UDF partition
+PARTITION_START = 300
+
+
+def sector(data: bytes) -> bytes:
+    return data + b'\0' * (SECTOR_SIZE - len(data))
+
+
+def put_sectors(image: bytearray, first_sector: int, data: bytes):
+    end = first_sector * SECTOR_SIZE + len(data)
+    if len(image) < end:
+        image.extend(b'\0' * (end - len(image)))
+    image[first_sector * SECTOR_SIZE:end] = data
+
+
+def udf_descriptor(tag: int, size: int = SECTOR_SIZE) -> bytearray:
+    descriptor = bytearray(size)
+    struct.pack_into('<H', descriptor, 0, tag)
+    return descriptor
+
+
+def udf_file_id(name: str, block: int, characteristics: int = 0) -> bytes:
+    identifier = b'\x08' + name.encode('latin-1') if name else b''
+    fid = udf_descriptor(UDF_FILE_IDENTIFIER_DESCRIPTOR, 38)
+    fid[18], fid[19] = characteristics, len(identifier)
+    struct.pack_into('<I', fid, 24, block)
+    fid = bytes(fid) + identifier
+    return fid + b'\0' * (-len(fid) % 4)
+
+
+def udf_file_entry(size: int, extents: list = None, embedded: bytes = None) -> bytes:
+    """
+    :param extents (list<tuple<int, int>>): (logical block, byte length) of each extent, as short descriptors
+    :param embedded (bytes): file data stored within the entry instead
+    """
+    entry = udf_descriptor(UDF_FILE_ENTRY)
+    struct.pack_into('<Q', entry, 56, size)
+    if embedded is not None:
+        struct.pack_into('<H', entry, 34, UDF_AD_EMBEDDED)
+        descriptors = embedded
+    else:
+        struct.pack_into('<H', entry, 34, UDF_AD_SHORT)
+        descriptors = b''.join(struct.pack('<II', length, block) for block, length in extents)
+    struct.pack_into('<II', entry, 168, 0, len(descriptors))
+    entry[176:176 + len(descriptors)] = descriptors
+    return bytes(entry)
+
+
+def make_udf_image() -> bytes:
+    image = bytearray()
+    anchor = udf_descriptor(2)
+    struct.pack_into('<II', anchor, 16, 3 * SECTOR_SIZE, 32)
+    put_sectors(image, UDF_ANCHOR_SECTOR, anchor)
+
+    partition = udf_descriptor(UDF_PARTITION_DESCRIPTOR)
+    struct.pack_into('<I', partition, 188, PARTITION_START)
+    logical_volume = udf_descriptor(UDF_LOGICAL_VOLUME_DESCRIPTOR)
+    struct.pack_into('<I', logical_volume, 212, SECTOR_SIZE)
+    struct.pack_into('<I', logical_volume, 252, 0)
+    put_sectors(image, 32, partition + logical_volume + udf_descriptor(UDF_TERMINATING_DESCRIPTOR))
+
+    file_set = udf_descriptor(UDF_FILE_SET_DESCRIPTOR)
+    struct.pack_into('<I', file_set, 404, 1)
+    root = udf_file_id('', 1, characteristics=0x08) + udf_file_id('VIDEO_TS', 2, characteristics=0x02)
+    video_ts = (udf_file_id('', 1, characteristics=0x08) + udf_file_id('VIDEO_TS.IFO', 3) +
+                udf_file_id('VTS_01_1.VOB', 4) + udf_file_id('VTS_01_2.VOB', 5) +
+                udf_file_id('OLD.VOB', 6, characteristics=0x04))
+    blocks = [
+        file_set,
+        udf_file_entry(len(root), embedded=root),
+        udf_file_entry(len(video_ts), embedded=video_ts),
+        udf_file_entry(100, [(10, 100)]),
+        # two contiguous extents
+        udf_file_entry(3000, [(20, SECTOR_SIZE), (21, 3000 - SECTOR_SIZE)]),
+        # two extents with a gap between them
+        udf_file_entry(4096, [(30, SECTOR_SIZE), (40, SECTOR_SIZE)]),
+    ]
+    put_sectors(image, PARTITION_START, b''.join(sector(block) for block in blocks))
+    put_sectors(image, PARTITION_START + 10, sector(b'IFO' * 40))
+    put_sectors(image, PARTITION_START + 41, sector(b''))
+    return bytes(image)
+
+
+def iso9660_record(name: bytes, extent_sector: int, length: int, flags: int = 0) -> bytes:
+    record = bytearray(33 + len(name) + (len(name) + 1) % 2)
+    record[0] = len(record)
+    struct.pack_into('<I4xI', record, 2, extent_sector, length)
+    record[25], record[32] = flags, len(name)
+    record[33:33 + len(name)] = name
+    return bytes(record)
+
+
+def make_iso9660_image() -> bytes:
+    image = bytearray()
+    descriptor = bytearray(sector(b'\x01CD001\x01'))
+    struct.pack_into('<I4xI', descriptor, 156 + 2, 18, SECTOR_SIZE)
+    put_sectors(image, ISO9660_PVD_SECTOR, descriptor)
+    put_sectors(image, 18, sector(iso9660_record(b'\x00', 18, SECTOR_SIZE, ISO9660_DIRECTORY_FLAG) +
+                                  iso9660_record(b'\x01', 18, SECTOR_SIZE, ISO9660_DIRECTORY_FLAG) +
+                                  iso9660_record(b'VIDEO_TS', 19, SECTOR_SIZE, ISO9660_DIRECTORY_FLAG)))
+    put_sectors(image, 19, sector(iso9660_record(b'\x00', 19, SECTOR_SIZE, ISO9660_DIRECTORY_FLAG) +
+                                  iso9660_record(b'\x01', 18, SECTOR_SIZE, ISO9660_DIRECTORY_FLAG) +
+                                  iso9660_record(b'VIDEO_TS.IFO;1', 20, 100) +
+                                  iso9660_record(b'VTS_01_1.VOB;1', 21, 3000)))
+    put_sectors(image, 20, sector(b'IFO' * 40) + sector(b'') + sector(b''))
+    return bytes(image)
+
+
+@pytest.fixture(params=['udf', 'iso9660'])
+def image(request, tmp_path):
+    iso_file = tmp_path / 'disc.iso'
+    iso_file.write_bytes(make_udf_image() if request.param == 'udf' else make_iso9660_image())
+    return IsoImage(str(iso_file)), request.param
+
+
+def test_locates_files(image):
+    image, file_system = image
+    ifo_sector, vob_sector = (PARTITION_START + 10, PARTITION_START + 20) if file_system == 'udf' else (20, 21)
+    assert image.is_dir('VIDEO_TS')
+    assert not image.is_dir('AUDIO_TS')
+    assert image.list_dir('video_ts') == {'VIDEO_TS.IFO': 100, 'VTS_01_1.VOB': 3000,
+                                          **({'VTS_01_2.VOB': 4096} if file_system == 'udf' else {})}
+    assert image.get_extent('VIDEO_TS/VIDEO_TS.IFO') == (ifo_sector * SECTOR_SIZE, 100)
+    assert image.get_extent('/VIDEO_TS/vts_01_1.vob') == (vob_sector * SECTOR_SIZE, 3000)
+    assert image.read_file('VIDEO_TS/VIDEO_TS.IFO') == (b'IFO' * 40)[:100]
+
+
+def test_fragmented_and_missing_files(tmp_path):
+    iso_file = tmp_path / 'disc.iso'
+    iso_file.write_bytes(make_udf_image())
+    image = IsoImage(str(iso_file))
+    with pytest.raises(IsoImageError):
+        image.get_extent('VIDEO_TS/VTS_01_2.VOB')
+    with pytest.raises(IsoImageError):
+        image.get_extent('VIDEO_TS/OLD.VOB')
+
+
+def test_split_path(tmp_path):
+    iso_file = tmp_path / 'disc.iso'
+    iso_file.write_bytes(make_iso9660_image())
+    (tmp_path / 'video.mkv').write_bytes(b'')
+    vob_path = os.path.join(str(iso_file), 'VIDEO_TS', 'VTS_01_1.VOB')
+
+    assert IsoImage.split_path(vob_path) == (str(iso_file), 'VIDEO_TS/VTS_01_1.VOB')
+    assert IsoImage.split_path(str(iso_file)) is None
+    assert IsoImage.split_path(str(tmp_path / 'video.mkv')) is None
+    assert IsoImage.split_path(str(tmp_path / 'missing.iso' / 'VIDEO_TS' / 'VTS_01_1.VOB')) is None
+    vob_offset = 21 * SECTOR_SIZE
+    assert IsoImage.get_ffmpeg_input(vob_path) == f'subfile,,start,{vob_offset},end,{vob_offset + 3000},,:{iso_file}'
@@ -0,0 +1,57 @@
+import struct
+
+import pytest
+
+import KeyframeIndex
+from Cache import Cache
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(Cache, 'enabled', False)
+
+
+def ebml(element_id: int, *children: bytes) -> bytes:
+    """
+    :return bytes: a Matroska element, with an 8-byte size
+    """
+    data = b''.join(children)
+    id_bytes = element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big')
+    return id_bytes + (0x01 << 56 | len(data)).to_bytes(8, 'big') + data
+
+
+def uint(element_id: int, value: int) -> bytes:
+    return ebml(element_id, value.to_bytes(4, 'big'))
+
+
+def make_mkv(cue_point: bytes) -> bytes:
+    return ebml(KeyframeIndex.EBML_ID) + ebml(KeyframeIndex.SEGMENT_ID, ebml(KeyframeIndex.CUES_ID, cue_point))
+
+
+def box(box_type: bytes, *children: bytes) -> bytes:
+    data = b''.join(children)
+    return struct.pack('>I4s', 8 + len(data), box_type) + data
+
+
+def test_matroska_cues(tmp_path):
+    video_file = tmp_path / 'video.mkv'
+    video_file.write_bytes(make_mkv(ebml(KeyframeIndex.CUE_POINT_ID, uint(KeyframeIndex.CUE_TIME_ID, 1500))))
+    assert KeyframeIndex.get_keyframes(str(video_file)) == [1.5]
+
+
+@pytest.mark.parametrize('file_name, data', [
+    # cue point without a CueTime
+    ('video.mkv', make_mkv(ebml(KeyframeIndex.CUE_POINT_ID,
+                                ebml(KeyframeIndex.CUE_TRACK_POSITIONS_ID, uint(KeyframeIndex.CUE_TRACK_ID, 1))))),
+    # seek entry without a SeekPosition
+    ('video.mkv', ebml(KeyframeIndex.EBML_ID) + ebml(KeyframeIndex.SEGMENT_ID, ebml(
+        KeyframeIndex.SEEK_HEAD_ID, ebml(KeyframeIndex.SEEK_ID, uint(KeyframeIndex.SEEK_ID_ID, KeyframeIndex.CUES_ID))))),
+    # video track without an mdhd box
+    ('video.mp4', box(b'moov', box(b'trak', box(b'mdia', box(b'hdlr', b'\0' * 8 + b'vide'))))),
+    # truncated file
+    ('video.mkv', make_mkv(b'')[:6]),
+], ids=['no CueTime', 'no SeekPosition', 'no mdhd', 'truncated'])
+def test_malformed_index_gives_no_keyframes(tmp_path, file_name, data):
+    video_file = tmp_path / file_name
+    video_file.write_bytes(data)
+    assert KeyframeIndex.get_keyframes(str(video_file)) == []
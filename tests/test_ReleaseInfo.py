@@ -0,0 +1,41 @@
+import re
+
+import pytest
+
+from ReleaseInfo import ReleaseInfo, EPISODE_RE
+
+# file name -> whether it is numbered as an episode
+FILE_NAMES = {
+    'Show.S01E02.720p.WEB.mkv': True,
+    'Show S01E02 720p.mkv': True,
+    'Show_S01E02_720p.mkv': True,
+    'Show_s01_e02.mkv': True,
+    'Show-S01E02E03-GRP.mkv': True,
+    'S01E02.mkv': True,
+    'Show.1x02.mkv': True,
+    'Show_1x02.mkv': True,
+    'Show_12x102_Title.mkv': True,
+    'Show.S2019E02.mkv': False,
+    'ShowS01E02.mkv': False,
+    'Movie.2019.1920x1080.mkv': False,
+    'Movie_2019_x264.mkv': False,
+    'Movie.1x02x.mkv': False,
+}
+
+
+@pytest.mark.parametrize('file_name, is_episode', FILE_NAMES.items(), ids=list(FILE_NAMES))
+def test_episode_numbering(file_name, is_episode):
+    assert bool(re.search(EPISODE_RE, file_name)) == is_episode
+
+
+def test_underscore_named_season_pack(tmp_path):
+    for episode in (1, 2, 10):
+        (tmp_path / f'Show_S01E{episode:02}_720p.mkv').write_bytes(b'\0' * episode)
+    (tmp_path / 'Sample').mkdir()
+    (tmp_path / 'Sample' / 'Show_S01E01_720p.sample.mkv').write_bytes(b'')
+    (tmp_path / 'Show_S01E02_sample.mkv').write_bytes(b'')
+
+    rls = ReleaseInfo(str(tmp_path))
+    assert rls.find_relevant_files() == [str(tmp_path / 'Show_S01E01_720p.mkv')]
+    assert rls.release_type == 'season'
+    assert rls.episode_files == [str(tmp_path / f'Show_S01E{episode:02}_720p.mkv') for episode in (1, 2, 10)]